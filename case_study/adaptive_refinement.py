@@ -0,0 +1,300 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# General imports
+import os.path
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+import dolfin as dlfn
+
+from case_study import (
+    GEO_FILE,
+    Mesh,
+    Solver,
+    Material,
+    NCC_BOUNDARIES,
+    NEUMANN_BOUNDARIES,
+    DIRICHLET_BOUNDARIES,
+    FLOOR_SURFACE,
+    LINEAR_SOLVER,
+    DEFAULT_LINEAR_SOLVER,
+    create_function_space,
+    use_form_cache,
+)
+
+# Error indicators of compute_error_indicators
+#   - residual: energy norm of the error, refines wherever the flux is not balanced
+#   - floor_heat_flux: residuals weighted with the solution of the dual problem of the heat flow through FLOOR_SURFACE,
+#     refines only where the error affects this quantity
+INDICATORS = ("residual", "floor_heat_flux")
+
+
+def compute_residual_indicators(solver: Solver):
+    """
+    Cellwise residual error indicators eta_K^2 of the current solution 'w' of a solver (see 'setup_linear_system'):
+        eta_K^2 = h_K^2 |div(k grad T)|_K^2 + 1/2 sum_F h_F |[k grad T . n]|_F^2 + sum_F h_F |r_F|_F^2
+    The jumps of the flux across the interior facets include the material interfaces, r_F is the residual of the
+    boundary condition of a Newton Cooling Condition or Neumann facet. The periodic facets have no contribution.
+    :return: Local vector of a DG0 Function
+    """
+    assert solver.ncc_constants is not None, "Call 'setup_linear_system' first"
+    mesh = solver.mesh
+    w = dlfn.TestFunction(solver.conductivity.function_space())
+    h = dlfn.CellDiameter(mesh.mesh)
+    flux = solver.conductivity * dlfn.grad(solver.w)
+    dS = dlfn.Measure("dS", domain=mesh.mesh)
+
+    form = h**2 * dlfn.div(flux) ** 2 * w * mesh.dV
+    form += dlfn.avg(h) * dlfn.jump(flux, mesh.n) ** 2 * dlfn.avg(w) * dS
+    for boundary, value in solver.ncc_constants.items():
+        residual = dlfn.dot(flux, mesh.n) + value.heat_transfer_coefficient * (solver.w - value.external_temperature)
+        form += h * residual**2 * w * mesh.dA(subdomain_id=mesh.facet_marker_map[boundary])
+    for boundary, value in solver.neumann_constants.items():
+        residual = dlfn.dot(flux, mesh.n) + value.delta_q
+        form += h * residual**2 * w * mesh.dA(subdomain_id=mesh.facet_marker_map[boundary])
+    return dlfn.assemble(form).get_local()
+
+
+def solve_dual_problem(solver: Solver, facet_name: str = FLOOR_SURFACE):
+    """
+    Solve the dual problem of the heat flow through a facet with the linear solver of the primal problem, the system
+    matrix is symmetric. The right hand side is the row of the heat flow operator of the post-processor, hence the dual
+    solution is the sensitivity of exactly the heat flow which is reported.
+    :return: The dual solution z
+    """
+    post_processor = solver.get_post_processor()
+    dual_rhs = solver.rhs_vector.copy()
+    dual_rhs.set_local(post_processor.heat_flow_operator[post_processor.facet_names.index(facet_name)])
+    dual_rhs.apply("insert")
+    for bc in solver.dirichlet_bcs:
+        homogeneous_bc = dlfn.DirichletBC(bc)
+        homogeneous_bc.homogenize()
+        homogeneous_bc.apply(dual_rhs)
+    dual_solution = dlfn.Function(solver.function_space)
+    solver.linear_solver.solve(dual_solution.vector(), dual_rhs)
+    return dual_solution
+
+
+def compute_error_indicators(solver: Solver, indicator: str = "floor_heat_flux"):
+    """
+    :param solver: A solver with a solution of its linear system
+    :param indicator: One of INDICATORS
+    :return: Non-negative cellwise error indicators in the order of the cells of the mesh
+    """
+    if indicator not in INDICATORS:
+        raise ValueError("Unknown error indicator: " + indicator)
+    eta_squared = compute_residual_indicators(solver)
+    if indicator == "floor_heat_flux":
+        # Dual weighted residuals: eta_K = rho_K * omega_K with the residuals rho_K = eta_K / h_K and the weights
+        # omega_K = |z - I_h z|_K, where I_h is the interpolation of the dual solution z into P1
+        mesh = solver.mesh.mesh
+        w = dlfn.TestFunction(solver.conductivity.function_space())
+        dual_solution = solve_dual_problem(solver)
+        dual_interpolant = dlfn.interpolate(dual_solution, dlfn.FunctionSpace(mesh, "CG", 1))
+        omega_squared = dlfn.assemble((dual_solution - dual_interpolant) ** 2 * w * dlfn.dx(mesh)).get_local()
+        cell_sizes = (
+            dlfn.assemble(dlfn.CellDiameter(mesh) * w * dlfn.dx(mesh)).get_local()
+            / dlfn.assemble(w * dlfn.dx(mesh)).get_local()
+        )
+        indicators = np.sqrt(eta_squared * omega_squared) / cell_sizes
+    else:
+        indicators = np.sqrt(eta_squared)
+    # DG0 dof order -> cell order
+    return indicators[solver.conductivity_dofs]
+
+
+def mark_cells(indicators: np.ndarray, fraction: float = 0.5):
+    """
+    Doerfler marking: the smallest set of cells whose squared indicators add up to the given fraction of the total
+    :return: Boolean array over the cells
+    """
+    assert 0.0 < fraction <= 1.0
+    order = np.argsort(indicators**2)[::-1]
+    cumulative = np.cumsum(indicators[order] ** 2)
+    n_marked = int(np.searchsorted(cumulative, fraction * cumulative[-1])) + 1
+    markers = np.zeros(indicators.shape, dtype=bool)
+    markers[order[:n_marked]] = True
+    return markers
+
+
+def get_edge_topology(mesh: dlfn.Mesh):
+    """
+    :return: Tuple of the (n_cells, 3) array of the edges of the cells and the (n_edges, 2) array of the vertices of
+        the edges
+    """
+    mesh.init(1)
+    mesh.init(mesh.topology().dim(), 1)
+    cell_edges = np.array([cell.entities(1) for cell in dlfn.cells(mesh)], dtype=int)
+    edge_vertices = np.array([edge.entities(0) for edge in dlfn.edges(mesh)], dtype=int)
+    return cell_edges, edge_vertices
+
+
+def get_periodic_edge_pairs(mesh: dlfn.Mesh, cell_edges: np.ndarray, edge_vertices: np.ndarray):
+    """
+    Match the boundary edges of the left (x = x_min) and right (x = x_max) side of the mesh, which are identified by
+    the periodic constraint of the function space
+    :return: Tuple of the left and the right edges, the i-th entries of both arrays are a pair
+    """
+    coordinates = mesh.coordinates()
+    x_min, x_max = coordinates[:, 0].min(), coordinates[:, 0].max()
+    tolerance = 1e-8 * (x_max - x_min)
+    boundary_edges = np.flatnonzero(np.bincount(cell_edges.ravel(), minlength=len(edge_vertices)) == 1)
+    edge_coordinates = coordinates[edge_vertices[boundary_edges]]
+
+    def side(x):
+        edges = boundary_edges[np.all(np.abs(edge_coordinates[:, :, 0] - x) < tolerance, axis=1)]
+        midpoints = coordinates[edge_vertices[edges], 1].mean(axis=1)
+        return edges[np.argsort(midpoints)], np.sort(midpoints)
+
+    left_edges, left_midpoints = side(x_min)
+    right_edges, right_midpoints = side(x_max)
+    if len(left_edges) != len(right_edges) or not np.allclose(left_midpoints, right_midpoints, atol=tolerance):
+        raise ValueError("The edges of the periodic boundaries do not match")
+    return left_edges, right_edges
+
+
+def get_refinement_edges(mesh: dlfn.Mesh, cell_markers: np.ndarray):
+    """
+    Mark the edges to be bisected for the refinement of the marked cells. The closure of the refinement algorithm
+    (every cell with a bisected edge also bisects its longest edge) is computed in advance such that the periodic
+    partner of every bisected boundary edge is bisected as well, otherwise the periodic constraint would be lost.
+    :return: Boolean array over the edges
+    """
+    cell_edges, edge_vertices = get_edge_topology(mesh)
+    left_edges, right_edges = get_periodic_edge_pairs(mesh, cell_edges, edge_vertices)
+    coordinates = mesh.coordinates()
+    edge_lengths = np.linalg.norm(coordinates[edge_vertices[:, 0]] - coordinates[edge_vertices[:, 1]], axis=1)
+    longest_edges = cell_edges[np.arange(len(cell_edges)), np.argmax(edge_lengths[cell_edges], axis=1)]
+
+    edge_markers = np.zeros(len(edge_vertices), dtype=bool)
+    edge_markers[cell_edges[cell_markers]] = True
+    while True:
+        new_markers = edge_markers.copy()
+        new_markers[longest_edges[new_markers[cell_edges].any(axis=1)]] = True
+        periodic_markers = new_markers[left_edges] | new_markers[right_edges]
+        new_markers[left_edges] = periodic_markers
+        new_markers[right_edges] = periodic_markers
+        if np.array_equal(new_markers, edge_markers):
+            return edge_markers
+        edge_markers = new_markers
+
+
+def refine_mesh(mesh: Mesh, cell_markers: np.ndarray):
+    """
+    Refine the marked cells, the cell markers and the facet markers are transferred to the refined mesh
+    :param mesh: An instance of the Mesh class
+    :param cell_markers: Boolean array over the cells
+    :return: The refined instance of the Mesh class
+    """
+    if mesh.space_dim != 2:
+        raise ValueError("The adaptive refinement is implemented for two-dimensional meshes")
+    edge_markers = dlfn.MeshFunction("bool", mesh.mesh, 1, False)
+    edge_markers.array()[:] = get_refinement_edges(mesh.mesh, cell_markers)
+    # The parent facets are required to transfer the facet markers, the process-wide setting is restored afterwards
+    refinement_algorithm = dlfn.parameters["refinement_algorithm"]
+    dlfn.parameters["refinement_algorithm"] = "plaza_with_parent_facets"
+    try:
+        refined_mesh = dlfn.refine(mesh.mesh, edge_markers)
+        refined_facet_markers = dlfn.adapt(mesh.facet_markers, refined_mesh)
+        refined_cell_markers = dlfn.adapt(mesh.cell_markers, refined_mesh)
+    finally:
+        dlfn.parameters["refinement_algorithm"] = refinement_algorithm
+    refined = Mesh(
+        mesh_data=(
+            refined_mesh,
+            refined_facet_markers,
+            mesh.facet_marker_map,
+            refined_cell_markers,
+            mesh.cell_markers_map,
+        )
+    )
+    # Check that the periodic constraint remains valid
+    get_periodic_edge_pairs(refined_mesh, *get_edge_topology(refined_mesh))
+    return refined
+
+
+def solve_adaptive(
+    geo_file: str = GEO_FILE,
+    indicator: str = "floor_heat_flux",
+    fraction: float = 0.5,
+    max_iterations: int = 10,
+    max_dofs: int = 1000000,
+    tolerance: float = 0.0,
+    subdomains: Optional[Dict[str, Material]] = None,
+    linear_solver: LINEAR_SOLVER = DEFAULT_LINEAR_SOLVER,
+):
+    """
+    Adaptive loop solve -> estimate -> mark -> refine starting from the mesh of a geo file
+    :param geo_file: The initial mesh, usually the coarse one
+    :param indicator: One of INDICATORS
+    :param fraction: The fraction of the estimated error which is marked for refinement
+    :param max_iterations: Maximum number of solves
+    :param max_dofs: No further refinement once the number of dofs is exceeded
+    :param tolerance: No further refinement once the estimated error is below, the estimate is the sum of the indicators
+        for 'floor_heat_flux' and the l2 norm of the indicators for 'residual'
+    :param subdomains: The material assignment, see Solver
+    :param linear_solver: The configuration of the linear solver, see LINEAR_SOLVER
+    :return: Tuple of the solver of the final mesh and a list of dicts describing every iteration
+    """
+    mesh = Mesh(geo_file)
+    history: List[Dict] = list()
+    for iteration in range(max_iterations):
+        function_space = create_function_space(mesh)
+        solver = Solver(mesh, function_space, DIRICHLET_BOUNDARIES, subdomains=subdomains, linear_solver=linear_solver)
+        solver.setup_linear_system(NCC_BOUNDARIES, NEUMANN_BOUNDARIES)
+        solver.solve_rhs()
+
+        indicators = compute_error_indicators(solver, indicator)
+        estimate = indicators.sum() if indicator == "floor_heat_flux" else np.sqrt(np.sum(indicators**2))
+        history.append(
+            {
+                "iteration": iteration,
+                "n_cells": mesh.mesh.num_cells(),
+                "n_dofs": function_space.dim(),
+                "floor_heat_flux": solver.compute_heat_flows()[FLOOR_SURFACE],
+                "estimate": estimate,
+            }
+        )
+        print(
+            "ITERATION {iteration:2d}: {n_cells:>8} CELLS, {n_dofs:>8} DOFS, FLOOR HEAT FLUX {floor_heat_flux:.6e}, "
+            "ESTIMATE {estimate:.3e}".format(**history[-1])
+        )
+        if estimate <= tolerance or function_space.dim() >= max_dofs or iteration == max_iterations - 1:
+            break
+        mesh = refine_mesh(mesh, mark_cells(indicators, fraction))
+    return solver, history
+
+
+def main(args):
+    """
+    Usage: python3 adaptive_refinement.py [GEO_FILE] [REFERENCE_GEO_FILE]
+    Compare the floor heat flux of the adaptive loop with a solution on a uniformly refined reference mesh
+    """
+    use_form_cache()
+    geo_file = args[1] if len(args) > 1 else GEO_FILE
+    reference_file = args[2] if len(args) > 2 else os.path.join("meshes", "fine-7", os.path.basename(geo_file))
+    _, history = solve_adaptive(geo_file)
+
+    if os.path.exists(reference_file):
+        reference_mesh = Mesh(reference_file)
+        function_space = create_function_space(reference_mesh)
+        reference = Solver(reference_mesh, function_space, DIRICHLET_BOUNDARIES)
+        reference.setup_linear_system(NCC_BOUNDARIES, NEUMANN_BOUNDARIES)
+        reference.solve_rhs()
+        reference_flux = reference.compute_heat_flows()[FLOOR_SURFACE]
+        print("REFERENCE {0:>8} DOFS, FLOOR HEAT FLUX {1:.6e}".format(function_space.dim(), reference_flux))
+        for result in history:
+            print(
+                "ITERATION {0:2d}: RELATIVE DIFFERENCE {1:.3e} WITH {2:.1%} OF THE DOFS".format(
+                    result["iteration"],
+                    abs(result["floor_heat_flux"] - reference_flux) / abs(reference_flux),
+                    result["n_dofs"] / function_space.dim(),
+                )
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,202 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# General imports
+import json
+import multiprocessing
+import os.path
+import platform
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import dolfin as dlfn
+
+from case_study import (
+    Mesh,
+    Solver,
+    NCC_BOUNDARIES,
+    NEUMANN_BOUNDARIES,
+    DIRICHLET_BOUNDARIES,
+    MESH_REFINEMENTS,
+    DEFAULT_LINEAR_SOLVER,
+    create_function_space,
+    use_form_cache,
+)
+from parameter_sweep import GEOMETRIES
+from utils.result_writer import ResultWriter
+
+# The phases of the pipeline in the order of execution
+PHASES = ["mesh_load", "function_space", "form_compilation", "assembly", "solve", "post_processing", "writing"]
+
+# Phases faster than this (in s) are not checked for regressions, their timings are dominated by noise
+MINIMUM_PHASE_TIME = 0.05
+
+
+def get_peak_rss():
+    """
+    :return: The peak resident set size of this process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kB, macOS reports bytes
+    return peak / 1024.0 ** 2 if sys.platform == "darwin" else peak / 1024.0
+
+
+def benchmark_level(task):
+    """
+    Run the pipeline of solve_routine for one geometry and refinement level and time every phase separately. The phases
+    are executed one after another with the building blocks used by solve_routine.
+    :param task: Tuple of the geometry key, the refinement and the mesh directory
+    :return: Dict of the results
+    """
+    geometry, refinement, mesh_dir = task
+    dlfn.set_log_level(50)
+    geo_file = os.path.join(mesh_dir, refinement, GEOMETRIES[geometry])
+    phases = dict()
+
+    def timed(phase, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        phases[phase] = time.perf_counter() - start
+        return result
+
+    mesh = timed("mesh_load", Mesh, geo_file)
+    function_space = timed("function_space", create_function_space, mesh)
+    solver = Solver(mesh, function_space, DIRICHLET_BOUNDARIES)
+
+    def compile_forms():
+        lhs, rhs = solver.create_boundary_constants(NCC_BOUNDARIES, NEUMANN_BOUNDARIES)
+        return dlfn.Form(lhs), dlfn.Form(rhs)
+
+    timed("form_compilation", compile_forms)
+    timed("assembly", solver.setup_linear_system, NCC_BOUNDARIES, NEUMANN_BOUNDARIES)
+    timed("solve", solver.solve_rhs)
+    result = timed("post_processing", solver.get_post_processor().compute, solver.w)
+
+    def write():
+        with tempfile.TemporaryDirectory() as directory:
+            with ResultWriter(os.path.join(directory, "results.xdmf"), mesh.mesh) as writer:
+                for field in (solver.w, result.gradient, result.heat_flux):
+                    writer.write(field)
+
+    timed("writing", write)
+
+    statistics = solver.linear_solver_statistics[-1]
+    return {
+        "geometry": geometry,
+        "refinement": refinement,
+        "n_cells": mesh.mesh.num_cells(),
+        "n_dofs": function_space.dim(),
+        "hmax": mesh.mesh.hmax(),
+        "phases": phases,
+        "total": sum(phases.values()),
+        "peak_rss_mb": get_peak_rss(),
+        "linear_solver": statistics["method"],
+        "iterations": statistics["iterations"],
+    }
+
+
+def run_benchmark(
+    geometries: Optional[List[str]] = None,
+    refinements: Optional[List[str]] = None,
+    results_file="benchmark.json",
+    mesh_dir="meshes",
+):
+    """
+    Benchmark all combinations of geometries and refinement levels. Every level runs in a fresh, spawned worker process
+    such that the peak RSS is measured per level and no level profits from the caches of another one, except for the
+    disk caches of the form compiler and the mesh loader. A forked worker would start with the peak RSS of this process,
+    which has already imported dolfin.
+    :param geometries: Keys of GEOMETRIES, defaults to all
+    :param refinements: Refinement levels, defaults to MESH_REFINEMENTS
+    :param results_file: The json file the results are written to
+    :param mesh_dir:
+    :return: Dict of the metadata and the results
+    """
+    geometries = list(GEOMETRIES.keys()) if geometries is None else geometries
+    refinements = MESH_REFINEMENTS if refinements is None else refinements
+    tasks = [(geometry, refinement, mesh_dir) for geometry in geometries for refinement in refinements]
+
+    results = list()
+    with multiprocessing.get_context("spawn").Pool(processes=1, maxtasksperchild=1) as pool:
+        for result in pool.imap(benchmark_level, tasks):
+            print(
+                "{0:>4} {1:>14}: {2:>9} DOFS, {3:8.2f} s, {4:8.1f} MB".format(
+                    result["geometry"], result["refinement"], result["n_dofs"], result["total"], result["peak_rss_mb"]
+                )
+            )
+            results.append(result)
+
+    benchmark = {
+        "metadata": {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "dolfin": dlfn.__version__,
+            "linear_solver": DEFAULT_LINEAR_SOLVER._asdict(),
+        },
+        "results": results,
+    }
+    with open(results_file, "w") as file:
+        json.dump(benchmark, file, indent=2)
+    return benchmark
+
+
+def compare_to_baseline(benchmark: Dict, baseline: Dict, threshold: float = 0.1):
+    """
+    Compare the phase timings and the peak RSS of all levels which are part of both benchmarks
+    :param benchmark: The current results, see run_benchmark
+    :param baseline: The stored results of an earlier run
+    :param threshold: Relative increase which counts as a regression
+    :return: List of the regressions as strings
+    """
+    baseline_results = {(r["geometry"], r["refinement"]): r for r in baseline["results"]}
+    regressions = list()
+    print("{0:>4} {1:>14} {2:>16} {3:>10} {4:>10} {5:>8}".format("", "", "", "baseline", "current", "ratio"))
+    for result in benchmark["results"]:
+        reference = baseline_results.get((result["geometry"], result["refinement"]))
+        if reference is None:
+            continue
+        quantities = [(phase, reference["phases"].get(phase), result["phases"][phase]) for phase in PHASES]
+        quantities += [("total", reference["total"], result["total"])]
+        quantities += [("peak_rss_mb", reference["peak_rss_mb"], result["peak_rss_mb"])]
+        for name, old, new in quantities:
+            if old is None or (name != "peak_rss_mb" and max(old, new) < MINIMUM_PHASE_TIME):
+                continue
+            ratio = new / old if old > 0.0 else float("inf")
+            flag = ""
+            if ratio > 1.0 + threshold:
+                flag = "REGRESSION"
+                regressions.append(
+                    "{0} {1} {2}: {3:.3g} -> {4:.3g}".format(result["geometry"], result["refinement"], name, old, new)
+                )
+            print(
+                "{0:>4} {1:>14} {2:>16} {3:10.3g} {4:10.3g} {5:8.2f} {6}".format(
+                    result["geometry"], result["refinement"], name, old, new, ratio, flag
+                )
+            )
+    return regressions
+
+
+def main(args):
+    """
+    Usage: python3 benchmark.py [RESULTS_FILE] [BASELINE_FILE] [THRESHOLD]
+    """
+    use_form_cache()
+    results_file = args[1] if len(args) > 1 else "benchmark.json"
+    benchmark = run_benchmark(results_file=results_file)
+    if len(args) > 2:
+        with open(args[2], "r") as file:
+            baseline = json.load(file)
+        threshold = float(args[3]) if len(args) > 3 else 0.1
+        regressions = compare_to_baseline(benchmark, baseline, threshold)
+        if regressions:
+            print("{0} REGRESSIONS ABOVE {1:.0%}".format(len(regressions), threshold))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -2,24 +2,44 @@
 # -*- coding: utf-8 -*-
 
 # General imports
+import json
 import os.path
 import sys
 from typing import Dict, Optional, List
 import numpy as np
 import dolfin as dlfn
 from collections import namedtuple
-import matplotlib.pyplot as plt
 
 
 dlfn.set_log_level(50)
 
-# Insert project root level to path in order to be able to load the modules. Might want to do a refactoring later
-sys.path.insert(0, "..")
+# Insert project root level to path in order to be able to load the modules independent of the working directory.
+# Might want to do a refactoring later
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
 from utils import generate_grid, boundary_conditions, convergence_test
+from utils.parallel import global_max, global_min, global_sum, root_print
+from utils.result_writer import ResultWriter
+
+# The path of the external library is added by utils.generate_grid
+from form_cache import set_form_cache_dir
+from instrumentation import instrumentation
 
 GEO_FILE = "meshes/coarse/FussbodenheizungSegmentNass.geo"
 
+# The compiled forms are kept inside of the project, fill the cache with 'python3 warm_up.py'. A directory given by
+# the environment variable DIJITSO_CACHE_DIR takes precedence.
+FORM_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "form_cache")
+
+
+def use_form_cache():
+    """
+    Compile the forms into the form cache of the project. Importing this module leaves the process unchanged, the
+    scripts call this in their main function before the first form is compiled such that all workers inherit it.
+    :return: The directory of the compiled forms
+    """
+    return set_form_cache_dir(FORM_CACHE_DIR)
+
 
 THERMAL_CONDUCTIVITIES = {
     "copper": dlfn.Constant(384.0),
@@ -40,10 +60,28 @@ THERMAL_CONDUCTIVITIES = {
 }
 
 
+# Material table with the thermal conductivities used by the Solver, values in here override THERMAL_CONDUCTIVITIES
+MATERIAL_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "thermal_conductivities.json")
+
+
+def load_material_table(filename=MATERIAL_TABLE_FILE):
+    """
+    Load the thermal conductivities of all materials. Materials missing in the file keep the value of
+    THERMAL_CONDUCTIVITIES.
+    :param filename: json file containing a mapping {"<MATERIAL_NAME>": <THERMAL_CONDUCTIVITY>, ...}
+    :return: Dict[MATERIAL_NAME <-> THERMAL_CONDUCTIVITY]
+    """
+    material_table = {name: float(value) for name, value in THERMAL_CONDUCTIVITIES.items()}
+    if filename is not None and os.path.exists(filename):
+        with open(filename, "r") as file:
+            material_table.update({name: float(value) for name, value in json.load(file).items()})
+    return material_table
+
+
 class Material:
     def __init__(self, material_name):
+        # The thermal conductivity is looked up in the material table of the Solver
         self.material = material_name
-        self.thermal_conductivity = THERMAL_CONDUCTIVITIES[material_name]
 
 
 SUBDOMAINS = {
@@ -73,6 +111,18 @@ def tx(x):
     return dlfn.Constant(x)
 
 
+def as_constant(x):
+    """
+    Wrap a value into a dolfin.Constant unless it already is one. Passing Constants into the forms allows to modify the
+    boundary values afterwards without rebuilding the form.
+    :param x: float or dolfin.Constant
+    :return: dolfin.Constant
+    """
+    if isinstance(x, dlfn.Constant):
+        return x
+    return tx(x)
+
+
 # Define a mapping for the Dirichlet Boundaries: {"<BOUNDARY_NAME>": tx(<BOUNDARY_TEMPERATURE>), ...}
 DIRICHLET_BOUNDARIES = {}  # We currently define no dirichlet boundaries
 
@@ -90,6 +140,38 @@ NCC_BOUNDARIES = {
 NEUMANN_BOUNDARY = namedtuple("NEUMANN_boundary", ["delta_q"])
 NEUMANN_BOUNDARIES = {"Underfloor": NEUMANN_BOUNDARY(delta_q=0.0)}
 
+# The facet through which the heat is transferred into the room
+FLOOR_SURFACE = "Coverfloor"
+
+
+# Configuration of the linear solver of the Solver class
+#   - method: "lu" (direct), "krylov" (CG with algebraic multigrid) or "auto" (LU below lu_dof_threshold dofs)
+#   - krylov_method / preconditioner: names as in dolfin.krylov_solver_methods / krylov_solver_preconditioners
+#   - relative_tolerance: None ties the tolerance to the discretization error of the mesh (see discretization_tolerance)
+#   - maximum_iterations: a Krylov solve which does not converge within this number falls back to LU
+#   - lu_dof_threshold: number of dofs up to which "auto" uses LU
+LINEAR_SOLVER = namedtuple(
+    "Linear_solver",
+    ["method", "krylov_method", "preconditioner", "relative_tolerance", "maximum_iterations", "lu_dof_threshold"],
+)
+DEFAULT_LINEAR_SOLVER = LINEAR_SOLVER(
+    method="auto",
+    krylov_method="cg",
+    preconditioner="hypre_amg",
+    relative_tolerance=None,
+    maximum_iterations=500,
+    lu_dof_threshold=100000,
+)
+
+# BoomerAMG settings for coefficient jumps of several orders of magnitude (copper 384 vs. PUR 0.023): a larger strength
+# threshold keeps the coarsening from connecting cells across material interfaces, HMIS coarsening together with the
+# extended+i interpolation keeps the operator complexity low on unstructured meshes.
+AMG_OPTIONS = {
+    "pc_hypre_boomeramg_strong_threshold": 0.5,
+    "pc_hypre_boomeramg_coarsen_type": "HMIS",
+    "pc_hypre_boomeramg_interp_type": "ext+i",
+}
+
 
 POINT_COORDINATES = np.array(
     [
@@ -112,7 +194,7 @@ POINT_COORDINATES = np.array(
 
 
 class Mesh:
-    def __init__(self, geo_file=GEO_FILE):
+    def __init__(self, geo_file=GEO_FILE, mesh_data=None):
         """
         Mesh class that stores:
             - mesh: dolfin.Mesh
@@ -127,11 +209,12 @@ class Mesh:
             - n: dolfin.FacetNormal
             - space_dim: geometrical dimension of the mesh
         :param geo_file:
+        :param mesh_data: 5-tuple in the format of 'load_mesh', e.g. of a refined mesh, replaces loading the geo_file
         """
         # Load the mesh and get the extracted facet_markers and cell_markers
-        self.mesh, self.facet_markers, self.facet_marker_map, self.cell_markers, self.cell_markers_map = self.load_mesh(
-            geo_file
-        )
+        if mesh_data is None:
+            mesh_data = self.load_mesh(geo_file)
+        self.mesh, self.facet_markers, self.facet_marker_map, self.cell_markers, self.cell_markers_map = mesh_data
 
         # Compute the largest width and height of the domain
         self.width, self.height = self.get_domain_sizes()
@@ -156,11 +239,12 @@ class Mesh:
 
     def get_domain_sizes(self):
         """
-        Compute the maximum dimensions of the domain
+        Compute the maximum dimensions of the domain, under mpirun the bounds of all partitions are reduced
         :return:
         """
-        max_coords = self.mesh.coordinates().max(axis=0)
-        min_coords = self.mesh.coordinates().min(axis=0)
+        comm = self.mesh.mpi_comm()
+        max_coords = [global_max(comm, value) for value in self.mesh.coordinates().max(axis=0)]
+        min_coords = [global_min(comm, value) for value in self.mesh.coordinates().min(axis=0)]
         w = max_coords[0] - min_coords[0]  # Index 0 for x coords being in the zeroth index
         h = max_coords[1] - min_coords[1]  # Index 1 for y coords being in the first index
         return w, h
@@ -182,15 +266,34 @@ def get_dirichlet(mesh: Mesh, w_h, facet_name, value):
 
 
 class Solver:
-    def __init__(self, mesh: Mesh, function_space: dlfn.FunctionSpace, dirichlet_boundaries: Dict):
+    def __init__(
+        self,
+        mesh: Mesh,
+        function_space: dlfn.FunctionSpace,
+        dirichlet_boundaries: Dict,
+        subdomains: Optional[Dict[str, Material]] = None,
+        material_table: Optional[Dict[str, float]] = None,
+        linear_solver: LINEAR_SOLVER = DEFAULT_LINEAR_SOLVER,
+    ):
         """
         Initialize a solver class; the final solution will be stored internally as 'w'
         :param mesh: An instance of the Mesh class
         :param function_space: The function space Vh in which the solution should be found
         :param dirichlet_boundaries: A dict containing the dirichlet facets and corresponding values
+        :param subdomains: A dict assigning a Material to each subdomain, defaults to SUBDOMAINS
+        :param material_table: A dict of the thermal conductivities of the materials, defaults to the values from
+            MATERIAL_TABLE_FILE
+        :param linear_solver: The configuration of the linear solver, see LINEAR_SOLVER
         """
         # Store the mesh instance for later access to the metrics
         self.mesh = mesh
+        # Store the material assignment of the subdomains
+        self.subdomains = dict(SUBDOMAINS if subdomains is None else subdomains)
+        self.material_table = load_material_table() if material_table is None else dict(material_table)
+        # Cellwise constant thermal conductivity field
+        self.conductivity = None
+        self.conductivity_dofs = None
+        self.create_conductivity_field()
         # Store the function space TODO: See if this remains necessary after fixing 'assemble_rhs'
         self.function_space = function_space
         # Create test and trial space
@@ -202,6 +305,78 @@ class Solver:
             get_dirichlet(mesh, function_space, facet_name, value) for facet_name, value in dirichlet_boundaries.items()
         ]
         self.solution_gradient = None
+        self.post_processor = None
+        # Objects of the reusable linear system (see setup_linear_system)
+        self.ncc_constants = None
+        self.neumann_constants = None
+        self.assembler = None
+        self.system_matrix = None
+        self.rhs_vector = None
+        self.linear_solver = None
+        self.matrix_outdated = True
+        # Configuration of the linear solver and the statistics of all linear solves
+        if linear_solver.method not in ("lu", "krylov", "auto"):
+            raise ValueError("Unknown linear solver method: " + str(linear_solver.method))
+        self.linear_solver_config = linear_solver
+        self.linear_solver_statistics = list()
+
+    def create_conductivity_field(self):
+        """
+        Create the DG0 Function holding the thermal conductivity of every cell. The stiffness term is a single integral
+        over this field, hence modifying a material only requires an update of its vector.
+        :return:
+        """
+        if self.mesh.cell_markers is None:
+            raise ValueError("The mesh has no cell markers to assign the materials to")
+        dg0 = dlfn.FunctionSpace(self.mesh.mesh, "DG", 0)
+        self.conductivity = dlfn.Function(dg0)
+        self.conductivity.rename("k", "Thermal Conductivity")
+        # For DG0, there is exactly one dof per cell
+        self.conductivity_dofs = np.asarray(dg0.dofmap().entity_dofs(self.mesh.mesh, self.mesh.space_dim), dtype=int)
+        self.update_conductivity_field()
+
+    def get_cellwise_values(self, material_table: Dict[str, float]):
+        """
+        Map a material property onto the cells according to the cell markers
+        :param material_table: Dict[MATERIAL_NAME <-> VALUE]
+        :return: The local vector of a DG0 Function holding the values
+        """
+        markers = self.mesh.cell_markers.array()
+        values = np.full(markers.shape, np.nan)
+        for subdomain_name, subdomain_id in self.mesh.cell_markers_map.items():
+            values[markers == subdomain_id] = material_table[self.subdomains[subdomain_name].material]
+        if np.isnan(values).any():
+            raise ValueError("There are cells with markers which are not part of the cell_markers_map")
+        local_values = np.empty_like(values)
+        local_values[self.conductivity_dofs] = values
+        return local_values
+
+    def update_conductivity_field(self):
+        """
+        Write the conductivities of the material table into the conductivity field according to the cell markers
+        :return:
+        """
+        self.conductivity.vector().set_local(self.get_cellwise_values(self.material_table))
+        self.conductivity.vector().apply("insert")
+        # The boundary flux operators of the post-processor depend on the conductivities
+        self.post_processor = None
+        # The system matrix depends on the conductivities
+        self.matrix_outdated = True
+
+    def update_materials(
+        self, subdomains: Optional[Dict[str, Material]] = None, conductivities: Optional[Dict[str, float]] = None
+    ):
+        """
+        Modify the material assignment and/or the thermal conductivities without rebuilding any form
+        :param subdomains: Dict[SUBDOMAIN_NAME <-> Material] of the subdomains to be modified
+        :param conductivities: Dict[MATERIAL_NAME <-> THERMAL_CONDUCTIVITY] of the materials to be modified
+        :return:
+        """
+        if subdomains:
+            self.subdomains.update(subdomains)
+        if conductivities:
+            self.material_table.update({name: float(value) for name, value in conductivities.items()})
+        self.update_conductivity_field()
 
     def newtons_cooling_condition(self, value: NCC_BOUNDARY):
         """
@@ -212,7 +387,7 @@ class Solver:
         :type value: NCC_BOUNDARY
         :return:
         """
-        return dlfn.Constant(value.heat_transfer_coefficient) * (self.u - dlfn.Constant(value.external_temperature))
+        return as_constant(value.heat_transfer_coefficient) * (self.u - as_constant(value.external_temperature))
 
     def sum_terms(
         self,
@@ -226,7 +401,8 @@ class Solver:
         Construct a list of:
             - The source term
             - The Newton Cooling Condition Boundary terms
-            - The Subdomain terms
+            - The Neumann Boundary terms
+            - The heat conduction term with the cellwise conductivity field
         and run numpy.sum. For later addition of additional boundary condition types, add an equivalent block in here
         with a corresponding setter method.
 
@@ -249,12 +425,10 @@ class Solver:
         if neumann_boundaries:
             for boundary, value in neumann_boundaries.items():
                 boundary_id = self.mesh.facet_marker_map[boundary]
-                h = dlfn.Constant(value.delta_q)
+                h = as_constant(value.delta_q)
                 f.append(h * self.v * self.mesh.dA(subdomain_id=boundary_id))
 
-        for subdomain_name, subdomain_id in self.mesh.cell_markers_map.items():
-            cv = SUBDOMAINS[subdomain_name].thermal_conductivity
-            f.append(cv * dlfn.inner(dlfn.grad(self.u), dlfn.grad(self.v)) * self.mesh.dV(subdomain_id=subdomain_id))
+        f.append(self.conductivity * dlfn.inner(dlfn.grad(self.u), dlfn.grad(self.v)) * self.mesh.dV)
 
         return np.sum(f)
 
@@ -271,112 +445,485 @@ class Solver:
         f = self.sum_terms(ncc_boundaries=ncc_boundaries, neumann_boundaries=neumann_boundaries)
         lhs, rhs = dlfn.lhs(f), dlfn.rhs(f)
 
+        # Symmetric assembly keeps the system SPD, which is required by CG
+        system_matrix, rhs_vector = dlfn.PETScMatrix(), dlfn.PETScVector()
+        with instrumentation.span("assembly"):
+            dlfn.SystemAssembler(lhs, rhs, self.dirichlet_bcs).assemble(system_matrix, rhs_vector)
+
         # Solve
-        dlfn.solve(lhs == rhs, self.w, self.dirichlet_bcs)
+        self.solve_linear_system(self.create_linear_solver(system_matrix), system_matrix, rhs_vector)
 
         # Return solution for direct use
         return self.w
 
-    def get_solution_gradient(self):
-        self.solution_gradient = dlfn.grad(self.w)
+    def create_boundary_constants(
+        self,
+        ncc_boundaries: Optional[Dict[str, NCC_BOUNDARY]] = None,
+        neumann_boundaries: Optional[Dict[str, NEUMANN_BOUNDARY]] = None,
+        source_term: str = "0",
+    ):
+        """
+        Create mutable dolfin.Constants for all boundary values and build the weak form with them
+        :return: Tuple of the bilinear and the linear form
+        """
+        ncc_boundaries = ncc_boundaries or dict()
+        neumann_boundaries = neumann_boundaries or dict()
+        self.ncc_constants = {
+            boundary: NCC_BOUNDARY(
+                external_temperature=tx(value.external_temperature),
+                heat_transfer_coefficient=tx(value.heat_transfer_coefficient),
+            )
+            for boundary, value in ncc_boundaries.items()
+        }
+        self.neumann_constants = {
+            boundary: NEUMANN_BOUNDARY(delta_q=tx(value.delta_q)) for boundary, value in neumann_boundaries.items()
+        }
+
+        f = self.sum_terms(
+            source_term=source_term, ncc_boundaries=self.ncc_constants, neumann_boundaries=self.neumann_constants
+        )
+        return dlfn.lhs(f), dlfn.rhs(f)
 
-    def compute_heat_conduction_field(self):
+    def setup_linear_system(
+        self,
+        ncc_boundaries: Optional[Dict[str, NCC_BOUNDARY]] = None,
+        neumann_boundaries: Optional[Dict[str, NEUMANN_BOUNDARY]] = None,
+        source_term: str = "0",
+    ):
+        """
+        Build the weak form once with mutable dolfin.Constants for all boundary values, assemble the system matrix and
+        create a LU solver for it. Afterwards, 'solve_rhs' and 'solve_batch' only reassemble the right hand side vector
+        and reuse the factorization as long as no heat transfer coefficient is modified.
+        :param ncc_boundaries: The initial values of the Newton Cooling Condition boundaries
+        :param neumann_boundaries: The initial values of the Neumann boundaries
+        :param source_term:
+        :return:
+        """
+        lhs, rhs = self.create_boundary_constants(ncc_boundaries, neumann_boundaries, source_term)
 
-        if not self.solution_gradient:
-            self.get_solution_gradient()
+        # The assembler applies the dirichlet bcs symmetrically to the matrix and the rhs vector
+        self.assembler = dlfn.SystemAssembler(lhs, rhs, self.dirichlet_bcs)
+        self.system_matrix = dlfn.PETScMatrix()
+        self.rhs_vector = dlfn.PETScVector()
+        self.matrix_outdated = True
+        self.assemble_matrix()
 
-        vh = dlfn.VectorFunctionSpace(
-            mesh=self.mesh.mesh, family="DG", degree=1, constrained_domain=boundary_conditions.PeriodicBoundary()
-        )
-        u, v = dlfn.TrialFunction(vh), dlfn.TestFunction(vh)
-        w = dlfn.Function(vh)
+    def assemble_matrix(self):
+        """
+        (Re-)Assemble the system matrix and create a new linear solver, the factorization or the multigrid hierarchy is
+        computed on the first solve and reused by all following solves.
+        :return:
+        """
+        assert self.assembler is not None, "Call 'setup_linear_system' first"
+        with instrumentation.span("matrix_assembly"):
+            self.assembler.assemble(self.system_matrix)
+        self.linear_solver = self.create_linear_solver(self.system_matrix)
+        self.matrix_outdated = False
+
+    def use_direct_solver(self):
+        """
+        :return: True if the configuration selects LU for the size of the function space
+        """
+        config = self.linear_solver_config
+        if config.method == "auto":
+            return self.function_space.dim() <= config.lu_dof_threshold
+        return config.method == "lu"
 
-        hcf = [dlfn.inner(u, v) * self.mesh.dV]
+    def discretization_tolerance(self):
+        """
+        Relative tolerance of the Krylov solver derived from the expected discretization error: the relative L2 error
+        of a CG-k solution scales like (h / L)^(k + 1). Iterating far below this error only costs time, the algebraic
+        error is kept two orders of magnitude below it.
+        :return: float
+        """
+        degree = self.function_space.ufl_element().degree()
+        length = max(self.mesh.width, self.mesh.height)
+        hmax = global_max(self.mesh.mesh.mpi_comm(), self.mesh.mesh.hmax())
+        tolerance = 1e-2 * (hmax / length) ** (degree + 1)
+        return min(max(tolerance, 1e-12), 1e-6)
 
-        for subdomain_name, subdomain_id in self.mesh.cell_markers_map.items():
-            cv = SUBDOMAINS[subdomain_name].thermal_conductivity
-            hcf.append(cv * dlfn.inner(self.solution_gradient, v) * self.mesh.dV(subdomain_id=subdomain_id))
-        hcf = np.sum(hcf)
+    def get_preconditioner(self):
+        """
+        :return: The configured preconditioner, hypre_amg is replaced by petsc_amg if PETSc was built without hypre
+        """
+        preconditioner = self.linear_solver_config.preconditioner
+        if preconditioner == "hypre_amg" and not dlfn.has_krylov_solver_preconditioner("hypre_amg"):
+            return "petsc_amg"
+        return preconditioner
+
+    def create_linear_solver(self, system_matrix: dlfn.PETScMatrix):
+        """
+        Create the linear solver selected by the configuration for the given matrix
+        :param system_matrix:
+        :return: dolfin.PETScLUSolver or dolfin.PETScKrylovSolver
+        """
+        if self.use_direct_solver():
+            return dlfn.PETScLUSolver(system_matrix)
+
+        config = self.linear_solver_config
+        preconditioner = self.get_preconditioner()
+        linear_solver = dlfn.PETScKrylovSolver(config.krylov_method, preconditioner)
+        linear_solver.set_options_prefix("heat_")
+        if preconditioner == "hypre_amg":
+            for key, value in AMG_OPTIONS.items():
+                dlfn.PETScOptions.set("heat_" + key, value)
+            linear_solver.set_from_options()
+        linear_solver.set_operator(system_matrix)
+
+        parameters = linear_solver.parameters
+        parameters["relative_tolerance"] = config.relative_tolerance or self.discretization_tolerance()
+        parameters["absolute_tolerance"] = 1e-14
+        parameters["maximum_iterations"] = config.maximum_iterations
+        parameters["error_on_nonconvergence"] = True
+        # Start from the previous solution, which pays off for consecutive solves with similar boundary values
+        parameters["nonzero_initial_guess"] = True
+        return linear_solver
+
+    def solve_linear_system(self, linear_solver, system_matrix: dlfn.PETScMatrix, rhs_vector: dlfn.PETScVector):
+        """
+        Solve the linear system into the solution vector and record the method, the iterations and the wall time in
+        'linear_solver_statistics'. A Krylov solve which does not converge is repeated with LU.
+        :param linear_solver: A solver created by 'create_linear_solver' for the system_matrix
+        :param system_matrix:
+        :param rhs_vector:
+        :return: The linear solver which computed the solution
+        """
+        timer = dlfn.Timer()
+        with instrumentation.span("linear_solve"):
+            if isinstance(linear_solver, dlfn.PETScKrylovSolver):
+                method = "{0}+{1}".format(self.linear_solver_config.krylov_method, self.get_preconditioner())
+                try:
+                    iterations, converged = linear_solver.solve(self.w.vector(), rhs_vector), True
+                except RuntimeError:
+                    iterations, converged = self.linear_solver_config.maximum_iterations, False
+            else:
+                linear_solver.solve(self.w.vector(), rhs_vector)
+                iterations, converged, method = 1, True, "lu"
+        statistics = {"method": method, "iterations": iterations, "converged": converged, "time": timer.stop()}
+        self.linear_solver_statistics.append(statistics)
+        instrumentation.record(linear_iterations=iterations)
+
+        if not converged:
+            print("LINEAR SOLVER {0} DID NOT CONVERGE IN {1} ITERATIONS, FALLING BACK TO LU".format(method, iterations))
+            timer = dlfn.Timer()
+            linear_solver = dlfn.PETScLUSolver(system_matrix)
+            with instrumentation.span("linear_solve"):
+                linear_solver.solve(self.w.vector(), rhs_vector)
+            self.linear_solver_statistics.append(
+                {"method": "lu", "iterations": 1, "converged": True, "time": timer.stop()}
+            )
+        return linear_solver
+
+    def update_boundary_values(
+        self,
+        ncc_boundaries: Optional[Dict[str, NCC_BOUNDARY]] = None,
+        neumann_boundaries: Optional[Dict[str, NEUMANN_BOUNDARY]] = None,
+    ):
+        """
+        Assign new values to the Constants of the linear system. Only the boundaries given are modified, the others
+        keep their current value. A modified heat transfer coefficient changes the system matrix and marks it for
+        reassembly, external temperatures and Neumann fluxes only enter the right hand side.
+        :param ncc_boundaries:
+        :param neumann_boundaries:
+        :return:
+        """
+        assert self.ncc_constants is not None, "Call 'setup_linear_system' first"
+        if ncc_boundaries:
+            for boundary, value in ncc_boundaries.items():
+                if boundary not in self.ncc_constants:
+                    raise ValueError("The boundary " + boundary + " is not part of the linear system")
+                constants = self.ncc_constants[boundary]
+                constants.external_temperature.assign(float(value.external_temperature))
+                if float(constants.heat_transfer_coefficient) != float(value.heat_transfer_coefficient):
+                    constants.heat_transfer_coefficient.assign(float(value.heat_transfer_coefficient))
+                    self.matrix_outdated = True
+        if neumann_boundaries:
+            for boundary, value in neumann_boundaries.items():
+                if boundary not in self.neumann_constants:
+                    raise ValueError("The boundary " + boundary + " is not part of the linear system")
+                self.neumann_constants[boundary].delta_q.assign(float(value.delta_q))
+
+    def solve_rhs(
+        self,
+        ncc_boundaries: Optional[Dict[str, NCC_BOUNDARY]] = None,
+        neumann_boundaries: Optional[Dict[str, NEUMANN_BOUNDARY]] = None,
+    ):
+        """
+        Solve the problem for a new set of boundary values by only reassembling the right hand side vector.
+        :param ncc_boundaries: Boundaries to be modified before solving, see 'update_boundary_values'
+        :param neumann_boundaries: Boundaries to be modified before solving, see 'update_boundary_values'
+        :return: The solution 'w'
+        """
+        if self.assembler is None:
+            self.setup_linear_system(ncc_boundaries=ncc_boundaries, neumann_boundaries=neumann_boundaries)
+        else:
+            self.update_boundary_values(ncc_boundaries=ncc_boundaries, neumann_boundaries=neumann_boundaries)
+        if self.matrix_outdated:
+            self.assemble_matrix()
+
+        with instrumentation.span("rhs_assembly"):
+            self.assembler.assemble(self.rhs_vector)
+        # Keep the solver which succeeded, a failed Krylov solver is replaced by LU for all following solves
+        self.linear_solver = self.solve_linear_system(self.linear_solver, self.system_matrix, self.rhs_vector)
+        # The gradient refers to the solution function and remains valid
+        return self.w
 
-        lhs, rhs = dlfn.lhs(hcf), dlfn.rhs(hcf)
+    def solve_batch(
+        self,
+        ncc_scenarios: List[Dict[str, NCC_BOUNDARY]],
+        neumann_scenarios: Optional[List[Dict[str, NEUMANN_BOUNDARY]]] = None,
+    ):
+        """
+        Solve a batch of boundary value scenarios with the same factorized system matrix. Scenarios which modify a
+        heat transfer coefficient trigger a reassembly of the matrix, so group them by coefficient if possible.
+        :param ncc_scenarios: A list of Newton Cooling Condition boundary dicts, one per scenario
+        :param neumann_scenarios: An optional list of Neumann boundary dicts of the same length
+        :return: A list containing a copy of the solution for each scenario
+        """
+        if neumann_scenarios is None:
+            neumann_scenarios = [None] * len(ncc_scenarios)
+        assert len(neumann_scenarios) == len(ncc_scenarios)
 
-        solver = dlfn.LocalSolver(lhs, rhs)
-        solver.factorize()
-        solver.solve_local_rhs(w)
+        solutions = list()
+        for ncc_boundaries, neumann_boundaries in zip(ncc_scenarios, neumann_scenarios):
+            self.solve_rhs(ncc_boundaries=ncc_boundaries, neumann_boundaries=neumann_boundaries)
+            solutions.append(self.w.copy(deepcopy=True))
+        return solutions
 
-        return w
+    def get_solution_gradient(self):
+        self.solution_gradient = dlfn.grad(self.w)
+
+    def get_post_processor(self):
+        """
+        :return: The PostProcessor of the mesh and the current conductivity field, it is created on the first call
+        """
+        if self.post_processor is None:
+            with instrumentation.span("post_processor_setup"):
+                self.post_processor = PostProcessor(self.mesh, self.function_space, self.conductivity)
+        return self.post_processor
+
+    def compute_heat_conduction_field(self):
+        return self.get_post_processor().compute(self.w).heat_flux
+
+    def compute_heat_flows(self):
+        """
+        :return: Dict[FACET_NAME <-> HEAT_FLOW] of the heat flowing out of the domain through every marked facet
+        """
+        return self.get_post_processor().compute(self.w).heat_flows
 
-    def save_solution(self, filename="temperature_field.pvd"):
+    def save_solution(self, writer: ResultWriter):
         """
         Method to write the resulting temperature field to a file.
+        :param writer: The ResultWriter of the run
         :return:
         """
         self.w.rename("T", "Temperature Field")
-        dlfn.File(filename) << self.w
+        writer.write(self.w)
 
-    def save_grad(self, filename="temperature_gradient.pvd"):
+    def save_grad(self, writer: ResultWriter):
         """
         Compute the gradient field of the solution and write to file
-        :param filename:
+        :param writer: The ResultWriter of the run
         :return:
         """
-        if not self.solution_gradient:
-            self.get_solution_gradient()
-        solution_gradient = dlfn.project(self.solution_gradient)
+        solution_gradient = self.get_post_processor().compute(self.w).gradient
         solution_gradient.rename("grad(T)", "Temperature Gradient")
-        dlfn.File(filename) << solution_gradient
+        writer.write(solution_gradient)
 
-    def save_heat_conduction(self, filename="heat_conduction.pvd"):
+    def save_heat_conduction(self, writer: ResultWriter):
         """
-        Computes the heat conduction vector q and saves it to a file, it might make sense to reuse the result from the
-        calculation of the temperature gradient (before projecting).
-        :param filename:
+        Computes the heat conduction vector q and saves it to a file
+        :param writer: The ResultWriter of the run
         :return:
         """
         heat_conduction_field = self.compute_heat_conduction_field()
         heat_conduction_field.rename("q", "Heat Conduction")
-        dlfn.File(filename) << heat_conduction_field
+        writer.write(heat_conduction_field)
+
+    def save_results(self, filename="results.xdmf", float32=False, compression="gzip"):
+        """
+        Write the temperature field, its gradient and the heat conduction vector into a single result file, the fields
+        are computed in one pass of the post-processor. See utils.result_writer for reading them back.
+        :param filename:
+        :param float32: Store the fields in single precision
+        :param compression: HDF5 compression filter of the fields
+        :return:
+        """
+        result = self.get_post_processor().compute(self.w)
+        self.w.rename("T", "Temperature Field")
+        result.gradient.rename("grad(T)", "Temperature Gradient")
+        result.heat_flux.rename("q", "Heat Conduction")
+        with instrumentation.span("xdmf_output"):
+            with ResultWriter(filename, self.mesh.mesh, float32=float32, compression=compression) as writer:
+                for field in (self.w, result.gradient, result.heat_flux):
+                    writer.write(field)
+        return result
+
+
+# Results of the PostProcessor
+#   - gradient: DG1 vector Function of grad(T)
+#   - heat_flux: DG1 vector Function of q = -k grad(T)
+#   - heat_flows: Dict[FACET_NAME <-> integral of q * n over the facet]
+POST_PROCESSING_RESULT = namedtuple("Post_processing_result", ["gradient", "heat_flux", "heat_flows"])
 
 
-def solve_routine(mesh_file, with_additionals=False):
+class PostProcessor:
+    def __init__(self, mesh: Mesh, function_space: dlfn.FunctionSpace, conductivity: dlfn.Function):
+        """
+        Post-processing of temperature fields on a fixed mesh with a fixed conductivity field. All spaces, the
+        factorized local solver and the boundary flux operators are created once, afterwards 'compute' derives the
+        gradient, the heat flux and the heat flows through all marked facets from a solution in a single pass.
+        :param mesh: An instance of the Mesh class
+        :param function_space: The function space of the temperature fields
+        :param conductivity: The DG0 conductivity field of the Solver
+        """
+        self.mesh = mesh
+        self.temperature = dlfn.Function(function_space)
+        # The gradient of a CG2 field is exactly representable in DG1, the local projection is exact
+        self.vector_space = dlfn.VectorFunctionSpace(mesh.mesh, "DG", 1)
+        u, v = dlfn.TrialFunction(self.vector_space), dlfn.TestFunction(self.vector_space)
+        self.gradient_solver = dlfn.LocalSolver(
+            dlfn.inner(u, v) * mesh.dV, dlfn.inner(dlfn.grad(self.temperature), v) * mesh.dV
+        )
+        self.gradient_solver.factorize()
+
+        # q = -k grad(T) with a cellwise constant k is a scaling of the DG1 dofs
+        dofmap = self.vector_space.dofmap()
+        cell_dofs = np.asarray(conductivity.function_space().dofmap().entity_dofs(mesh.mesh, mesh.space_dim), dtype=int)
+        cell_conductivities = conductivity.vector().get_local()[cell_dofs]
+        self.dof_conductivities = np.empty(dlfn.Function(self.vector_space).vector().local_size())
+        for cell in range(mesh.mesh.num_cells()):
+            self.dof_conductivities[dofmap.cell_dofs(cell)] = cell_conductivities[cell]
+
+        # One row per marked facet: the heat flow is the product of the row with the solution vector
+        w = dlfn.TestFunction(function_space)
+        flux = -conductivity * dlfn.inner(dlfn.grad(w), mesh.n)
+        self.facet_names = list(mesh.facet_marker_map.keys())
+        self.heat_flow_operator = np.array(
+            [
+                dlfn.assemble(flux * mesh.dA(subdomain_id=mesh.facet_marker_map[name])).get_local()
+                for name in self.facet_names
+            ]
+        )
+
+    def compute(self, solution: dlfn.Function):
+        """
+        :param solution: A temperature field of the function space
+        :return: POST_PROCESSING_RESULT
+        """
+        with instrumentation.span("post_processing"):
+            self.temperature.vector().set_local(solution.vector().get_local())
+            self.temperature.vector().apply("insert")
+
+            gradient = dlfn.Function(self.vector_space)
+            self.gradient_solver.solve_local_rhs(gradient)
+            heat_flux = dlfn.Function(self.vector_space)
+            heat_flux.vector().set_local(-self.dof_conductivities * gradient.vector().get_local())
+            heat_flux.vector().apply("insert")
+
+            # Every process holds the columns of its own dofs, the partial products are summed up
+            local_heat_flows = self.heat_flow_operator @ solution.vector().get_local()
+            heat_flows = dict(zip(self.facet_names, global_sum(self.mesh.mesh.mpi_comm(), local_heat_flows)))
+        return POST_PROCESSING_RESULT(gradient=gradient, heat_flux=heat_flux, heat_flows=heat_flows)
+
+
+def create_function_space(mesh: Mesh):
+    """
+    Create the periodic CG2 function space for test/trial/solution function on the given mesh
+    :param mesh: An instance of the Mesh class
+    :return: dolfin.FunctionSpace
+    """
+    # Set the domain specific scale (width), which is the global width under mpirun
+    return dlfn.FunctionSpace(mesh.mesh, "CG", 2, constrained_domain=boundary_conditions.PeriodicBoundary(mesh.width))
+
+
+def setup_routine(mesh_file, mesh=None):
+    """
+    Load the mesh and create the function space without solving, e.g. in order to read a stored solution
+    :return: Tuple of the function space and the Mesh
+    """
     # Instantiate the custom Mesh class (Load mesh, facet_markers and cell_markers and compute some required metrics)
-    mesh = Mesh(mesh_file)
-    # Set the domain specific scale (width)
-    boundary_conditions.PeriodicBoundary.lh = mesh.width
+    if mesh is None:
+        mesh = Mesh(mesh_file)
     # Create a function space for test/trial/solution function
-    Vh = dlfn.FunctionSpace(mesh.mesh, "CG", 2, constrained_domain=boundary_conditions.PeriodicBoundary())
+    return create_function_space(mesh), mesh
+
+
+def get_settings(linear_solver=DEFAULT_LINEAR_SOLVER):
+    """
+    All settings of solve_routine which influence the solution, used as key of cached solutions
+    :return: Dict
+    """
+    return {
+        "linear_solver": linear_solver._asdict(),
+        "materials": load_material_table(),
+        "subdomains": {name: material.material for name, material in SUBDOMAINS.items()},
+        "ncc_boundaries": {name: value._asdict() for name, value in NCC_BOUNDARIES.items()},
+        "neumann_boundaries": {name: value._asdict() for name, value in NEUMANN_BOUNDARIES.items()},
+        "dirichlet_boundaries": {name: float(value) for name, value in DIRICHLET_BOUNDARIES.items()},
+    }
+
+
+def solve_routine(
+    mesh_file,
+    with_additionals=False,
+    ncc_boundaries=None,
+    neumann_boundaries=None,
+    subdomains=None,
+    mesh=None,
+    function_space=None,
+    linear_solver=DEFAULT_LINEAR_SOLVER,
+):
+    if mesh is None or function_space is None:
+        Vh, mesh = setup_routine(mesh_file, mesh=mesh)
+    else:
+        Vh = function_space
     # Instantiate the custom solver class ()
-    solver = Solver(mesh, Vh, DIRICHLET_BOUNDARIES)
+    solver = Solver(mesh, Vh, DIRICHLET_BOUNDARIES, subdomains=subdomains, linear_solver=linear_solver)
     # Solve the problem
-    print("SOLVE PROBLEM")
-    solver.solve(ncc_boundaries=NCC_BOUNDARIES, neumann_boundaries=NEUMANN_BOUNDARIES)
+    root_print("SOLVE PROBLEM")
+    solver.solve(
+        ncc_boundaries=NCC_BOUNDARIES if ncc_boundaries is None else ncc_boundaries,
+        neumann_boundaries=NEUMANN_BOUNDARIES if neumann_boundaries is None else neumann_boundaries,
+    )
+    statistics = solver.linear_solver_statistics[-1]
+    root_print(
+        "LINEAR SOLVER {0}: {1} DOFS, {2} ITERATIONS, {3:.3f} s".format(
+            statistics["method"], Vh.dim(), statistics["iterations"], statistics["time"]
+        )
+    )
     # Save the solution
     if with_additionals:
-        print("SAVE SOLUTION")
-        solver.save_solution()
-        # Compute and save the gradient of the temperature field for a better understanding of the evolution
-        print("COMPUTE AND SAVE GRADIENT")
-        solver.save_grad()
-        print("COMPUTE AND SAVE HEAT CONDUCTION FIELD")
-        solver.save_heat_conduction()
+        # Save the solution together with the gradient of the temperature field and the heat conduction field
+        root_print("COMPUTE AND SAVE SOLUTION, GRADIENT AND HEAT CONDUCTION FIELD")
+        result = solver.save_results()
+        for facet_name, heat_flow in result.heat_flows.items():
+            root_print("HEAT FLOW THROUGH {0}: {1:.4e}".format(facet_name, heat_flow))
+    if instrumentation.enabled:
+        root_print(instrumentation.summary())
     return solver.w, Vh, mesh
 
 
+# The refinement levels inside of 'meshes', ordered from coarse to fine
+MESH_REFINEMENTS = [
+    "coarse",
+    "coarse_medium",
+    "medium",
+    "medium_fine",
+    "fine",
+    "fine-1",
+    "fine-2",
+    "fine-3",
+    "fine-4",
+    "fine-5",
+    "fine-6",
+    "fine-7",
+]
+
+
 def main(args):
-    mesh_refinements = [
-        "coarse",
-        "coarse_medium",
-        "medium",
-        "medium_fine",
-        "fine",
-        "fine-1",
-        "fine-2",
-        "fine-3",
-        "fine-4",
-        "fine-5",
-        "fine-6",
-        "fine-7",
-    ]
+    use_form_cache()
+    mesh_refinements = MESH_REFINEMENTS
 
     geometry_name_wet = "FussbodenheizungSegmentNass.geo"
     geometry_name_dry = "FussbodenheizungSegmentTrocken.geo"
@@ -391,6 +938,9 @@ def main(args):
             convergence_measures=["global", "facet_integral", "local"],
             out_dir="convergence_tests",
             points_coordinates=POINT_COORDINATES,
+            setup_function=setup_routine,
+            cache_dir=os.path.join("convergence_tests", "cache"),
+            settings=get_settings(),
         )
         convergence.run_test()
         convergence.save_plots()
@@ -401,6 +951,9 @@ def main(args):
             convergence_measures=["global", "facet_integral", "local"],
             out_dir="convergence_tests",
             points_coordinates=POINT_COORDINATES,
+            setup_function=setup_routine,
+            cache_dir=os.path.join("convergence_tests", "cache"),
+            settings=get_settings(),
         )
         convergence.run_test()
         convergence.save_plots()
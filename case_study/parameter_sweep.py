@@ -0,0 +1,280 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# General imports
+import csv
+import itertools
+import json
+import multiprocessing
+import os.path
+import sys
+import time
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional
+
+import dolfin as dlfn
+
+from case_study import (
+    Material,
+    Mesh,
+    Solver,
+    NCC_BOUNDARY,
+    NCC_BOUNDARIES,
+    NEUMANN_BOUNDARIES,
+    DIRICHLET_BOUNDARIES,
+    SUBDOMAINS,
+    POINT_COORDINATES,
+    FLOOR_SURFACE,
+    create_function_space,
+    load_material_table,
+    use_form_cache,
+)
+from utils.probe import Probe
+
+GEOMETRIES = {
+    "wet": "FussbodenheizungSegmentNass.geo",
+    "dry": "FussbodenheizungSegmentTrocken.geo",
+}
+
+# A scenario is a single design variant of the floor heating segment
+#   - geometry: key of GEOMETRIES
+#   - refinement: name of the refinement directory inside of 'meshes'
+#   - ncc_boundaries: Dict[BOUNDARY_NAME <-> NCC_BOUNDARY]
+#   - materials: Dict[SUBDOMAIN_NAME <-> MATERIAL_NAME], overrides the assignment in SUBDOMAINS
+#   - conductivities: Dict[MATERIAL_NAME <-> THERMAL_CONDUCTIVITY], overrides the values of THERMAL_CONDUCTIVITIES
+SCENARIO = namedtuple("Scenario", ["geometry", "refinement", "ncc_boundaries", "materials", "conductivities"])
+
+# Per process storage of the meshes, probes and solvers, every worker loads a mesh only once
+_MESHES = dict()
+_PROBES = dict()
+_SOLVERS = dict()
+
+
+def build_scenario_grid(
+    geometries: Iterable[str],
+    refinements: Iterable[str],
+    ncc_variants: Optional[Iterable[Dict[str, NCC_BOUNDARY]]] = None,
+    material_variants: Optional[Iterable[Dict[str, str]]] = None,
+    conductivity_variants: Optional[Iterable[Dict[str, float]]] = None,
+):
+    """
+    Build the cartesian product of all given variants. Variants which are not given are taken from the defaults of the
+    case study.
+    :param geometries: Keys of GEOMETRIES
+    :param refinements: Names of the refinement directories
+    :param ncc_variants: Complete or partial NCC_BOUNDARIES dicts, missing boundaries are taken from NCC_BOUNDARIES
+    :param material_variants: Partial subdomain to material name mappings
+    :param conductivity_variants: Partial material name to thermal conductivity mappings
+    :return: List[SCENARIO]
+    """
+    ncc_variants = list(ncc_variants) if ncc_variants else [dict()]
+    material_variants = list(material_variants) if material_variants else [dict()]
+    conductivity_variants = list(conductivity_variants) if conductivity_variants else [dict()]
+    scenarios = list()
+    for geometry, refinement, ncc, materials, conductivities in itertools.product(
+        geometries, refinements, ncc_variants, material_variants, conductivity_variants
+    ):
+        assert geometry in GEOMETRIES, "Unknown geometry: " + geometry
+        ncc_boundaries = dict(NCC_BOUNDARIES)
+        ncc_boundaries.update(ncc)
+        scenarios.append(SCENARIO(geometry, refinement, ncc_boundaries, dict(materials), dict(conductivities)))
+    return scenarios
+
+
+def get_geo_file(scenario: SCENARIO, mesh_dir="meshes"):
+    return os.path.join(mesh_dir, scenario.refinement, GEOMETRIES[scenario.geometry])
+
+
+def get_subdomains(scenario: SCENARIO):
+    """
+    Create the material assignment of a scenario
+    :param scenario:
+    :return: Dict[SUBDOMAIN_NAME <-> Material]
+    """
+    material_table = get_material_table(scenario)
+    subdomains = dict()
+    for subdomain_name, material in SUBDOMAINS.items():
+        material_name = scenario.materials.get(subdomain_name, material.material)
+        if material_name not in material_table:
+            raise ValueError("No thermal conductivity of the material '{0}' is defined".format(material_name))
+        subdomains[subdomain_name] = Material(material_name)
+    return subdomains
+
+
+def get_material_table(scenario: SCENARIO):
+    """
+    Create the material table of a scenario
+    :param scenario:
+    :return: Dict[MATERIAL_NAME <-> THERMAL_CONDUCTIVITY]
+    """
+    material_table = load_material_table()
+    material_table.update(scenario.conductivities)
+    return material_table
+
+
+def _material_key(scenario: SCENARIO):
+    return json.dumps([scenario.materials, scenario.conductivities], sort_keys=True)
+
+
+def _get_mesh(geo_file):
+    """
+    Return the mesh and the function space of the geo_file, loading it only on the first call inside of a process.
+    """
+    if geo_file not in _MESHES:
+        mesh = Mesh(geo_file)
+        _MESHES[geo_file] = (mesh, create_function_space(mesh))
+    return _MESHES[geo_file]
+
+
+def _get_probe(geo_file):
+    """
+    Return the probe of POINT_COORDINATES on the mesh of the geo_file, the cell search is done once per process.
+    """
+    if geo_file not in _PROBES:
+        _, function_space = _get_mesh(geo_file)
+        _PROBES[geo_file] = Probe(function_space, POINT_COORDINATES)
+    return _PROBES[geo_file]
+
+
+def _get_solver(geo_file, scenario: SCENARIO):
+    """
+    Return a solver for the mesh and the material assignment of the scenario. Solvers are kept per process such that
+    scenarios which only differ in their boundary values reuse the factorized system matrix.
+    """
+    key = (geo_file, _material_key(scenario))
+    if key not in _SOLVERS:
+        mesh, function_space = _get_mesh(geo_file)
+        _SOLVERS[key] = Solver(
+            mesh,
+            function_space,
+            DIRICHLET_BOUNDARIES,
+            subdomains=get_subdomains(scenario),
+            material_table=get_material_table(scenario),
+        )
+    return _SOLVERS[key]
+
+
+def evaluate_solution(solver: Solver, ncc_boundaries: Dict[str, NCC_BOUNDARY], probe: Optional[Probe] = None):
+    """
+    Compute the scalar results of a solution
+    :param solver: A solver holding the solution 'w'
+    :param ncc_boundaries: The boundary values the solution was computed for
+    :param probe: The probe of the evaluation points, defaults to POINT_COORDINATES
+    :return: Tuple of the probe temperatures, the heat flux through the floor surface and its mean temperature
+    """
+    solution = solver.w
+    mesh = solver.mesh
+    if probe is None:
+        probe = Probe(solver.function_space, POINT_COORDINATES)
+    probe_values = probe(solution)
+
+    # The heat flux through the floor surface follows directly from the Newton Cooling Condition
+    floor_id = mesh.facet_marker_map[FLOOR_SURFACE]
+    floor = ncc_boundaries[FLOOR_SURFACE]
+    dA = mesh.dA(subdomain_id=floor_id)
+    area = dlfn.assemble(dlfn.Constant(1.0) * dA)
+    heat_flux = dlfn.assemble(
+        dlfn.Constant(floor.heat_transfer_coefficient) * (solution - dlfn.Constant(floor.external_temperature)) * dA
+    )
+    mean_surface_temperature = dlfn.assemble(solution * dA) / area
+    return probe_values, heat_flux, mean_surface_temperature
+
+
+def run_scenario(indexed_scenario, mesh_dir="meshes"):
+    """
+    Worker function solving a single scenario
+    :param indexed_scenario: Tuple of the scenario index and the SCENARIO
+    :param mesh_dir:
+    :return: Dict containing one entry for each column of the results file
+    """
+    index, scenario = indexed_scenario
+    start = time.perf_counter()
+    geo_file = get_geo_file(scenario, mesh_dir)
+    solver = _get_solver(geo_file, scenario)
+    solver.solve_rhs(ncc_boundaries=scenario.ncc_boundaries, neumann_boundaries=NEUMANN_BOUNDARIES)
+    probe_values, heat_flux, mean_surface_temperature = evaluate_solution(
+        solver, scenario.ncc_boundaries, _get_probe(geo_file)
+    )
+
+    result = {
+        "scenario": index,
+        "geometry": scenario.geometry,
+        "refinement": scenario.refinement,
+        "materials": json.dumps(scenario.materials, sort_keys=True),
+        "conductivities": json.dumps(scenario.conductivities, sort_keys=True),
+    }
+    for boundary, value in sorted(scenario.ncc_boundaries.items()):
+        result[boundary + ":external_temperature"] = value.external_temperature
+        result[boundary + ":heat_transfer_coefficient"] = value.heat_transfer_coefficient
+    for (x, y), value in zip(POINT_COORDINATES, probe_values):
+        result["T({0:g},{1:g})".format(x, y)] = value
+    result["floor_heat_flux"] = heat_flux
+    result["mean_surface_temperature"] = mean_surface_temperature
+    result["n_dofs"] = solver.function_space.dim()
+    result["wall_time"] = time.perf_counter() - start
+    result["pid"] = os.getpid()
+    return result
+
+
+def _worker_init():
+    dlfn.set_log_level(50)
+
+
+def run_sweep(scenarios: List[SCENARIO], results_file="sweep_results.csv", n_workers: Optional[int] = None):
+    """
+    Solve all scenarios in a pool of worker processes and stream the results into a single csv file, one row per
+    scenario and one column per quantity. Rows are written as soon as a worker finishes, hence their order may differ
+    from the order of the scenarios; the 'scenario' column holds the index.
+
+    Scenarios are sorted by mesh before they are distributed such that consecutive tasks of a worker mostly share the
+    mesh and the material assignment.
+    :param scenarios:
+    :param results_file:
+    :param n_workers: Number of processes, defaults to the number of cores
+    :return: The path of the results file
+    """
+    if not scenarios:
+        raise ValueError("No scenarios given")
+    n_workers = n_workers or multiprocessing.cpu_count()
+    tasks = sorted(enumerate(scenarios), key=lambda s: (get_geo_file(s[1]), _material_key(s[1])))
+    # Keep the tasks of one mesh together as far as possible
+    chunksize = max(1, len(tasks) // (4 * n_workers))
+
+    results_file = os.path.abspath(results_file)
+    print("RUNNING A PARAMETER SWEEP WITH {0} SCENARIOS ON {1} WORKERS".format(len(tasks), n_workers))
+    with multiprocessing.Pool(processes=n_workers, initializer=_worker_init) as pool, open(
+        results_file, "w", newline=""
+    ) as file:
+        writer = None
+        for n_done, result in enumerate(pool.imap_unordered(run_scenario, tasks, chunksize=chunksize), start=1):
+            if writer is None:
+                writer = csv.DictWriter(file, fieldnames=list(result.keys()))
+                writer.writeheader()
+            writer.writerow(result)
+            file.flush()
+            print("FINISHED SCENARIO {0} ({1}/{2})".format(result["scenario"], n_done, len(tasks)))
+    return results_file
+
+
+def main(args):
+    use_form_cache()
+    supply_temperatures = [35.0, 40.0, 45.0, 50.0, 55.0]
+    ncc_variants = [
+        {
+            "Hot Inlet": NCC_BOUNDARY(external_temperature=t, heat_transfer_coefficient=3000.0),
+            "Cold Outlet": NCC_BOUNDARY(external_temperature=t - 5.0, heat_transfer_coefficient=3000.0),
+        }
+        for t in supply_temperatures
+    ]
+    material_variants = [dict(), {"Floorboarding": "wood"}]
+    scenarios = build_scenario_grid(
+        geometries=GEOMETRIES.keys(),
+        refinements=["coarse", "medium"],
+        ncc_variants=ncc_variants,
+        material_variants=material_variants,
+    )
+    run_sweep(scenarios, results_file="sweep_results.csv")
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
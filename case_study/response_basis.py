@@ -0,0 +1,238 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# General imports
+import sys
+from typing import Dict, Optional, List
+import numpy as np
+import dolfin as dlfn
+
+from case_study import (
+    Mesh,
+    Solver,
+    NCC_BOUNDARY,
+    NCC_BOUNDARIES,
+    NEUMANN_BOUNDARY,
+    NEUMANN_BOUNDARIES,
+    DIRICHLET_BOUNDARIES,
+    POINT_COORDINATES,
+    FLOOR_SURFACE,
+    GEO_FILE,
+    create_function_space,
+    use_form_cache,
+)
+from utils.probe import Probe
+
+
+class ResponseBasis:
+    def __init__(
+        self,
+        names: List[str],
+        basis: np.ndarray,
+        probe_matrix: np.ndarray,
+        floor_integrals: np.ndarray,
+        floor_area: float,
+        floor_heat_transfer_coefficient: float,
+        reference_values: np.ndarray,
+        points: np.ndarray = POINT_COORDINATES,
+        function_space: Optional[dlfn.FunctionSpace] = None,
+    ):
+        """
+        Reduced model of the floor heating segment based on superposition. For a fixed mesh, fixed materials and fixed
+        heat transfer coefficients the temperature field depends linearly on the external temperatures of the
+        NCC_BOUNDARIES and on the heat fluxes of the NEUMANN_BOUNDARIES. The basis stores one unit-response per
+        boundary quantity:
+            - names: boundary name of each quantity (NCC boundaries first, then the Neumann boundaries)
+            - basis: (n_quantities, n_dofs) array of the unit-response solution vectors
+            - probe_matrix: (n_points, n_quantities) array of the unit-responses evaluated at the points
+            - floor_integrals: integral of each unit-response over the floor surface
+            - floor_area: area (length in 2D) of the floor surface
+            - floor_heat_transfer_coefficient: heat transfer coefficient of the floor surface
+            - reference_values: the boundary values the basis was computed for, used for unspecified quantities
+        Use ResponseBasis.compute to create a basis and 'save'/'load' to store it.
+        :param function_space: The function space of the unit-responses, only required to create dolfin.Functions
+        """
+        self.names = list(names)
+        self.basis = basis
+        self.probe_matrix = probe_matrix
+        self.floor_integrals = floor_integrals
+        self.floor_area = floor_area
+        self.floor_heat_transfer_coefficient = floor_heat_transfer_coefficient
+        self.reference_values = reference_values
+        self.points = points
+        self.function_space = function_space
+        self.floor_index = self.names.index(FLOOR_SURFACE)
+
+    @classmethod
+    def compute(
+        cls,
+        solver: Solver,
+        ncc_boundaries: Dict[str, NCC_BOUNDARY] = NCC_BOUNDARIES,
+        neumann_boundaries: Dict[str, NEUMANN_BOUNDARY] = NEUMANN_BOUNDARIES,
+        points: np.ndarray = POINT_COORDINATES,
+    ):
+        """
+        Compute one unit-response per boundary quantity with the factorized system of the solver, i.e. a single matrix
+        factorization and one right hand side per quantity.
+        :param solver: The solver holding the mesh, the function space and the material assignment
+        :param ncc_boundaries: The heat transfer coefficients are kept fixed, the temperatures are the reference values
+        :param neumann_boundaries: The fluxes are the reference values
+        :param points: The probe coordinates
+        :return: ResponseBasis
+        """
+        if FLOOR_SURFACE not in ncc_boundaries:
+            raise ValueError("The floor surface " + FLOOR_SURFACE + " has to be a Newton Cooling Condition boundary")
+        ncc_names = list(ncc_boundaries.keys())
+        neumann_names = list(neumann_boundaries.keys())
+
+        # Unit temperature on one NCC boundary and zero on all other boundaries
+        ncc_scenarios, neumann_scenarios = list(), list()
+        zero_neumann = {name: NEUMANN_BOUNDARY(delta_q=0.0) for name in neumann_names}
+        for name in ncc_names:
+            ncc_scenarios.append(
+                {
+                    boundary: NCC_BOUNDARY(
+                        external_temperature=float(boundary == name),
+                        heat_transfer_coefficient=value.heat_transfer_coefficient,
+                    )
+                    for boundary, value in ncc_boundaries.items()
+                }
+            )
+            neumann_scenarios.append(zero_neumann)
+        # Unit flux on one Neumann boundary and zero temperature on all NCC boundaries
+        zero_ncc = {
+            boundary: NCC_BOUNDARY(external_temperature=0.0, heat_transfer_coefficient=value.heat_transfer_coefficient)
+            for boundary, value in ncc_boundaries.items()
+        }
+        for name in neumann_names:
+            ncc_scenarios.append(zero_ncc)
+            neumann_scenarios.append(
+                {boundary: NEUMANN_BOUNDARY(delta_q=float(boundary == name)) for boundary in neumann_names}
+            )
+
+        solver.setup_linear_system(ncc_boundaries=ncc_boundaries, neumann_boundaries=neumann_boundaries)
+        responses = solver.solve_batch(ncc_scenarios, neumann_scenarios)
+
+        mesh = solver.mesh
+        dA = mesh.dA(subdomain_id=mesh.facet_marker_map[FLOOR_SURFACE])
+        basis = np.array([response.vector().get_local() for response in responses])
+        probe_matrix = Probe(solver.function_space, points).evaluate_vector(basis.T)
+        floor_integrals = np.array([dlfn.assemble(response * dA) for response in responses])
+        floor_area = dlfn.assemble(dlfn.Constant(1.0) * dA)
+        reference_values = np.array(
+            [ncc_boundaries[name].external_temperature for name in ncc_names]
+            + [neumann_boundaries[name].delta_q for name in neumann_names],
+            dtype=float,
+        )
+        return cls(
+            names=ncc_names + neumann_names,
+            basis=basis,
+            probe_matrix=probe_matrix,
+            floor_integrals=floor_integrals,
+            floor_area=floor_area,
+            floor_heat_transfer_coefficient=float(ncc_boundaries[FLOOR_SURFACE].heat_transfer_coefficient),
+            reference_values=reference_values,
+            points=points,
+            function_space=solver.function_space,
+        )
+
+    def coefficients(self, values: Optional[Dict[str, float]] = None):
+        """
+        Assemble the coefficient vector of the linear combination
+        :param values: Dict[BOUNDARY_NAME <-> external temperature or Neumann flux], unspecified boundaries keep their
+            reference value
+        :return: np.ndarray
+        """
+        c = self.reference_values.copy()
+        if values:
+            for name, value in values.items():
+                c[self.names.index(name)] = value
+        return c
+
+    def field_vector(self, values: Optional[Dict[str, float]] = None):
+        """
+        :return: The solution vector of the temperature field
+        """
+        return self.coefficients(values) @ self.basis
+
+    def field(self, values: Optional[Dict[str, float]] = None):
+        """
+        :return: The temperature field as dolfin.Function
+        """
+        assert self.function_space is not None, "The function space is required to create a Function"
+        w = dlfn.Function(self.function_space)
+        w.vector().set_local(self.field_vector(values))
+        w.vector().apply("insert")
+        return w
+
+    def probe_values(self, values: Optional[Dict[str, float]] = None):
+        """
+        :return: The temperatures at the points
+        """
+        return self.probe_matrix @ self.coefficients(values)
+
+    def mean_surface_temperature(self, values: Optional[Dict[str, float]] = None):
+        return self.floor_integrals @ self.coefficients(values) / self.floor_area
+
+    def floor_heat_flux(self, values: Optional[Dict[str, float]] = None):
+        """
+        :return: The heat flux through the floor surface according to the Newton Cooling Condition
+        """
+        c = self.coefficients(values)
+        return self.floor_heat_transfer_coefficient * (self.floor_integrals @ c - c[self.floor_index] * self.floor_area)
+
+    def save(self, filename="response_basis.npz"):
+        np.savez(
+            filename,
+            names=np.array(self.names),
+            basis=self.basis,
+            probe_matrix=self.probe_matrix,
+            floor_integrals=self.floor_integrals,
+            floor_area=self.floor_area,
+            floor_heat_transfer_coefficient=self.floor_heat_transfer_coefficient,
+            reference_values=self.reference_values,
+            points=self.points,
+        )
+
+    @classmethod
+    def load(cls, filename="response_basis.npz", function_space: Optional[dlfn.FunctionSpace] = None):
+        """
+        Load a stored basis; the function space has to be created from the same mesh if full fields are needed.
+        """
+        data = np.load(filename)
+        if function_space is not None:
+            assert function_space.dim() == data["basis"].shape[1], "The function space does not match the basis"
+        return cls(
+            names=[str(name) for name in data["names"]],
+            basis=data["basis"],
+            probe_matrix=data["probe_matrix"],
+            floor_integrals=data["floor_integrals"],
+            floor_area=float(data["floor_area"]),
+            floor_heat_transfer_coefficient=float(data["floor_heat_transfer_coefficient"]),
+            reference_values=data["reference_values"],
+            points=data["points"],
+            function_space=function_space,
+        )
+
+
+def main(args):
+    use_form_cache()
+    geo_file = args[1] if len(args) > 1 else GEO_FILE
+    mesh = Mesh(geo_file)
+    solver = Solver(mesh, create_function_space(mesh), DIRICHLET_BOUNDARIES)
+    print("COMPUTE RESPONSE BASIS")
+    response_basis = ResponseBasis.compute(solver)
+    response_basis.save()
+    for supply_temperature in (35.0, 45.0, 55.0):
+        values = {"Hot Inlet": supply_temperature, "Cold Outlet": supply_temperature - 5.0}
+        print(
+            "SUPPLY TEMPERATURE {0:.1f}: FLOOR HEAT FLUX {1:.4e}, MEAN SURFACE TEMPERATURE {2:.2f}".format(
+                supply_temperature,
+                response_basis.floor_heat_flux(values),
+                response_basis.mean_surface_temperature(values),
+            )
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,30 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# The scripts of the case study are imported as top-level modules, pytest puts this directory on the path, e.g.,
+# python3 -m pytest case_study/test_parameter_sweep.py
+import pytest
+
+from case_study import NCC_BOUNDARIES
+from parameter_sweep import SCENARIO, get_material_table, get_subdomains
+
+
+def test_scenario_with_new_material():
+    # A material which is only defined by the conductivities of the scenario
+    scenario = SCENARIO("wet", "coarse", dict(NCC_BOUNDARIES), {"Floorboarding": "linoleum"}, {"linoleum": 0.17})
+    subdomains = get_subdomains(scenario)
+    material_table = get_material_table(scenario)
+    assert subdomains["Floorboarding"].material == "linoleum"
+    assert material_table["linoleum"] == 0.17
+    assert all(material.material in material_table for material in subdomains.values())
+
+
+def test_scenario_with_undefined_material():
+    scenario = SCENARIO("wet", "coarse", dict(NCC_BOUNDARIES), {"Floorboarding": "linoleum"}, dict())
+    with pytest.raises(ValueError):
+        get_subdomains(scenario)
+
+
+if __name__ == "__main__":
+    test_scenario_with_new_material()
+    test_scenario_with_undefined_material()
@@ -0,0 +1,343 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# General imports
+import json
+import os.path
+import sys
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
+import dolfin as dlfn
+
+from case_study import (
+    Mesh,
+    Material,
+    Solver,
+    NCC_BOUNDARY,
+    NCC_BOUNDARIES,
+    NEUMANN_BOUNDARY,
+    NEUMANN_BOUNDARIES,
+    DIRICHLET_BOUNDARIES,
+    POINT_COORDINATES,
+    FLOOR_SURFACE,
+    GEO_FILE,
+    LINEAR_SOLVER,
+    DEFAULT_LINEAR_SOLVER,
+    create_function_space,
+    use_form_cache,
+)
+from utils.parallel import is_root, root_print
+from utils.probe import Probe
+
+# The path of the external library is added by utils.generate_grid
+from bdf_time_stepping import BDFTimeStepping
+from instrumentation import instrumentation
+
+ROOM_TEMPERATURES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "room_temperatures.json")
+
+# Volumetric heat capacities rho * c_p in J / (m^3 K)
+VOLUMETRIC_HEAT_CAPACITIES = {
+    "copper": 3.45e6,
+    "aluminum": 2.42e6,
+    "screed": 2.0e6,
+    "concrete": 2.2e6,
+    "wood": 1.7e6,
+    "polystyrene": 4.2e4,
+    "pur_alukaschiert": 4.2e4,
+    "cork": 2.2e5,
+    "tile": 1.7e6,
+    "air": 1.2e3,
+    "EPS": 2.9e4,
+}
+
+# Length of one unit of the mesh coordinates in m, the meshes are given in mm
+MESH_LENGTH_UNIT = 1e-3
+
+# Boundary values as a function of time: t -> (Dict[BOUNDARY_NAME <-> NCC_BOUNDARY],
+#                                               Dict[BOUNDARY_NAME <-> NEUMANN_BOUNDARY])
+BOUNDARY_VALUES = Callable[[float], Tuple[Dict[str, NCC_BOUNDARY], Dict[str, NEUMANN_BOUNDARY]]]
+
+
+class TransientSolver(Solver):
+    def __init__(
+        self,
+        mesh: Mesh,
+        function_space: dlfn.FunctionSpace,
+        dirichlet_boundaries: Dict,
+        subdomains: Optional[Dict[str, Material]] = None,
+        material_table: Optional[Dict[str, float]] = None,
+        heat_capacity_table: Optional[Dict[str, float]] = None,
+        linear_solver: LINEAR_SOLVER = DEFAULT_LINEAR_SOLVER,
+        length_unit: float = MESH_LENGTH_UNIT,
+    ):
+        """
+        Solver of the instationary heat equation rho c_p dT/dt - div(k grad T) = 0 with the boundary conditions of the
+        Solver class. The time derivative is discretized with the BDF scheme of the external library:
+            - the mass matrix M and the stiffness matrix K (including the NCC terms) are assembled once
+            - the system matrix alpha_0 / dt * M + K is only rebuilt and factorized if alpha_0 / dt changes
+            - the right hand side is linear in the boundary values, it is combined from unit load vectors which are
+              assembled once, hence a time step requires no assembly at all
+        Time is measured in s; the mass term is scaled by length_unit ** 2 as the mesh coordinates are not given in m.
+        :param heat_capacity_table: A dict of the volumetric heat capacities of the materials, defaults to
+            VOLUMETRIC_HEAT_CAPACITIES
+        """
+        super().__init__(
+            mesh,
+            function_space,
+            dirichlet_boundaries,
+            subdomains=subdomains,
+            material_table=material_table,
+            linear_solver=linear_solver,
+        )
+        self.heat_capacity_table = dict(
+            VOLUMETRIC_HEAT_CAPACITIES if heat_capacity_table is None else heat_capacity_table
+        )
+        self.length_unit = length_unit
+        self.heat_capacity = dlfn.Function(self.conductivity.function_space())
+        self.heat_capacity.rename("rho_c", "Volumetric Heat Capacity")
+        self.heat_capacity.vector().set_local(self.get_cellwise_values(self.heat_capacity_table))
+        self.heat_capacity.vector().apply("insert")
+        # Matrices and load vectors of the transient system
+        self.mass_matrix = None
+        self.stiffness_matrix = None
+        self.source_vector = None
+        self.load_vectors = None
+        self.time_coefficient = None
+        self.n_factorizations = 0
+        # Vectors of the floor surface integral, used for the time series
+        self.floor_vector = None
+        self.floor_area = None
+
+    def setup_transient_system(
+        self,
+        ncc_boundaries: Optional[Dict[str, NCC_BOUNDARY]] = None,
+        neumann_boundaries: Optional[Dict[str, NEUMANN_BOUNDARY]] = None,
+    ):
+        """
+        Assemble the mass and the stiffness matrix and one load vector per boundary quantity. The heat transfer
+        coefficients are fixed by this call, the temperatures and fluxes may change in every time step.
+        :param ncc_boundaries: The initial values of the Newton Cooling Condition boundaries
+        :param neumann_boundaries: The initial values of the Neumann boundaries
+        :return:
+        """
+        lhs, rhs = self.create_boundary_constants(ncc_boundaries, neumann_boundaries)
+        self.stiffness_matrix = dlfn.PETScMatrix()
+        dlfn.assemble(lhs, tensor=self.stiffness_matrix)
+        self.mass_matrix = dlfn.PETScMatrix()
+        length_scale = dlfn.Constant(self.length_unit ** 2)
+        dlfn.assemble(length_scale * self.heat_capacity * self.u * self.v * self.mesh.dV, tensor=self.mass_matrix)
+
+        # Load vectors: b = b_0 + sum_j value_j * b_j, where b_j is the response to a unit value of quantity j
+        constants = [value.external_temperature for value in self.ncc_constants.values()]
+        constants += [value.delta_q for value in self.neumann_constants.values()]
+        names = list(self.ncc_constants.keys()) + list(self.neumann_constants.keys())
+        values = [float(c) for c in constants]
+        for c in constants:
+            c.assign(0.0)
+        self.source_vector = dlfn.assemble(rhs)
+        self.load_vectors = dict()
+        for name, c in zip(names, constants):
+            c.assign(1.0)
+            self.load_vectors[name] = dlfn.assemble(rhs) - self.source_vector
+            c.assign(0.0)
+        for c, value in zip(constants, values):
+            c.assign(value)
+
+        floor_id = self.mesh.facet_marker_map[FLOOR_SURFACE]
+        self.floor_vector = dlfn.assemble(self.v * self.mesh.dA(subdomain_id=floor_id))
+        self.floor_area = dlfn.assemble(dlfn.Constant(1.0) * self.mesh.dA(subdomain_id=floor_id))
+        self.time_coefficient = None
+        self.matrix_outdated = False
+
+    def create_linear_solver(self, system_matrix: dlfn.PETScMatrix):
+        # The dirichlet bcs are applied unsymmetrically to the transient system, which rules out CG
+        if self.dirichlet_bcs and not self.use_direct_solver():
+            return dlfn.PETScLUSolver(system_matrix)
+        return super().create_linear_solver(system_matrix)
+
+    def assemble_transient_matrix(self, time_coefficient: float):
+        """
+        Build the system matrix time_coefficient * M + K and a new linear solver for it
+        :param time_coefficient: alpha_0 / dt of the BDF scheme
+        :return:
+        """
+        with instrumentation.span("matrix_assembly"):
+            self.system_matrix = self.stiffness_matrix.copy()
+            self.system_matrix.axpy(time_coefficient, self.mass_matrix, True)
+            for bc in self.dirichlet_bcs:
+                bc.apply(self.system_matrix)
+        self.linear_solver = self.create_linear_solver(self.system_matrix)
+        self.time_coefficient = time_coefficient
+        self.n_factorizations += 1
+
+    def assemble_transient_rhs(self, history: dlfn.PETScVector):
+        """
+        Combine the right hand side of a time step from the load vectors of the current boundary values
+        :param history: sum_i alpha_i / dt * T^(n + 1 - i) of the previous solutions
+        :return:
+        """
+        with instrumentation.span("rhs_assembly"):
+            self.rhs_vector = self.source_vector.copy()
+            for name, value in self.ncc_constants.items():
+                self.rhs_vector.axpy(float(value.external_temperature), self.load_vectors[name])
+            for name, value in self.neumann_constants.items():
+                self.rhs_vector.axpy(float(value.delta_q), self.load_vectors[name])
+            self.rhs_vector.axpy(-1.0, self.mass_matrix * history)
+            for bc in self.dirichlet_bcs:
+                bc.apply(self.rhs_vector)
+
+    def solve_transient(
+        self,
+        time_stepping: BDFTimeStepping,
+        boundary_values: BOUNDARY_VALUES,
+        initial_temperature: float,
+        points: np.ndarray = POINT_COORDINATES,
+        sample_interval: float = 0.0,
+    ):
+        """
+        Run the time loop from the current time of time_stepping until its end time
+        :param time_stepping: The time discretization, the step size may be modified in between the steps
+        :param boundary_values: The boundary values as a function of time, see BOUNDARY_VALUES
+        :param initial_temperature: Uniform temperature at the start time
+        :param points: The probe coordinates sampled into the time series
+        :param sample_interval: Minimum time between two samples, 0 samples every step
+        :return: The time series as Dict of numpy arrays, see 'save_time_series'
+        """
+        ncc_boundaries, neumann_boundaries = boundary_values(time_stepping.current_time)
+        if self.mass_matrix is None:
+            self.setup_transient_system(ncc_boundaries, neumann_boundaries)
+        probe = Probe(self.function_space, points)
+
+        self.w.vector().set_local(np.full(self.w.vector().local_size(), float(initial_temperature)))
+        self.w.vector().apply("insert")
+        n_levels = time_stepping.n_levels(derivative=1)
+        old_solutions = [self.w.vector().copy() for _ in range(n_levels)]
+        history = self.w.vector().copy()
+
+        samples = list()
+        self.sample(samples, time_stepping.current_time, probe)
+        while not time_stepping.is_at_end():
+            instrumentation.begin_step(time_stepping.step_number, time_stepping.current_time)
+            time_stepping.update_coefficients()
+            alpha = time_stepping.coefficients(derivative=1)
+            step_size = time_stepping.get_next_step_size()
+            instrumentation.record(step_size=step_size)
+
+            # Refactorize only if the leading coefficient or the step size changed
+            if self.time_coefficient != alpha[0] / step_size:
+                self.assemble_transient_matrix(alpha[0] / step_size)
+
+            ncc_boundaries, neumann_boundaries = boundary_values(time_stepping.next_time)
+            self.update_boundary_values(ncc_boundaries, neumann_boundaries)
+            if self.matrix_outdated:
+                raise ValueError("The heat transfer coefficients must not change during a transient simulation")
+
+            history.zero()
+            for coefficient, old_solution in zip(alpha[1:], old_solutions):
+                history.axpy(coefficient / step_size, old_solution)
+            self.assemble_transient_rhs(history)
+            # The previous solution is the initial guess of a Krylov solver
+            self.linear_solver = self.solve_linear_system(self.linear_solver, self.system_matrix, self.rhs_vector)
+
+            old_solutions = [self.w.vector().copy()] + old_solutions[:-1]
+            time_stepping.advance_time()
+            if time_stepping.is_at_end() or time_stepping.current_time - samples[-1]["time"] >= sample_interval:
+                with instrumentation.span("sampling"):
+                    self.sample(samples, time_stepping.current_time, probe)
+            instrumentation.end_step()
+
+        return {key: np.array([sample[key] for sample in samples]) for key in samples[0]}
+
+    def sample(self, samples, time, probe: Probe):
+        """
+        Append the probe values, the mean floor surface temperature and the heat flux through the floor to samples
+        """
+        floor = self.ncc_constants[FLOOR_SURFACE]
+        floor_integral = self.floor_vector.inner(self.w.vector())
+        samples.append(
+            {
+                "time": time,
+                "probe_values": probe(self.w),
+                "mean_surface_temperature": floor_integral / self.floor_area,
+                "floor_heat_flux": float(floor.heat_transfer_coefficient)
+                * (floor_integral - float(floor.external_temperature) * self.floor_area),
+                "room_temperature": float(floor.external_temperature),
+            }
+        )
+
+
+def save_time_series(time_series: Dict[str, np.ndarray], filename="time_series.npz", points=POINT_COORDINATES):
+    """
+    Store a time series as a single npz file with one array per quantity, the sampled values are identical on all
+    processes and written by the root process
+    """
+    if is_root():
+        np.savez_compressed(filename, points=points, **time_series)
+
+
+def load_room_temperatures(filename=ROOM_TEMPERATURES_FILE):
+    with open(filename, "r") as file:
+        return {name: float(value) for name, value in json.load(file).items()}
+
+
+def daily_schedule(
+    room_temperatures: Dict[str, float],
+    ncc_boundaries: Dict[str, NCC_BOUNDARY] = NCC_BOUNDARIES,
+    neumann_boundaries: Dict[str, NEUMANN_BOUNDARY] = NEUMANN_BOUNDARIES,
+    day_start: float = 6.0,
+    night_start: float = 22.0,
+):
+    """
+    Day/night setback of the room above the floor: the room temperature is "living_room_min" during the day and
+    "minimum_temp_night" during the night, the heating circuit keeps the values of ncc_boundaries.
+    :param room_temperatures: The content of room_temperatures.json
+    :param day_start: Hour of the day at which the day temperature starts
+    :param night_start: Hour of the day at which the night temperature starts
+    :return: BOUNDARY_VALUES
+    """
+    floor = ncc_boundaries[FLOOR_SURFACE]
+
+    def boundary_values(time):
+        hour = (time / 3600.0) % 24.0
+        if day_start <= hour < night_start:
+            room_temperature = room_temperatures["living_room_min"]
+        else:
+            room_temperature = room_temperatures["minimum_temp_night"]
+        values = dict(ncc_boundaries)
+        values[FLOOR_SURFACE] = NCC_BOUNDARY(
+            external_temperature=room_temperature, heat_transfer_coefficient=floor.heat_transfer_coefficient
+        )
+        return values, neumann_boundaries
+
+    return boundary_values
+
+
+def main(args):
+    use_form_cache()
+    geo_file = args[1] if len(args) > 1 else GEO_FILE
+    mesh = Mesh(geo_file)
+    solver = TransientSolver(mesh, create_function_space(mesh), DIRICHLET_BOUNDARIES)
+    room_temperatures = load_room_temperatures()
+
+    # Heat-up from the night temperature followed by two days with night setback
+    time_stepping = BDFTimeStepping(0.0, 48.0 * 3600.0, order=2, desired_start_time_step=300.0)
+    root_print("RUNNING A TRANSIENT SIMULATION OF 48 h")
+    time_series = solver.solve_transient(
+        time_stepping,
+        daily_schedule(room_temperatures),
+        initial_temperature=room_temperatures["minimum_temp_night"],
+        sample_interval=900.0,
+    )
+    save_time_series(time_series)
+    root_print(
+        "FINISHED {0} TIME STEPS WITH {1} FACTORIZATIONS".format(time_stepping.step_number, solver.n_factorizations)
+    )
+    if instrumentation.enabled:
+        # Switched on by the environment variable NS_INSTRUMENTATION=1
+        root_print(instrumentation.summary())
+        if is_root():
+            instrumentation.to_csv("time_steps.csv")
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,65 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# General imports
+import os.path
+import sys
+import time
+from typing import List, Optional
+
+import dolfin as dlfn
+
+from case_study import (
+    Mesh,
+    NCC_BOUNDARIES,
+    NEUMANN_BOUNDARIES,
+    DIRICHLET_BOUNDARIES,
+    create_function_space,
+    use_form_cache,
+)
+from parameter_sweep import GEOMETRIES
+from transient_simulation import TransientSolver
+
+# The path of the external library is added by utils.generate_grid
+from form_cache import set_form_cache_dir, warm_up_solvers
+
+
+def warm_up_case_study(geometries: Optional[List[str]] = None, refinement="coarse", mesh_dir="meshes"):
+    """
+    Compile all forms of the stationary and the transient solver and of the post-processing for every geometry. The
+    compiled forms only depend on the element and the weak form, hence the coarsest mesh is sufficient.
+    :param geometries: Keys of GEOMETRIES, defaults to all
+    :param refinement: The refinement level whose meshes are loaded
+    :param mesh_dir:
+    :return: List of the geometries and the wall times
+    """
+    geometries = list(GEOMETRIES.keys()) if geometries is None else geometries
+    timings = list()
+    for geometry in geometries:
+        start = time.perf_counter()
+        mesh = Mesh(os.path.join(mesh_dir, refinement, GEOMETRIES[geometry]))
+        solver = TransientSolver(mesh, create_function_space(mesh), DIRICHLET_BOUNDARIES)
+        solver.setup_linear_system(NCC_BOUNDARIES, NEUMANN_BOUNDARIES)
+        solver.get_post_processor()
+        solver.setup_transient_system(NCC_BOUNDARIES, NEUMANN_BOUNDARIES)
+        timings.append((geometry, time.perf_counter() - start))
+    return timings
+
+
+def main(args):
+    """
+    Usage: python3 warm_up.py [CACHE_DIR]
+    Fill the form cache such that the first solve of every new process only loads the compiled forms
+    """
+    cache_dir = set_form_cache_dir(args[1], overwrite=True) if len(args) > 1 else use_form_cache()
+    dlfn.set_log_level(50)
+    print("COMPILING FORMS INTO {0}".format(cache_dir))
+    for geometry, wall_time in warm_up_case_study():
+        print("{0:>22} {1:>3}: {2:8.2f} s".format("case study", geometry, wall_time))
+    for name, space_dim, form_convective_term, wall_time in warm_up_solvers():
+        print("{0:>22} {1}D {2:>14}: {3:8.2f} s".format(name, space_dim, form_convective_term, wall_time))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -8,11 +8,15 @@ from grid_generator import hyper_cube
 from grid_generator import HyperCubeBoundaryMarkers
 from math import ceil
 from ns_bdf_solver import ImplicitBDFSolver
+from ns_imex_solver import IMEXSolver
 from ns_solver_base import PressureBCType
 from ns_problem import InstationaryProblem
+import sys
+import time
 dlfn.set_log_level(30)
 Re = 100.0
 gamma = 2.0 * dlfn.pi
+solver_classes = {"bdf": ImplicitBDFSolver, "imex": IMEXSolver}
 
 
 class PeriodicDomain(dlfn.SubDomain):
@@ -47,7 +51,7 @@ class PeriodicDomain(dlfn.SubDomain):
 
 
 class TaylorGreenVortex(InstationaryProblem):
-    def __init__(self, time_step, main_dir=None):
+    def __init__(self, time_step, SolverClass=ImplicitBDFSolver, main_dir=None):
         end_time = 1.0
         n_max_steps = ceil(end_time / time_step)
         super().__init__(main_dir, start_time=0.0, end_time=end_time,
@@ -56,7 +60,7 @@ class TaylorGreenVortex(InstationaryProblem):
         self._n_points = None
         self._output_frequency = 0
         self._postprocessing_frequency = 1
-        self.set_solver_class(ImplicitBDFSolver)
+        self.set_solver_class(SolverClass)
 
     @property
     def n_points(self):
@@ -120,6 +124,9 @@ class TaylorGreenVortex(InstationaryProblem):
 
 
 if __name__ == "__main__":
+    # usage: python3 taylor_green_vortex.py [bdf|imex]
+    solver_name = sys.argv[1] if len(sys.argv) > 1 else "bdf"
+    assert solver_name in solver_classes
     errors = {"pressure": [], "velocity": []}
     initial_time_step = 1.0
     time_step_reduction_factor = 0.5
@@ -128,14 +135,19 @@ if __name__ == "__main__":
     for i in range(n_levels):
         time_step = initial_time_step * time_step_reduction_factor**i
         time_step_sizes[i] = time_step
-        taylor_green = TaylorGreenVortex(time_step)
+        taylor_green = TaylorGreenVortex(time_step, solver_classes[solver_name])
         taylor_green.n_points = 128
+        start = time.perf_counter()
         taylor_green.solve_problem()
+        wall_time = time.perf_counter() - start
         taylor_green.compute_error()
         print(errors)
+        print("{0}: {1} steps in {2:.2f} s, {3:.2f} steps per second".format(
+            solver_name, taylor_green._time_stepping.step_number, wall_time,
+            taylor_green._time_stepping.step_number / wall_time))
     for key in errors:
         plt.figure()
         plt.loglog(time_step_sizes, errors[key], "x-")
         plt.grid(which="both")
-        plt.savefig(f"convergence_{ key }.pdf", dpi=600)
+        plt.savefig(f"convergence_{ solver_name }_{ key }.pdf", dpi=600)
         plt.loglog(time_step_sizes, errors["velocity"], "x-")
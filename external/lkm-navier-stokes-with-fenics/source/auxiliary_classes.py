@@ -3,6 +3,7 @@
 from dolfin import NonlinearProblem
 from dolfin import SystemAssembler
 from dolfin import Constant
+from dolfin import as_backend_type
 import math
 
 __all__ = ["AngularVelocityVector", "CustomNonlinearProblem",
@@ -119,7 +120,7 @@ class FunctionTime:
 
 class CustomNonlinearProblem(NonlinearProblem):
     """Class for interfacing with not only :py:class:`NewtonSolver`."""
-    def __init__(self, F, bcs, J):
+    def __init__(self, F, bcs, J, nullspace=None):
         """Return subclass of :py:class:`dolfin.NonlinearProblem` suitable
         for :py:class:`NewtonSolver` based on
         :py:class:`field_split.BlockPETScKrylovSolver` and PCD
@@ -132,6 +133,10 @@ class CustomNonlinearProblem(NonlinearProblem):
                 Boundary conditions applied to ``F``, ``J``, and ``J_pc``.
             J (:py:class:`dolfin.Form` or :py:class:`ufl.Form`)
                 Bilinear form representing system Jacobian for the iteration.
+            nullspace (:py:class:`dolfin.VectorSpaceBasis`, optional)
+                Nullspace attached to the assembled Jacobian if the pressure
+                is only determined up to a constant. The residual is
+                orthogonalized against it.
 
         All the arguments should be given on the common mixed function space.
         """
@@ -146,6 +151,7 @@ class CustomNonlinearProblem(NonlinearProblem):
             "J": J
         }
         self._bcs = bcs
+        self._nullspace = nullspace
 
     def get_form(self, key):
         form = self.forms.get(key)
@@ -159,9 +165,13 @@ class CustomNonlinearProblem(NonlinearProblem):
 
     def F(self, b, x):
         self.assembler.assemble(b, x)
+        if self._nullspace is not None:
+            self._nullspace.orthogonalize(b)
 
     def J(self, A, x):
         self.assembler.assemble(A)
+        if self._nullspace is not None:
+            as_backend_type(A).set_nullspace(self._nullspace)
 
 
 class EquationCoefficientHandler:
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+from os import path
+import sys
+import time
+
+__all__ = ["get_form_cache_dir", "set_form_cache_dir", "warm_up_solvers"]
+
+# environment variable of the directory of the compiled forms and expressions
+_CACHE_DIR_VARIABLE = "DIJITSO_CACHE_DIR"
+
+
+def get_form_cache_dir():
+    """Return the directory of the compiled forms or None if the default
+    directory of the form compiler is used."""
+    return os.environ.get(_CACHE_DIR_VARIABLE)
+
+
+def set_form_cache_dir(cache_dir, overwrite=False):
+    """Set up the directory where the just-in-time compiler stores the
+    compiled forms and expressions. The directory is inherited by all
+    worker processes. It must be set before the first form is compiled.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Directory of the compiled forms.
+    overwrite: bool (optional)
+        Replace a directory which is already set, e.g., by the user.
+
+    Returns
+    -------
+    The directory which is in use.
+    """
+    assert isinstance(cache_dir, str)
+    assert isinstance(overwrite, bool)
+    if overwrite or _CACHE_DIR_VARIABLE not in os.environ:
+        os.environ[_CACHE_DIR_VARIABLE] = path.abspath(cache_dir)
+    cache_dir = os.environ[_CACHE_DIR_VARIABLE]
+    if not path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _setup_cavity_solver(SolverClass, space_dim, form_convective_term, time_stepping=None):
+    """Create a solver of a lid-driven cavity with the default discretization."""
+    from auxiliary_classes import EquationCoefficientHandler
+    from grid_generator import hyper_cube
+    from grid_generator import HyperCubeBoundaryMarkers
+    from ns_solver_base import VelocityBCType
+
+    mesh, boundary_markers = hyper_cube(space_dim, 2)
+    if time_stepping is None:
+        solver = SolverClass(mesh, boundary_markers, form_convective_term)
+    else:
+        solver = SolverClass(mesh, boundary_markers, form_convective_term, time_stepping)
+    lid_velocity = (1.0, ) + (space_dim - 1) * (0.0, )
+    walls = ("left", "right", "bottom") if space_dim == 2 else ("left", "right", "bottom", "back", "front")
+    bcs = [(VelocityBCType.no_slip, HyperCubeBoundaryMarkers[name].value, None) for name in walls]
+    bcs.append((VelocityBCType.constant, HyperCubeBoundaryMarkers.top.value, lid_velocity))
+    solver.set_boundary_conditions(bcs)
+    coefficient_handler = EquationCoefficientHandler(Re=1.0)
+    coefficient_handler.close()
+    solver.set_equation_coefficients(coefficient_handler.equation_coefficients)
+    if time_stepping is not None:
+        solver.set_initial_conditions({"velocity": (space_dim * (0.0, ))})
+    return solver
+
+
+def warm_up_solvers(space_dims=(2, 3), form_convective_terms=("standard", )):
+    """Compile the forms of the stationary solver and of all instationary
+    solvers for the default polynomial degrees. The setup of a solver compiles
+    all its forms, afterwards they are loaded from the cache.
+
+    Parameters
+    ----------
+    space_dims: tuple of int (optional)
+        Spatial dimensions of the meshes.
+    form_convective_terms: tuple of str (optional)
+        Weak forms of the convective term, see ``WeakFormConvectiveTerm``.
+
+    Returns
+    -------
+    A list of tuples of the solver name, the spatial dimension, the weak form
+    of the convective term and the wall time of the setup.
+    """
+    from bdf_time_stepping import BDFTimeStepping
+    from imex_time_stepping import IMEXTimeStepping
+    from imex_time_stepping import IMEXType
+    from ns_bdf_solver import ImplicitBDFSolver
+    from ns_imex_solver import IMEXSolver
+    from ns_ipcs_solver import IPCSSolver
+    from ns_solver_base import StationarySolverBase
+
+    timings = []
+    for space_dim in space_dims:
+        assert space_dim in (2, 3)
+        for form_convective_term in form_convective_terms:
+            for SolverClass in (StationarySolverBase, ImplicitBDFSolver, IPCSSolver, IMEXSolver):
+                start = time.perf_counter()
+                if SolverClass is StationarySolverBase:
+                    solver = _setup_cavity_solver(SolverClass, space_dim, form_convective_term)
+                else:
+                    if SolverClass is IMEXSolver:
+                        time_stepping = IMEXTimeStepping(0.0, 1.0, IMEXType.SBDF2, desired_start_time_step=0.1)
+                    else:
+                        time_stepping = BDFTimeStepping(0.0, 1.0, desired_start_time_step=0.1)
+                    time_stepping.update_coefficients()
+                    solver = _setup_cavity_solver(SolverClass, space_dim, form_convective_term,
+                                                  time_stepping)
+                solver._setup_problem()
+                timings.append((SolverClass.__name__, space_dim, form_convective_term,
+                                time.perf_counter() - start))
+    return timings
+
+
+if __name__ == "__main__":  # pragma: no cover
+    if len(sys.argv) > 1:
+        set_form_cache_dir(sys.argv[1], overwrite=True)
+    for name, space_dim, form_convective_term, wall_time in warm_up_solvers():
+        print("{0:>22} {1}D {2:>14}: {3:8.2f} s".format(name, space_dim, form_convective_term, wall_time))
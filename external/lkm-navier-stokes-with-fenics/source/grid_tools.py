@@ -1,20 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import glob
+import hashlib
+import multiprocessing
 import os
-
-import meshio
 from os import path
 import subprocess
 import sys
 
 
-__all__ = ["generate_xdmf_mesh"]
+__all__ = ["generate_xdmf_mesh", "convert_meshes"]
 
 
 def _create_meshio_mesh(mesh, cell_type, prune_z=False):
     """Create a meshio mesh object from a meshio mesh where only cells of
     `cell_type` are taken into account."""
+    import meshio
     # input check
     assert isinstance(mesh, meshio.Mesh)
     assert isinstance(cell_type, str)
@@ -52,50 +52,82 @@ def _create_meshio_mesh(mesh, cell_type, prune_z=False):
     return out_mesh
 
 
-def _locate_file(basename, directory):
-    """Locate a file in the current directory.
-    """
+def _get_geo_hash(geo_file):
+    """Return the sha256 hash of the content of a geo-file."""
+    with open(geo_file, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def _get_output_files(geo_file):
+    """Return the paths of the msh-file, the two xdmf-files and the hash file
+    of a geo-file. All of them are located next to the geo-file."""
+    stem = path.splitext(geo_file)[0]
+    return (stem + ".msh", stem + ".xdmf", stem + "_facet_markers.xdmf",
+            stem + ".geo.sha256")
 
-    if basename in os.listdir(directory):
-        return os.path.join(directory, basename)
 
-    file_extension = path.splitext(basename)[1]
-    files = glob.glob("./*" + file_extension, recursive=True)
-    files += glob.glob("./*/*" + file_extension, recursive=True)
-    files += glob.glob("./*/*/*" + file_extension, recursive=True)
-    file = None
-    for f in files:
-        if basename in f:
-            file = f
-            break
-    if file is not None:
-        assert path.exists(file)
-    return file
+def _read_hash(hash_file):
+    """Return the hash stored in a hash file or None if it does not exist."""
+    if not path.exists(hash_file):
+        return None
+    with open(hash_file, "r") as file:
+        return file.read().strip()
 
 
-def generate_xdmf_mesh(geo_file):
+def is_up_to_date(geo_file):
+    """Check whether the xdmf-files of a geo-file exist and were generated
+    from the current content of the geo-file."""
+    _, xdmf_file, xdmf_facet_marker_file, hash_file = _get_output_files(geo_file)
+    if not all(path.exists(f) for f in (xdmf_file, xdmf_facet_marker_file)):
+        return False
+    return _read_hash(hash_file) == _get_geo_hash(geo_file)
+
+
+def generate_xdmf_mesh(geo_file, data_format="HDF", force=False):
     """Generates two xdmf-files from a geo-file. The two xdmf-files
     contain the mesh and the associated facet markers. Facet markers refer to
     the markers on entities of codimension one.
 
     The mesh is generated by calling gmsh to a generate an msh-file and the two
-    xmdf-files are generated using the meshio package.
+    xmdf-files are generated using the meshio package. All files are written
+    next to the geo-file. With the default data format "HDF" the heavy data is
+    stored in binary h5-files, "XML" stores it inside of the xdmf-files.
+
+    The hash of the geo-file is stored with the output such that nothing is
+    regenerated as long as the geo-file is unchanged, unless `force` is set.
+    The hash is also stored with the msh-file. If gmsh is not available, an
+    existing msh-file is only converted if it was generated from the current
+    content of the geo-file. The output of such a conversion is not marked as
+    up to date.
     """
     # input check
     assert isinstance(geo_file, str)
     assert path.exists(geo_file)
     assert path.splitext(geo_file)[1] == '.geo'
-    basename = path.basename(geo_file)
-    # generate msh file
-    msh_file = _locate_file(basename.replace(".geo", ".msh"), os.path.dirname(geo_file))
-    if msh_file is None:
-        try:  # pragma: no cover
-            subprocess.run(["gmsh", "-v", "0", "-3", geo_file], check=True)
-            msh_file = basename.replace(".geo", ".msh")
-        except subprocess.SubprocessError:  # pragma: no cover
+    assert data_format in ("HDF", "XML")
+    msh_file, xdmf_file, xdmf_facet_marker_file, hash_file = _get_output_files(geo_file)
+    if not force and is_up_to_date(geo_file):
+        return xdmf_file, xdmf_facet_marker_file
+    geo_hash = _get_geo_hash(geo_file)
+    msh_hash_file = msh_file + ".sha256"
+    # generate msh file, an existing msh file may belong to an old version of the geo file
+    try:
+        subprocess.run(["gmsh", "-v", "0", "-3", geo_file, "-o", msh_file], check=True)
+        generated = True
+    except (subprocess.SubprocessError, FileNotFoundError):
+        if not path.exists(msh_file):
             raise RuntimeError("GMSH is not installed on your machine and "
                                "the msh file does not exist.")
-    # read msh file
+        if _read_hash(msh_hash_file) != geo_hash:
+            raise RuntimeError("GMSH is not installed on your machine and "
+                               "the msh file " + msh_file + " is not known "
+                               "to match the current geo file.")
+        generated = False
+    if generated:
+        with open(msh_hash_file, "w") as file:
+            file.write(geo_hash)
+    # read msh file, meshio is only imported if a mesh is actually converted
+    import meshio
     assert path.exists(msh_file), "File: " + msh_file + "; Location: " + os.getcwd()
     mesh = meshio.read(msh_file)
     # determine dimension
@@ -118,15 +150,48 @@ def generate_xdmf_mesh(geo_file):
         cell_type = "tetra"
     # extract facet mesh (codimension one)
     facet_mesh = _create_meshio_mesh(mesh, facet_type, prune_z=prune_z)
-    xdmf_facet_marker_file = msh_file.replace(".msh", "_facet_markers.xdmf")
-    meshio.write(xdmf_facet_marker_file, facet_mesh, data_format="XML")
+    meshio.write(xdmf_facet_marker_file, facet_mesh, data_format=data_format)
     # extract facet mesh (codimension one)
     cell_mesh = _create_meshio_mesh(mesh, cell_type, prune_z=prune_z)
-    xdmf_file = msh_file.replace(".msh", ".xdmf")
-    meshio.write(xdmf_file, cell_mesh, data_format="XML")
+    meshio.write(xdmf_file, cell_mesh, data_format=data_format)
+    # the hash is written last, an interrupted conversion is repeated, the
+    # output of a conversion without gmsh is converted again once gmsh is available
+    if generated:
+        with open(hash_file, "w") as file:
+            file.write(geo_hash)
 
     return xdmf_file, xdmf_facet_marker_file
 
 
+def _convert(args):
+    geo_file, data_format, force = args
+    generate_xdmf_mesh(geo_file, data_format=data_format, force=force)
+    return geo_file
+
+
+def convert_meshes(directory, data_format="HDF", force=False, n_workers=None):
+    """Generates the xdmf-files of all geo-files inside of a directory tree.
+    Geo-files whose xdmf-files are up to date are skipped, the remaining
+    ones are converted in parallel worker processes.
+
+    Returns the list of the converted geo-files.
+    """
+    assert path.isdir(directory)
+    geo_files = list()
+    for root, _, files in os.walk(directory):
+        geo_files += [path.join(root, f) for f in sorted(files) if f.endswith(".geo")]
+    tasks = [(f, data_format, force) for f in geo_files if force or not is_up_to_date(f)]
+    if len(tasks) == 0:
+        return []
+    n_workers = min(n_workers or multiprocessing.cpu_count(), len(tasks))
+    with multiprocessing.Pool(processes=n_workers) as pool:
+        converted = list(pool.imap_unordered(_convert, tasks))
+    return converted
+
+
 if __name__ == "__main__":  # pragma: no cover
-    generate_xdmf_mesh(sys.argv[1])
+    if path.isdir(sys.argv[1]):
+        for f in convert_meshes(sys.argv[1]):
+            print("Converted " + f)
+    else:
+        generate_xdmf_mesh(sys.argv[1])
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import csv
+import json
+import os
+from time import perf_counter
+
+__all__ = ["Instrumentation", "instrumentation"]
+
+
+class _NullSpan:
+    """Span returned while the instrumentation is switched off."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("_instrumentation", "_name", "_start")
+
+    def __init__(self, instrumentation, name):
+        self._instrumentation = instrumentation
+        self._name = name
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._instrumentation._add_timing(self._name, perf_counter() - self._start)
+        return False
+
+
+class Instrumentation:
+    """
+    Class collecting the wall times of named spans and records of the
+    individual time steps.
+
+    Spans are used as context managers, i.e., ``with instrumentation.span("assembly"):``.
+    Nested spans are timed independently such that the time of an inner span
+    is also part of the time of the outer span. While the instrumentation is
+    switched off, ``span`` returns a shared object without any timing and all
+    other methods return immediately.
+
+    Within a time step, which is delimited by ``begin_step`` and ``end_step``,
+    the times of all spans and the values passed to ``record`` are added to
+    the record of the step.
+    """
+    def __init__(self, enabled=False):
+        assert isinstance(enabled, bool)
+        self.enabled = enabled
+        self.reset()
+
+    def _add_timing(self, name, elapsed):
+        timing = self._timings.get(name)
+        if timing is None:
+            self._timings[name] = [1, elapsed, elapsed]
+        else:
+            timing[0] += 1
+            timing[1] += elapsed
+            if elapsed > timing[2]:
+                timing[2] = elapsed
+        if self._step_record is not None:
+            self._step_record[name] = self._step_record.get(name, 0.0) + elapsed
+
+    def begin_step(self, step_number, current_time):
+        """Starts the record of a time step."""
+        if not self.enabled:
+            return
+        self._step_record = {"step": step_number, "time": current_time}
+        self._step_start = perf_counter()
+
+    def disable(self):
+        self.enabled = False
+        self._step_record = None
+
+    def enable(self):
+        self.enabled = True
+
+    def end_step(self):
+        """Completes the record of the current time step by its wall time."""
+        if self._step_record is None:
+            return
+        self._step_record["wall_time"] = perf_counter() - self._step_start
+        self._step_records.append(self._step_record)
+        self._step_record = None
+
+    def record(self, **values):
+        """Adds the values to the record of the current time step."""
+        if self._step_record is None:
+            return
+        self._step_record.update(values)
+
+    def reset(self):
+        """Discards all timings and records."""
+        self._timings = dict()
+        self._step_records = []
+        self._step_record = None
+        self._step_start = None
+
+    def span(self, name):
+        """Returns a context manager timing the enclosed block of code."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def summary(self):
+        """Returns a table of the timings sorted by the total time."""
+        lines = ["{0:<28} {1:>8} {2:>12} {3:>12} {4:>12}".format("span", "calls", "total [s]", "mean [s]",
+                                                                 "max [s]")]
+        for name, timing in sorted(self.timings.items(), key=lambda item: -item[1]["total"]):
+            lines.append("{0:<28} {1:>8d} {2:12.4e} {3:12.4e} {4:12.4e}"
+                         .format(name, timing["calls"], timing["total"], timing["mean"], timing["max"]))
+        return "\n".join(lines)
+
+    def to_csv(self, fname):
+        """Writes the records of the time steps to a csv file."""
+        assert isinstance(fname, str)
+        fieldnames = []
+        for step_record in self._step_records:
+            for key in step_record:
+                if key not in fieldnames:
+                    fieldnames.append(key)
+        with open(fname, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames, restval="")
+            writer.writeheader()
+            writer.writerows(self._step_records)
+
+    def to_json(self, fname):
+        """Writes the timings and the records of the time steps to a json file."""
+        assert isinstance(fname, str)
+        with open(fname, "w") as file:
+            json.dump({"timings": self.timings, "steps": self._step_records}, file, indent=2)
+
+    @property
+    def step_records(self):
+        return self._step_records
+
+    @property
+    def timings(self):
+        return {name: {"calls": calls, "total": total, "mean": total / calls, "max": maximum}
+                for name, (calls, total, maximum) in self._timings.items()}
+
+
+# global instance used by the solvers and problems, it is switched on by setting
+# the environment variable NS_INSTRUMENTATION to a value other than "0"
+instrumentation = Instrumentation(os.environ.get("NS_INSTRUMENTATION", "0") != "0")
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import dolfin as dlfn
+from enum import Enum, auto
+import importlib.util
+import numpy as np
+
+__all__ = ["LinearSolverType", "create_pressure_nullspace", "create_krylov_solver",
+           "create_lu_solver", "create_saddle_point_solver", "get_amg_preconditioner"]
+
+
+class LinearSolverType(Enum):
+    """
+    Solvers of the linear systems:
+        - direct: sparse LU factorization, the memory grows superlinearly with
+          the number of DoFs,
+        - iterative: Krylov methods with algebraic multigrid, the P2-P1
+          saddle-point systems are preconditioned by a block factorization
+          with a Schur complement approximation.
+    """
+    direct = auto()
+    iterative = auto()
+
+
+# relative tolerance of the Krylov methods
+_RELATIVE_TOLERANCE = 1.0e-10
+# maximum number of iterations of the Krylov methods
+_MAXIMUM_ITERATIONS = 1000
+
+
+def _has_petsc4py():
+    return importlib.util.find_spec("petsc4py") is not None
+
+
+def get_amg_preconditioner():
+    """Return the algebraic multigrid preconditioner, BoomerAMG of hypre if
+    PETSc was built with hypre and the native GAMG otherwise."""
+    if dlfn.has_krylov_solver_preconditioner("hypre_amg"):
+        return "hypre_amg"
+    return "petsc_amg"
+
+
+def _set_amg_options(prefix):
+    """Set the PETSc options of an algebraic multigrid preconditioner."""
+    if get_amg_preconditioner() == "hypre_amg":
+        dlfn.PETScOptions.set(prefix + "pc_type", "hypre")
+        dlfn.PETScOptions.set(prefix + "pc_hypre_type", "boomeramg")
+    else:
+        dlfn.PETScOptions.set(prefix + "pc_type", "gamg")
+
+
+def create_pressure_nullspace(space, pressure_index=None):
+    """Create the basis of the nullspace of a system in which the pressure is
+    only determined up to a constant, i.e., the saddle-point system of a
+    constant pressure and a vanishing velocity or the pressure Poisson
+    equation of a constant pressure.
+
+    Parameters
+    ----------
+    space: dolfin.FunctionSpace
+        Joint function space of the velocity and the pressure or function
+        space of the pressure.
+    pressure_index: int (optional)
+        Index of the pressure subspace of a joint function space.
+
+    Returns
+    -------
+    The normalized basis as a dolfin.VectorSpaceBasis.
+    """
+    assert isinstance(space, dlfn.FunctionSpace)
+    null_vector = dlfn.Function(space).vector()
+    if pressure_index is None:
+        assert space.num_sub_spaces() == 0
+        null_vector[:] = 1.0
+    else:
+        assert isinstance(pressure_index, int)
+        first, _ = null_vector.local_range()
+        values = np.zeros(null_vector.local_size())
+        pressure_dofs = np.asarray(space.sub(pressure_index).dofmap().dofs(), dtype=np.int64)
+        values[pressure_dofs - first] = 1.0
+        null_vector.set_local(values)
+        null_vector.apply("insert")
+    null_vector *= 1.0 / null_vector.norm("l2")
+    return dlfn.VectorSpaceBasis([null_vector])
+
+
+def create_lu_solver(comm, prefix, singular=False):
+    """Create a direct solver.
+
+    Parameters
+    ----------
+    comm: MPI communicator
+    prefix: str
+        Prefix of the PETSc options of the solver, the options of the LU
+        solver are set under `prefix + "lu_"` such that they are separate from
+        the options of an iterative solver with the same prefix.
+    singular: bool (optional)
+        If True, the matrix has a nullspace and MUMPS is used with the
+        detection of null pivots, if available.
+
+    Returns
+    -------
+    The dolfin.PETScLUSolver.
+    """
+    assert isinstance(prefix, str)
+    if not singular or not dlfn.has_lu_solver_method("mumps"):
+        return dlfn.PETScLUSolver(comm)
+    prefix += "lu_"
+    solver = dlfn.PETScLUSolver(comm, "mumps")
+    solver.set_options_prefix(prefix)
+    options = {"ksp_type": "preonly",
+               "pc_type": "lu",
+               "pc_factor_mat_solver_type": "mumps",
+               "mat_mumps_icntl_24": 1}
+    for key, value in options.items():
+        dlfn.PETScOptions.set(prefix + key, value)
+    solver.set_from_options()
+    return solver
+
+
+def create_krylov_solver(comm, method, preconditioner, prefix):
+    """Create a Krylov solver of a single-field system.
+
+    Parameters
+    ----------
+    comm: MPI communicator
+    method: str
+        Krylov method, e.g., "cg" or "gmres".
+    preconditioner: str
+        Preconditioner, "amg" selects the available algebraic multigrid.
+    prefix: str
+        Prefix of the PETSc options of the solver.
+
+    Returns
+    -------
+    The dolfin.PETScKrylovSolver.
+    """
+    assert isinstance(method, str)
+    assert isinstance(preconditioner, str)
+    assert isinstance(prefix, str)
+    if preconditioner == "amg":
+        preconditioner = get_amg_preconditioner()
+    solver = dlfn.PETScKrylovSolver(comm, method, preconditioner)
+    solver.set_options_prefix(prefix)
+    solver.parameters["relative_tolerance"] = _RELATIVE_TOLERANCE
+    solver.parameters["maximum_iterations"] = _MAXIMUM_ITERATIONS
+    solver.parameters["error_on_nonconvergence"] = True
+    return solver
+
+
+def create_saddle_point_solver(linear_solver_type, mixed_space, field_association, prefix="ns_",
+                               singular=False):
+    """Create a solver of the linear systems of the P2-P1 velocity-pressure
+    discretization.
+
+    The iterative solver is a flexible GMRES method with a fieldsplit
+    preconditioner based on the upper block factorization
+
+        | A  B^T |     | A  B^T |
+        | B  0   |  ~  | 0  S   |,
+
+    where the velocity block A is approximated by one V-cycle of algebraic
+    multigrid and the Schur complement S = -B A^-1 B^T by the least-squares
+    commutator (LSC) preconditioner, which itself applies algebraic multigrid
+    to B B^T. The LSC approximation accounts for the convective term, hence it
+    is suitable for the Newton, Picard and linearly-implicit systems alike. The
+    memory of all components grows linearly with the number of DoFs.
+
+    The fields are split by the index sets of the subspaces if petsc4py is
+    available. Otherwise, the split is detected from the vanishing diagonal of
+    the pressure block.
+
+    Parameters
+    ----------
+    linear_solver_type: LinearSolverType
+        Type of the solver.
+    mixed_space: dolfin.FunctionSpace
+        Joint function space of the velocity and the pressure.
+    field_association: dict
+        Mapping of the field names to the indices of the subspaces.
+    prefix: str (optional)
+        Prefix of the PETSc options of the solver.
+    singular: bool (optional)
+        If True, the pressure is only determined up to a constant.
+
+    Returns
+    -------
+    A dolfin.PETScLUSolver or dolfin.PETScKrylovSolver.
+    """
+    assert isinstance(linear_solver_type, LinearSolverType)
+    assert isinstance(mixed_space, dlfn.FunctionSpace)
+    comm = mixed_space.mesh().mpi_comm()
+    if linear_solver_type is LinearSolverType.direct:
+        return create_lu_solver(comm, prefix, singular)
+
+    solver = dlfn.PETScKrylovSolver(comm)
+    solver.set_options_prefix(prefix)
+    options = {"ksp_type": "fgmres",
+               "ksp_gmres_restart": 100,
+               "ksp_rtol": _RELATIVE_TOLERANCE,
+               "ksp_max_it": _MAXIMUM_ITERATIONS,
+               "pc_type": "fieldsplit",
+               "pc_fieldsplit_type": "schur",
+               "pc_fieldsplit_schur_fact_type": "upper",
+               "pc_fieldsplit_schur_precondition": "self",
+               "fieldsplit_0_ksp_type": "preonly",
+               "fieldsplit_1_ksp_type": "preonly",
+               "fieldsplit_1_pc_type": "lsc"}
+    if not _has_petsc4py():
+        options["pc_fieldsplit_detect_saddle_point"] = ""
+    for key, value in options.items():
+        dlfn.PETScOptions.set(prefix + key, value)
+    _set_amg_options(prefix + "fieldsplit_0_")
+    _set_amg_options(prefix + "fieldsplit_1_lsc_")
+    solver.set_from_options()
+
+    if _has_petsc4py():
+        from petsc4py import PETSc
+        pc = solver.ksp().getPC()
+        index_sets = []
+        for field in ("velocity", "pressure"):
+            dofs = mixed_space.sub(field_association[field]).dofmap().dofs()
+            index_sets.append((str(field_association[field]),
+                               PETSc.IS().createGeneral(np.asarray(dofs, dtype=PETSc.IntType), comm=comm)))
+        pc.setFieldSplitIS(*sorted(index_sets))
+    return solver
@@ -1,20 +1,49 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+from auxiliary_classes import CustomNonlinearProblem
 from bdf_time_stepping import BDFTimeStepping
 import dolfin as dlfn
+from enum import Enum, auto
+from instrumentation import instrumentation
 from ns_solver_base import InstationarySolverBase
 
 
+class JacobianUpdate(Enum):
+    """
+    Policy of updating the Jacobian of Newton's method:
+        - every_iteration: the Jacobian is assembled and factorized in every
+          iteration (Newton's method),
+        - every_step: the Jacobian is assembled and factorized at the
+          beginning of every time step and reused in the following iterations
+          as long as the residual contracts sufficiently,
+        - adaptive: the factorization is reused across iterations and time
+          steps. It is refreshed if the contraction rate of the residual
+          deteriorates, if the step size or the time stepping coefficients
+          change or if the Jacobian exceeds a maximum age.
+    """
+    every_iteration = auto()
+    every_step = auto()
+    adaptive = auto()
+
+
 class ImplicitBDFSolver(InstationarySolverBase):
-    _required_objects = ("_solver")
+    _required_objects = ("_problem", "_linear_solver")
 
-    def __init__(self, mesh, boundary_markers, form_convective_term, time_stepping, tol=1e-10, max_iter=50):
+    def __init__(self, mesh, boundary_markers, form_convective_term, time_stepping, tol=1e-10, max_iter=50,
+                 linear_solver="direct"):
 
         # input check
         assert isinstance(time_stepping, BDFTimeStepping)
 
         super().__init__(mesh, boundary_markers, form_convective_term,
-                         time_stepping, tol, max_iter)
+                         time_stepping, tol, max_iter, linear_solver)
+
+        # Newton's method by default
+        self.set_jacobian_update(JacobianUpdate.every_iteration)
+        self._jacobian_outdated = True
+        self._jacobian_age = 0
+        self._newton_statistics = {"iterations": 0, "factorizations": 0,
+                                   "factorizations_avoided": 0}
 
     def _acceleration_term(self, velocity_solutions, w):
         # input check
@@ -87,36 +116,103 @@ class ImplicitBDFSolver(InstationarySolverBase):
         # linearization using Newton's method
         self._J_newton = dlfn.derivative(self._F, self._solutions[0])
 
+        # setup linear solver, matrix and vectors are allocated once
+        comm = self._mesh.mpi_comm()
+        self._linear_solver, self._nullspace = self._create_linear_solver()
+
         # setup problem with Newton linearization
-        self._problem = dlfn.NonlinearVariationalProblem(self._F,
-                                                         self._solutions[0],
-                                                         self._dirichlet_bcs,
-                                                         self._J_newton)
-        # setup non-linear solver
-        self._solver = dlfn.NonlinearVariationalSolver(self._problem)
-        self._solver.parameters["newton_solver"]["absolute_tolerance"] = self._tol
-        self._solver.parameters["newton_solver"]["maximum_iterations"] = self._maxiter
-        self._solver.parameters["newton_solver"]["relative_tolerance"] = 1.0e1 * self._tol
-        self._solver.parameters["newton_solver"]["error_on_nonconvergence"] = True
+        self._problem = CustomNonlinearProblem(self._F,
+                                               self._dirichlet_bcs,
+                                               self._J_newton,
+                                               self._nullspace)
+        self._jacobian = dlfn.PETScMatrix(comm)
+        self._residual_vector = dlfn.PETScVector(comm)
+        self._newton_update = dlfn.PETScVector(comm)
+        self._jacobian_outdated = True
+
+    def _newton_iteration(self):
+        """Solves the nonlinear problem with Newton's method. Depending on the
+        update policy, the factorized Jacobian of a previous iteration or time
+        step is reused.
+
+        Returns
+        -------
+        A tuple of the number of iterations, the number of factorizations and
+        the norm of the final residual.
+        """
+        solution = self._solutions[0].vector()
+        # the residual includes the Dirichlet rows, hence the boundary conditions are imposed by the first update
+        self._problem.F(self._residual_vector, solution)
+        residual = self._residual_vector.norm("l2")
+        initial_residual = residual
+
+        if self._jacobian_update is not JacobianUpdate.adaptive or \
+                self._jacobian_age >= self._max_jacobian_age:
+            self._jacobian_outdated = True
+
+        iteration = 0
+        n_factorizations = 0
+        while residual > self._tol and residual > 1.0e1 * self._tol * initial_residual:
+            if iteration >= self._maxiter:
+                raise RuntimeError("Newton iteration did not converge in {0} iterations, "
+                                   "residual = {1:6.2e}.".format(iteration, residual))
+            if self._jacobian_outdated:
+                self._problem.J(self._jacobian, solution)
+                self._linear_solver.set_operator(self._jacobian)
+                self._jacobian_outdated = False
+                self._jacobian_age = 0
+                n_factorizations += 1
+            self._linear_solver.solve(self._newton_update, self._residual_vector)
+            # the level of the pressure is fixed by the mean pressure correction
+            if self._nullspace is not None:
+                self._nullspace.orthogonalize(self._newton_update)
+            solution.axpy(-1.0, self._newton_update)
+            iteration += 1
+            self._jacobian_age += 1
+
+            previous_residual = residual
+            self._problem.F(self._residual_vector, solution)
+            residual = self._residual_vector.norm("l2")
+            # refresh an outdated Jacobian once the contraction deteriorates
+            if self._jacobian_update is JacobianUpdate.every_iteration or \
+                    residual > self._max_contraction_rate * previous_residual:
+                self._jacobian_outdated = True
+
+        return iteration, n_factorizations, residual
 
     def _solve_time_step(self):
         """Solves the nonlinear problem for one time step."""
         # solve problem
         dlfn.info("Starting Newton iteration...")
-        self._solver.solve()
+        with instrumentation.span("newton_iteration"):
+            newton_iterations, n_factorizations, residual = self._newton_iteration()
+        # Newton's method factorizes once per iteration
+        factorizations_avoided = max(newton_iterations - n_factorizations, 0)
+        self._newton_statistics["iterations"] += newton_iterations
+        self._newton_statistics["factorizations"] += n_factorizations
+        self._newton_statistics["factorizations_avoided"] += factorizations_avoided
+        instrumentation.record(newton_iterations=newton_iterations,
+                               factorizations=n_factorizations,
+                               factorizations_avoided=factorizations_avoided,
+                               residual=residual)
 
     def _update_time_stepping_coefficients(self):
         """Update time stepping coefficients ``_alpha`` and ``_next_step_size``."""
-        # update time steps
         next_step_size = self._time_stepping.get_next_step_size()
+        alpha = self._time_stepping.coefficients(derivative=1)
+        assert len(alpha) == 3
+        # the Jacobian depends on the leading coefficient and the step size
+        if hasattr(self, "_alpha") and hasattr(self, "_next_step_size"):
+            if float(self._alpha[0]) != alpha[0] or float(self._next_step_size) != next_step_size:
+                self._jacobian_outdated = True
+
+        # update time steps
         if not hasattr(self, "_next_step_size"):
             self._next_step_size = dlfn.Constant(next_step_size, name="dt")
         else:
             self._next_step_size.assign(next_step_size)
 
         # update coefficients
-        alpha = self._time_stepping.coefficients(derivative=1)
-        assert len(alpha) == 3
         if not hasattr(self, "_alpha"):
             self._alpha = [dlfn.Constant(alpha[0], name="alpha00"),
                            dlfn.Constant(alpha[1], name="alpha01"),
@@ -124,3 +220,31 @@ class ImplicitBDFSolver(InstationarySolverBase):
         else:
             for i in range(3):
                 self._alpha[i].assign(alpha[i])
+
+    @property
+    def newton_statistics(self):
+        """Accumulated number of Newton iterations, factorizations and avoided
+        factorizations compared to Newton's method."""
+        return dict(self._newton_statistics)
+
+    def set_jacobian_update(self, jacobian_update, max_contraction_rate=0.1, max_jacobian_age=50):
+        """Sets the update policy of the Jacobian.
+
+        Parameters
+        ----------
+        jacobian_update: JacobianUpdate
+            Update policy of the Jacobian.
+        max_contraction_rate: float (optional)
+            The Jacobian is refreshed if the ratio of two subsequent residuals
+            exceeds this value.
+        max_jacobian_age: int (optional)
+            Maximum number of iterations a Jacobian is reused.
+        """
+        assert isinstance(jacobian_update, JacobianUpdate)
+        assert isinstance(max_contraction_rate, float)
+        assert 0.0 < max_contraction_rate < 1.0
+        assert isinstance(max_jacobian_age, int)
+        assert max_jacobian_age > 0
+        self._jacobian_update = jacobian_update
+        self._max_contraction_rate = max_contraction_rate
+        self._max_jacobian_age = max_jacobian_age
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import dolfin as dlfn
+from imex_time_stepping import IMEXTimeStepping
+from instrumentation import instrumentation
+from ns_solver_base import InstationarySolverBase
+
+
+class IMEXSolver(InstationarySolverBase):
+    """
+    Class to simulate instationary fluid flow of an incompressible fluid using
+    a linearly-implicit IMEX scheme. The convective velocity is extrapolated
+    from the previous time levels such that every time step consists of a
+    single linear solve instead of a Newton iteration.
+
+    The system matrix is the sum of two parts:
+        - the constant part (acceleration, viscous and pressure terms), which
+          only changes with the step size or the time stepping coefficients,
+        - the convective part, which is assembled in every time step.
+
+    The implicit terms are weighted by the coefficients ``gamma`` of the IMEX
+    scheme, the convective velocity is extrapolated with the coefficients
+    ``beta``. For the SBDF2 scheme this is the semi-implicit BDF2 scheme with
+    the convective velocity extrapolated to the next time level.
+    """
+    _required_objects = ("_linear_solver", "_constant_form", "_convective_form", "_rhs_form")
+
+    def __init__(self, mesh, boundary_markers, form_convective_term, time_stepping, tol=1e-10, max_iter=50,
+                 linear_solver="direct"):
+
+        # input check
+        assert isinstance(time_stepping, IMEXTimeStepping)
+
+        super().__init__(mesh, boundary_markers, form_convective_term,
+                         time_stepping, tol, max_iter, linear_solver)
+
+    def _setup_problem(self):
+        """Method setting up the forms, the matrices and the linear solver
+        object of the instationary problem.
+        """
+        assert hasattr(self, "_mesh")
+        assert hasattr(self, "_boundary_markers")
+
+        if not all(hasattr(self, attr) for attr in ("_Wh",
+                                                    "_solutions")):  # pragma: no cover
+            self._setup_function_spaces()
+
+        if not all(hasattr(self, attr) for attr in ("_next_step_size",
+                                                    "_alpha", "_beta",
+                                                    "_gamma")):
+            self._update_time_stepping_coefficients()
+
+        self._setup_boundary_conditions()
+
+        # creating test and trial functions
+        (v, p) = dlfn.TrialFunctions(self._Wh)
+        (w, q) = dlfn.TestFunctions(self._Wh)
+
+        # velocities of the previous time levels
+        index = self._field_association["velocity"]
+        old_velocities = [dlfn.split(self._solutions[i])[index]
+                          for i in range(1, len(self._solutions))]
+        assert len(old_velocities) == len(self._beta)
+        # extrapolated convective velocity, wrapped into a vector such that it
+        # passes the type checks of the weak forms
+        extrapolated_velocity = sum(beta * velocity for beta, velocity in
+                                    zip(self._beta, old_velocities))
+        extrapolated_velocity = dlfn.as_vector([extrapolated_velocity[i] for i in range(self._space_dim)])
+
+        # volume element
+        dV = dlfn.Measure("dx", domain=self._mesh)
+        # constant part of the system
+        self._constant_form = (self._alpha[0] / self._next_step_size * dlfn.dot(v, w)
+                               + self._gamma[0] * self._viscous_term(v, w)
+                               - self._divergence_term(w, p)
+                               - self._divergence_term(v, q)
+                               ) * dV
+        # convective part of the system
+        F_convective = self._gamma[0] * \
+            self._picard_linerization_convective_term(extrapolated_velocity, v, w) * dV
+        # add Coriolis acceleration, the angular velocity may depend on time
+        F_convective = self._add_coriolis_acceleration(F_convective, v, w)
+        self._convective_form = F_convective
+
+        # explicit part of the momentum balance
+        F_explicit = dlfn.dot(sum(alpha * velocity for alpha, velocity in
+                                  zip(self._alpha[1:], old_velocities)), w) / self._next_step_size * dV
+        for gamma, velocity in zip(self._gamma[1:], old_velocities):
+            F_explicit += gamma * (self._picard_linerization_convective_term(extrapolated_velocity,
+                                                                             velocity, w)
+                                   + self._viscous_term(velocity, w)) * dV
+        # add boundary tractions
+        F_explicit = self._add_boundary_tractions(F_explicit, w)
+        # add body force term
+        F_explicit = self._add_body_forces(F_explicit, w)
+        # add Euler acceleration
+        F_explicit = self._add_euler_acceleration(F_explicit, w)
+        self._rhs_form = dlfn.rhs(F_explicit)
+
+        # matrices and vectors are allocated once
+        comm = self._mesh.mpi_comm()
+        self._constant_matrix = dlfn.PETScMatrix(comm)
+        self._system_matrix = dlfn.PETScMatrix(comm)
+        self._rhs_vector = dlfn.PETScVector(comm)
+        self._assemble_constant_matrix()
+
+        # setup linear solver
+        self._linear_solver, self._nullspace = self._create_linear_solver()
+
+    def _assemble_constant_matrix(self):
+        """Assembles the part of the system matrix which only depends on the
+        step size and on the time stepping coefficients."""
+        with instrumentation.span("constant_matrix_assembly"):
+            dlfn.assemble(self._constant_form, tensor=self._constant_matrix)
+        self._constant_matrix_outdated = False
+
+    def _solve_time_step(self):
+        """Solves the linear problem for one time step."""
+        if self._constant_matrix_outdated:
+            self._assemble_constant_matrix()
+
+        with instrumentation.span("assembly"):
+            dlfn.assemble(self._convective_form, tensor=self._system_matrix)
+            # all forms are assembled on the same space, hence the sparsity patterns match
+            self._system_matrix.axpy(1.0, self._constant_matrix, True)
+            dlfn.assemble(self._rhs_form, tensor=self._rhs_vector)
+            for bc in self._dirichlet_bcs:
+                bc.apply(self._system_matrix, self._rhs_vector)
+            if self._nullspace is not None:
+                self._system_matrix.set_nullspace(self._nullspace)
+                self._nullspace.orthogonalize(self._rhs_vector)
+
+        dlfn.info("Solving linear system...")
+        with instrumentation.span("linear_solve"):
+            self._linear_solver.set_operator(self._system_matrix)
+            self._linear_solver.solve(self._solutions[0].vector(), self._rhs_vector)
+
+    def _update_time_stepping_coefficients(self):
+        """Update time stepping coefficients ``_alpha``, ``_beta``, ``_gamma``
+        and ``_next_step_size``."""
+        # update time steps
+        next_step_size = self._time_stepping.get_next_step_size()
+        if not hasattr(self, "_next_step_size"):
+            self._next_step_size = dlfn.Constant(next_step_size, name="dt")
+        else:
+            self._next_step_size.assign(next_step_size)
+
+        # update coefficients
+        coefficients = {"alpha": self._time_stepping.alpha,
+                        "beta": self._time_stepping.beta,
+                        "gamma": self._time_stepping.gamma}
+        assert len(coefficients["alpha"]) == 3
+        assert len(coefficients["beta"]) == 2
+        assert len(coefficients["gamma"]) == 3
+        for key, values in coefficients.items():
+            attr = "_" + key
+            if not hasattr(self, attr):
+                setattr(self, attr, [dlfn.Constant(value, name="{0}{1}".format(key, i))
+                                     for i, value in enumerate(values)])
+            else:
+                for constant, value in zip(getattr(self, attr), values):
+                    constant.assign(value)
+
+        self._constant_matrix_outdated = True
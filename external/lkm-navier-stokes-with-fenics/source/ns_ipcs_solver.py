@@ -3,6 +3,12 @@
 import dolfin as dlfn
 from bdf_time_stepping import BDFTimeStepping
 from dolfin import div, dot, grad
+from instrumentation import instrumentation
+from linear_solvers import LinearSolverType
+from linear_solvers import create_krylov_solver
+from linear_solvers import create_lu_solver
+from linear_solvers import create_pressure_nullspace
+from linear_solvers import get_amg_preconditioner
 from ns_solver_base import InstationarySolverBase
 
 
@@ -10,11 +16,12 @@ class IPCSSolver(InstationarySolverBase):
     _required_objects = ("_diffusion_solver", "_projection_solver",
                          "_velocity_correction_solver")
 
-    def __init__(self, mesh, boundary_markers, form_convective_term, time_stepping, tol=1e-10, max_iter=50):
+    def __init__(self, mesh, boundary_markers, form_convective_term, time_stepping, tol=1e-10, max_iter=50,
+                 linear_solver="direct"):
         # input check
         assert isinstance(time_stepping, BDFTimeStepping)
         super().__init__(mesh, boundary_markers, form_convective_term,
-                         time_stepping, tol, max_iter)
+                         time_stepping, tol, max_iter, linear_solver)
 
     def _acceleration_term(self, velocity_solutions, w):
         # input check
@@ -81,6 +88,13 @@ class IPCSSolver(InstationarySolverBase):
         self._pressure = dlfn.Function(WhSub["pressure"], name="pressure")
         self._old_pressure = dlfn.Function(WhSub["pressure"], name="old_pressure")
 
+    def _setup_mean_pressure_correction(self):
+        """Setup the objects of the mean pressure correction of the separate
+        pressure of the projection step."""
+        Vh = self._get_subspace("pressure")
+        self._setup_pressure_weights(dlfn.TestFunction(Vh), Vh.dofmap().dofs(),
+                                     self._pressure.vector())
+
     def _setup_problem(self):
         """Method setting up solvers object of the instationary problem."""
         assert hasattr(self, "_mesh")
@@ -145,6 +159,11 @@ class IPCSSolver(InstationarySolverBase):
         self._diffusion_solver.parameters["newton_solver"]["maximum_iterations"] = self._maxiter
         self._diffusion_solver.parameters["newton_solver"]["relative_tolerance"] = 1.0e1 * self._tol
         self._diffusion_solver.parameters["newton_solver"]["error_on_nonconvergence"] = True
+        if self._linear_solver_type is LinearSolverType.iterative:
+            newton_parameters = self._diffusion_solver.parameters["newton_solver"]
+            newton_parameters["linear_solver"] = "gmres"
+            newton_parameters["preconditioner"] = get_amg_preconditioner()
+            newton_parameters["krylov_solver"]["relative_tolerance"] = 1.0e-2 * self._tol
 
     def _setup_projection_step(self):
         """Method setting up solver object of the projection step."""
@@ -162,13 +181,10 @@ class IPCSSolver(InstationarySolverBase):
                                          - self._alpha[0] / self._next_step_size *
                                          dot(div(self._intermediate_velocity), q)
                                          ) * dV
-        # setup linear problem
-        self._projection_problem = dlfn.LinearVariationalProblem(self._pressure_correction_lhs,
-                                                                 self._pressure_correction_rhs,
-                                                                 self._pressure,
-                                                                 self._dirichlet_bcs["pressure"])
-        # setup linear solver
-        self._projection_solver = dlfn.LinearVariationalSolver(self._projection_problem)
+        # assemble the constant matrix and factorize it once
+        self._projection_solver, self._projection_rhs_vector, self._projection_nullspace = \
+            self._setup_linear_step(self._pressure_correction_lhs, self._dirichlet_bcs["pressure"],
+                                    ("cg", "amg"))
 
     def _setup_correction_step(self):
         """Method setting up solver object of the correction step."""
@@ -185,27 +201,73 @@ class IPCSSolver(InstationarySolverBase):
                                          - (self._next_step_size / self._alpha[0]) *
                                          dot(grad(self._pressure-self._old_pressure), w)
                                          ) * dV
-        # setup linear problem
-        self._velocity_correction_problem = \
-            dlfn.LinearVariationalProblem(self._velocity_correction_lhs,
-                                          self._velocity_correction_rhs,
-                                          self._velocities[0],
-                                          self._dirichlet_bcs["velocity"])
-        # setup linear solver
-        self._velocity_correction_solver = \
-            dlfn.LinearVariationalSolver(self._velocity_correction_problem)
+        # assemble the constant matrix and factorize it once
+        self._velocity_correction_solver, self._velocity_correction_rhs_vector, _ = \
+            self._setup_linear_step(self._velocity_correction_lhs, self._dirichlet_bcs["velocity"],
+                                    ("cg", "jacobi"))
+
+    def _setup_linear_step(self, lhs, bcs, krylov_method):
+        """Assembles the matrix of a linear step and applies the Dirichlet
+        boundary conditions. The matrices of the projection and the correction
+        step neither depend on the step size nor on the time stepping
+        coefficients, hence they are assembled once per setup. The LU solver
+        keeps the factorization as long as the matrix is unchanged, the
+        iterative solver uses the Krylov method and the preconditioner of
+        ``krylov_method`` and keeps the setup of the preconditioner. The
+        constant pressure is attached as nullspace if the pressure Poisson
+        equation lacks Dirichlet boundary conditions, its level is fixed by
+        the mean pressure correction."""
+        matrix = dlfn.assemble(lhs)
+        for bc in bcs:
+            bc.apply(matrix)
+        comm = self._mesh.mpi_comm()
+        method, preconditioner = krylov_method
+        prefix = "{0}_{1}_".format(method, preconditioner)
+        # a pure Neumann problem of the pressure
+        nullspace = None
+        trial_space = lhs.arguments()[1].function_space()
+        if len(bcs) == 0 and trial_space.num_sub_spaces() == 0:
+            nullspace = create_pressure_nullspace(trial_space)
+            dlfn.as_backend_type(matrix).set_nullspace(nullspace)
+        if self._linear_solver_type is LinearSolverType.direct:
+            solver = create_lu_solver(comm, prefix, nullspace is not None)
+        else:
+            solver = create_krylov_solver(comm, method, preconditioner, prefix)
+        solver.set_operator(matrix)
+        rhs_vector = dlfn.PETScVector(comm)
+        return solver, rhs_vector, nullspace
+
+    def _solve_linear_step(self, solver, rhs, rhs_vector, bcs, solution, nullspace=None):
+        """Assembles the right-hand side of a linear step and solves it with
+        the factorized matrix."""
+        dlfn.assemble(rhs, tensor=rhs_vector)
+        for bc in bcs:
+            bc.apply(rhs_vector)
+        if nullspace is not None:
+            nullspace.orthogonalize(rhs_vector)
+        solver.solve(solution.vector(), rhs_vector)
+        if nullspace is not None:
+            nullspace.orthogonalize(solution.vector())
 
     def _solve_time_step(self):
         """Solves the nonlinear problem for one time step."""
         dlfn.info("Solving diffusion step...")
         dlfn.info("Starting Newton iteration...")
-        self._diffusion_solver.solve()
+        with instrumentation.span("diffusion_step"):
+            newton_iterations, _ = self._diffusion_solver.solve()
+        instrumentation.record(newton_iterations=newton_iterations)
 
         dlfn.info("Solving projection step...")
-        self._projection_solver.solve()
+        with instrumentation.span("projection_step"):
+            self._solve_linear_step(self._projection_solver, self._pressure_correction_rhs,
+                                    self._projection_rhs_vector, self._dirichlet_bcs["pressure"],
+                                    self._pressure, self._projection_nullspace)
 
         dlfn.info("Solving velocity correction step...")
-        self._velocity_correction_solver.solve()
+        with instrumentation.span("correction_step"):
+            self._solve_linear_step(self._velocity_correction_solver, self._velocity_correction_rhs,
+                                    self._velocity_correction_rhs_vector, self._dirichlet_bcs["velocity"],
+                                    self._velocities[0])
 
     def _update_time_stepping_coefficients(self):
         """Update time stepping coefficients ``_alpha`` and ``_next_step_size``."""
@@ -237,11 +299,16 @@ class IPCSSolver(InstationarySolverBase):
         self._assign_function(self._velocities[0], velocity)
         self._assign_function(self._velocities[1], old_velocity)
 
-    @property
-    def solution(self):
+    def update_solution(self):
+        """Update the joint solution from the separate velocity and pressure
+        fields."""
         WhSub = self._get_subspaces()
         assert self._velocities[0] in WhSub["velocity"]
         assert self._pressure in WhSub["pressure"]
         self._assign_function(self._solutions[0], {"velocity": self._velocities[0],
                                                    "pressure": self._pressure})
+
+    @property
+    def solution(self):
+        self.update_solution()
         return self._solutions[0]
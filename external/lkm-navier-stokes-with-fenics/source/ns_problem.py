@@ -4,12 +4,15 @@ from auxiliary_classes import EquationCoefficientHandler
 from auxiliary_methods import extract_all_boundary_markers
 import dolfin as dlfn
 from bdf_time_stepping import BDFTimeStepping
+from imex_time_stepping import IMEXTimeStepping, IMEXType
+from instrumentation import instrumentation
 import math
 from ns_solver_base import VelocityBCType
 from ns_solver_base import PressureBCType
 from ns_solver_base import StationarySolverBase as StationarySolver
 from ns_solver_base import InstationarySolverBase as InstationarySolver
-import numpy as np
+from ns_bdf_solver import JacobianUpdate
+from ns_imex_solver import IMEXSolver
 import os
 from os import path
 
@@ -254,14 +257,32 @@ class ProblemBase:
         solver = self._get_solver()
         solution = solver.solution
         # serialize
-        solution_components = solution.split()
-        for index, name in solver.sub_space_association.items():
-            solution_components[index].rename(name, "")
-            self._xdmf_file.write(solution_components[index], current_time)
+        with instrumentation.span("xdmf_output"):
+            solution_components = solution.split()
+            for index, name in solver.sub_space_association.items():
+                solution_components[index].rename(name, "")
+                self._xdmf_file.write(solution_components[index], current_time)
 
-        if hasattr(self, "_additional_field_output"):
-            for field in self._additional_field_output:
-                self._xdmf_file.write(field, current_time)
+            if hasattr(self, "_additional_field_output"):
+                for field in self._additional_field_output:
+                    self._xdmf_file.write(field, current_time)
+
+    def _write_instrumentation(self):
+        """
+        Write the timings and the records of the time steps collected by the
+        instrumentation to the results directory and print a summary.
+        """
+        if not instrumentation.enabled:
+            return
+        assert hasattr(self, "_problem_name")
+        assert hasattr(self, "_results_dir")
+        if not path.exists(self._results_dir):
+            os.makedirs(self._results_dir)
+        fname = path.join(self._results_dir, self._problem_name + "_Instrumentation")
+        instrumentation.to_json(fname + ".json")
+        if len(instrumentation.step_records) > 0:
+            instrumentation.to_csv(fname + ".csv")
+        print(instrumentation.summary())
 
     def postprocess_solution(self):  # pragma: no cover
         """
@@ -364,9 +385,22 @@ class StationaryProblem(ProblemBase):
         Tolerance for the Picard iteration.
     maxiter_picard: int (optional)
         Maximum number of Picard iterations.
+    linear_solver: str (optional)
+        Solver of the linear systems, either "direct" (LU factorization) or
+        "iterative" (Krylov methods with block preconditioning).
     """
+    # parameters of the adaptive continuation in log(Re)
+    _continuation_start_Re = 10.0
+    _initial_continuation_step = math.log(2.0)
+    _minimal_continuation_step = 1.0e-3
+    _maximal_continuation_step = math.log(10.0)
+    # number of nonlinear iterations below and above which the step is enlarged and reduced
+    _easy_continuation_iterations = 4
+    _hard_continuation_iterations = 10
+
     def __init__(self, main_dir=None, form_convective_term="standard",
-                 tol=1e-10, maxiter=50, tol_picard=1e-2, maxiter_picard=10):
+                 tol=1e-10, maxiter=50, tol_picard=1e-2, maxiter_picard=10,
+                 linear_solver="direct"):
         """
         Constructor of the class.
         """
@@ -376,7 +410,9 @@ class StationaryProblem(ProblemBase):
         assert isinstance(form_convective_term, str)
         assert all(isinstance(i, int) and i > 0 for i in (maxiter, maxiter_picard))
         assert all(isinstance(i, float) and i > 0.0 for i in (tol_picard, tol_picard))
+        assert isinstance(linear_solver, str)
         self._form_convective_term = form_convective_term
+        self._linear_solver = linear_solver
         # set numerical tolerances
         self._tol_picard = tol_picard
         self._maxiter_picard = maxiter_picard
@@ -391,9 +427,15 @@ class StationaryProblem(ProblemBase):
         assert hasattr(self, "_navier_stokes_solver")
         return self._navier_stokes_solver
 
-    def solve_problem(self):
+    def _set_reynolds_number(self, Re):
+        """Modifies the Reynolds number and passes the equation coefficients
+        to the solver. The weak forms of the solver are reused."""
+        self._coefficient_handler.modify_dimensionless_number("Re", float(Re))
+        self._navier_stokes_solver.set_equation_coefficients(self._coefficient_handler.equation_coefficients)
+
+    def _setup_solver(self):
         """
-        Solve the stationary problem.
+        Setup the mesh, the boundary conditions and the solver object.
         """
         # setup mesh
         self.setup_mesh()
@@ -434,7 +476,8 @@ class StationaryProblem(ProblemBase):
                 StationarySolver(self._mesh, self._boundary_markers,
                                  self._form_convective_term,
                                  self._tol, self._maxiter,
-                                 self._tol_picard, self._maxiter_picard)
+                                 self._tol_picard, self._maxiter_picard,
+                                 self._linear_solver)
 
         # pass periodic boundary conditions
         if hasattr(self, "_periodic_bcs"):
@@ -459,13 +502,93 @@ class StationaryProblem(ProblemBase):
         if hasattr(self, "_body_force"):
             self._navier_stokes_solver.set_body_force(self._body_force)
 
+    def _solve_with_continuation(self, target_Re):
+        """
+        Solves the problem for the Reynolds number ``target_Re`` by an adaptive
+        parameter continuation in log(Re).
+
+        The continuation starts from the last converged solution. If there is
+        none, the problem is solved for ``_continuation_start_Re`` with a zero
+        initial guess. The initial guess of each continuation step is
+        extrapolated from the last two converged solutions (secant predictor).
+        The step is enlarged if the nonlinear solver converges in few
+        iterations, reduced if it requires many, and halved and retried on
+        failure.
+        """
+        assert isinstance(target_Re, float) and target_Re > 0.0
+        solver = self._navier_stokes_solver
+        if not hasattr(self, "_continuation_states"):
+            # converged states as tuples (log(Re), solution vector)
+            self._continuation_states = []
+            self._continuation_step = self._initial_continuation_step
+        states = self._continuation_states
+
+        def solve_step(Re):
+            self._set_reynolds_number(Re)
+            dlfn.info("Solving problem with Re = {0:.2f}".format(Re))
+            instrumentation.begin_step(len(instrumentation.step_records), Re)
+            try:
+                with instrumentation.span("continuation_step"):
+                    iterations = solver.solve()
+            finally:
+                instrumentation.end_step()
+            states.append((math.log(Re), solver.solution.vector().copy()))
+            del states[:-2]
+            return iterations
+
+        if len(states) == 0:
+            start_Re = min(target_Re, self._continuation_start_Re)
+            # the solver objects are created by the first solve
+            if hasattr(solver, "_solution"):
+                solver.solution.vector().zero()
+            solve_step(start_Re)
+
+        target = math.log(target_Re)
+        while states[-1][0] != target:
+            current = states[-1][0]
+            if self._continuation_step >= abs(target - current):
+                next_value, next_Re = target, target_Re
+            else:
+                next_value = current + math.copysign(self._continuation_step, target - current)
+                next_Re = math.exp(next_value)
+            # secant predictor
+            solution = solver.solution.vector()
+            solution.zero()
+            solution.axpy(1.0, states[-1][1])
+            if len(states) == 2 and states[1][0] != states[0][0]:
+                theta = (next_value - states[1][0]) / (states[1][0] - states[0][0])
+                solution.axpy(theta, states[1][1])
+                solution.axpy(-theta, states[0][1])
+            try:
+                iterations = solve_step(next_Re)
+            except RuntimeError:
+                self._continuation_step = 0.5 * min(self._continuation_step, abs(next_value - current))
+                if self._continuation_step < self._minimal_continuation_step:
+                    raise RuntimeError("Parameter continuation failed at Re = {0:.2f}.".format(next_Re))
+                continue
+            # adapt the step to the effort of the last solve
+            if iterations <= self._easy_continuation_iterations:
+                self._continuation_step = min(2.0 * self._continuation_step,
+                                              self._maximal_continuation_step)
+            elif iterations >= self._hard_continuation_iterations:
+                self._continuation_step *= 0.5
+
+    def solve_problem(self):
+        """
+        Solve the stationary problem.
+        """
+        self._setup_solver()
+
         try:
             dlfn.info("Solving problem")
-            self._navier_stokes_solver.solve()
+            with instrumentation.span("solve"):
+                self._navier_stokes_solver.solve()
             # postprocess solution
-            self.postprocess_solution()
+            with instrumentation.span("postprocessing"):
+                self.postprocess_solution()
             # write XDMF-files
             self._write_xdmf_file()
+            self._write_instrumentation()
             return
         except RuntimeError:  # pragma: no cover
             pass
@@ -477,28 +600,51 @@ class StationaryProblem(ProblemBase):
 
         # parameter continuation
         dlfn.info("Solving problem with parameter continuation...")  # pragma: no cover
-
-        # mixed logarithmic-linear spacing
-        finalRe = self._coefficient_handler.Re  # pragma: no cover
-        assert finalRe is not None  # pragma: no cover
-        logRange = np.logspace(np.log10(10.0), np.log10(finalRe),
-                               num=8, endpoint=True)  # pragma: no cover
-        linRange = np.linspace(logRange[-2], finalRe,
-                               num=8, endpoint=True)  # pragma: no cover
-        finalRange = np.concatenate((logRange[:-2], linRange))  # pragma: no cover
-        for Re in finalRange:  # pragma: no cover
-            # modify dimensionless numbers
-            self._coefficient_handler.modify_dimensionless_number("Re", Re)
-            self._navier_stokes_solver.set_equation_coefficients(self._coefficient_handler.equation_coefficients)
-            # solve problem
-            dlfn.info("Solving problem with Re = {0:.2f}".format(Re))
-            self._navier_stokes_solver.solve()
+        final_Re = self._coefficient_handler.Re  # pragma: no cover
+        assert final_Re is not None  # pragma: no cover
+        self._solve_with_continuation(final_Re)  # pragma: no cover
 
         # postprocess solution
         self.postprocess_solution()  # pragma: no cover
 
         # write XDMF-files
         self._write_xdmf_file()  # pragma: no cover
+        self._write_instrumentation()  # pragma: no cover
+
+    def solve_reynolds_sweep(self, reynolds_numbers):
+        """
+        Solve the stationary problem for a sequence of Reynolds numbers. Each
+        solution serves as starting point of the parameter continuation to the
+        next Reynolds number. The solution of each Reynolds number is
+        postprocessed and written to a separate XDMF file.
+
+        Parameters
+        ----------
+        reynolds_numbers: list or tuple of float
+            Reynolds numbers in the order of the sweep.
+        """
+        assert isinstance(reynolds_numbers, (list, tuple))
+        assert len(reynolds_numbers) > 0
+        assert all(isinstance(Re, float) and Re > 0.0 for Re in reynolds_numbers)
+
+        self._setup_solver()
+        assert self._coefficient_handler.Re is not None
+
+        for Re in reynolds_numbers:
+            with instrumentation.span("solve"):
+                self._solve_with_continuation(Re)
+            # the filename depends on the Reynolds number
+            if hasattr(self, "_xdmf_file"):
+                self._xdmf_file.close()
+                del self._xdmf_file
+            if hasattr(self, "_additional_field_output"):
+                del self._additional_field_output
+            # postprocess solution
+            with instrumentation.span("postprocessing"):
+                self.postprocess_solution()
+            # write XDMF-files
+            self._write_xdmf_file()
+        self._write_instrumentation()
 
 
 class InstationaryProblem(ProblemBase):
@@ -520,11 +666,14 @@ class InstationaryProblem(ProblemBase):
         Tolerance for the non-linear Picard iteration.
     maxiter_picard: int (optional)
         Maximum number of non-linear Picard iterations.
+    linear_solver: str (optional)
+        Solver of the linear systems, either "direct" (LU factorization) or
+        "iterative" (Krylov methods with block preconditioning).
     """
     def __init__(self, main_dir=None, start_time=0.0, end_time=1.0,
                  form_convective_term="standard",
                  desired_start_time_step=0.1, n_max_steps=1000,
-                 tol=1e-10, maxiter=50):
+                 tol=1e-10, maxiter=50, linear_solver="direct"):
         """
         Constructor of the class.
         """
@@ -537,7 +686,9 @@ class InstationaryProblem(ProblemBase):
         assert all(isinstance(i, int) and i > 0 for i in (maxiter, n_max_steps))
         assert all(isinstance(i, float) and i >= 0.0 for i in (start_time, end_time,
                                                                desired_start_time_step))
+        assert isinstance(linear_solver, str)
         self._form_convective_term = form_convective_term
+        self._linear_solver = linear_solver
         # set numerical tolerances
         self._start_time = start_time
         self._end_time = end_time
@@ -555,13 +706,36 @@ class InstationaryProblem(ProblemBase):
         """
         Class method computing the maxmimum local CFL number.
         """
+        if not hasattr(self, "_cfl_solver"):
+            self._setup_cfl_evaluator()
+        self._cfl_step_size.assign(step_size)
+        # the solution of the solver may be assembled from separate fields
+        self._get_solver().update_solution()
+        # solve
+        self._cfl_solver.solve_local_rhs(self._cfl)
+        # return maximum value
+        max_cfl = self._cfl.vector().norm("linf")
+        assert math.isfinite(max_cfl)
+        assert max_cfl >= 0.0
+        dlfn.info("Current CFL number = {0:6.2e}".format(max_cfl))
+
+        return max_cfl
+
+    def _setup_cfl_evaluator(self):
+        """
+        Class method setting up the local projection of the CFL number. The
+        mass matrix of the discontinuous space is factorized once and the
+        step size is a constant of the form such that every evaluation only
+        assembles the local right-hand sides.
+        """
         velocity = self._get_velocity()
         degree = velocity.ufl_element().degree()
         assert degree >= 0
         # expression for local CFL number
         h = dlfn.CellDiameter(self._mesh)
         velocity_magnitude = dlfn.sqrt(dlfn.dot(velocity, velocity))
-        cfl_expression = dlfn.Constant(float(degree)) * velocity_magnitude * dlfn.Constant(step_size) / h
+        self._cfl_step_size = dlfn.Constant(1.0)
+        cfl_expression = dlfn.Constant(float(degree)) * velocity_magnitude * self._cfl_step_size / h
         # quadrature space
         cell = self._mesh.ufl_cell()
         elemQ = dlfn.FiniteElement("DG", cell, degree=degree)
@@ -573,18 +747,9 @@ class InstationaryProblem(ProblemBase):
         del_v = dlfn.TestFunction(VQ)
         lhs = dlfn.inner(v, del_v) * dV
         rhs = dlfn.inner(cfl_expression, del_v) * dV
-        solver = dlfn.LocalSolver(lhs, rhs)
-        solver.factorize()
-        # solve
-        cfl = dlfn.Function(VQ)
-        solver.solve_local_rhs(cfl)
-        # return maximum value
-        max_cfl = dlfn.norm(cfl.vector(), "linf")
-        assert math.isfinite(max_cfl)
-        assert max_cfl >= 0.0
-        dlfn.info("Current CFL number = {0:6.2e}".format(max_cfl))
-
-        return max_cfl
+        self._cfl_solver = dlfn.LocalSolver(lhs, rhs)
+        self._cfl_solver.factorize()
+        self._cfl = dlfn.Function(VQ)
 
     def _set_next_step_size(self):
         """
@@ -594,7 +759,8 @@ class InstationaryProblem(ProblemBase):
         next_step_size = self._time_stepping.get_next_step_size()
         assert next_step_size > 0.0
         assert math.isfinite(next_step_size)
-        cfl = self._compute_cfl_number(next_step_size)
+        with instrumentation.span("cfl_number"):
+            cfl = self._compute_cfl_number(next_step_size)
         if cfl > 1.0:
             next_step_size /= cfl
             if self._adaptive_time_stepping is False:
@@ -613,12 +779,23 @@ class InstationaryProblem(ProblemBase):
         """
         raise NotImplementedError("You are calling a purely virtual method.")
 
-    def set_solver_class(self, InstationarySolverClass):
+    def set_solver_class(self, InstationarySolverClass, imex_type=IMEXType.SBDF2):
         """
-        Sets up the type of the solver used to solve the problem.
+        Sets up the type of the solver used to solve the problem. The type of
+        the IMEX scheme is only used by the ``IMEXSolver``.
         """
         assert issubclass(InstationarySolverClass, InstationarySolver)
+        assert isinstance(imex_type, IMEXType)
         self._InstationarySolverClass = InstationarySolverClass
+        self._imex_type = imex_type
+
+    def set_jacobian_update(self, jacobian_update, max_contraction_rate=0.1, max_jacobian_age=50):
+        """
+        Sets up the update policy of the Jacobian of the ``ImplicitBDFSolver``,
+        see ``ImplicitBDFSolver.set_jacobian_update``.
+        """
+        assert isinstance(jacobian_update, JacobianUpdate)
+        self._jacobian_update = (jacobian_update, max_contraction_rate, max_jacobian_age)
 
     def solve_problem(self):
         """
@@ -664,8 +841,12 @@ class InstationaryProblem(ProblemBase):
         assert hasattr(self, "_initial_conditions")
 
         # create time stepping object
-        self._time_stepping = BDFTimeStepping(self._start_time, self._end_time,
-                                              desired_start_time_step=self._desired_start_time_step)
+        if issubclass(self._InstationarySolverClass, IMEXSolver):
+            self._time_stepping = IMEXTimeStepping(self._start_time, self._end_time, self._imex_type,
+                                                   desired_start_time_step=self._desired_start_time_step)
+        else:
+            self._time_stepping = BDFTimeStepping(self._start_time, self._end_time,
+                                                  desired_start_time_step=self._desired_start_time_step)
 
         # create solver object
         if not hasattr(self, "_navier_stokes_solver"):
@@ -673,10 +854,16 @@ class InstationaryProblem(ProblemBase):
                 self._InstationarySolverClass(self._mesh, self._boundary_markers,
                                               self._form_convective_term,
                                               self._time_stepping,
-                                              self._tol, self._maxiter)
+                                              self._tol, self._maxiter,
+                                              self._linear_solver)
         # pass equation coefficients
         self._navier_stokes_solver.set_equation_coefficients(self._coefficient_handler.equation_coefficients)
 
+        # pass update policy of the Jacobian
+        if hasattr(self, "_jacobian_update"):
+            assert hasattr(self._navier_stokes_solver, "set_jacobian_update")
+            self._navier_stokes_solver.set_jacobian_update(*self._jacobian_update)
+
         # pass body force
         if hasattr(self, "_body_force"):
             self._navier_stokes_solver.set_body_force(self._body_force)
@@ -710,18 +897,23 @@ class InstationaryProblem(ProblemBase):
 
         while not self._time_stepping.is_at_end() and \
                 self._time_stepping.step_number < self._n_max_steps:
+            instrumentation.begin_step(self._time_stepping.step_number,
+                                       self._time_stepping.current_time)
             # set next step size
             self._set_next_step_size()
             # update coefficients
             self._time_stepping.update_coefficients()
+            instrumentation.record(step_size=self._time_stepping.get_next_step_size())
             # print info
             print(self._time_stepping)
             # solve problem
-            self._navier_stokes_solver.solve()
+            with instrumentation.span("solve"):
+                self._navier_stokes_solver.solve()
             # postprocess solution
             if self._postprocessing_frequency > 0:
                 if self._time_stepping.step_number % self._postprocessing_frequency == 0:
-                    self.postprocess_solution()
+                    with instrumentation.span("postprocessing"):
+                        self.postprocess_solution()
             # advance time
             self._time_stepping.advance_time()
             self._navier_stokes_solver.advance_time()
@@ -733,4 +925,10 @@ class InstationaryProblem(ProblemBase):
             if self._output_frequency > 0:
                 if self._time_stepping.step_number % self._output_frequency == 0:
                     self._write_xdmf_file(current_time=self._time_stepping.current_time)
+            instrumentation.end_step()
         print(self._time_stepping)
+        if hasattr(self._navier_stokes_solver, "newton_statistics"):
+            print("Newton iterations: {iterations}, factorizations: {factorizations}, "
+                  "factorizations avoided: {factorizations_avoided}"
+                  .format(**self._navier_stokes_solver.newton_statistics))
+        self._write_instrumentation()
@@ -8,6 +8,10 @@ import dolfin as dlfn
 from dolfin import cross, curl, div, dot, grad, inner
 from discrete_time import DiscreteTime
 from enum import Enum, auto
+from instrumentation import instrumentation
+from linear_solvers import LinearSolverType
+from linear_solvers import create_pressure_nullspace
+from linear_solvers import create_saddle_point_solver
 import math
 import numpy as np
 import ufl
@@ -76,7 +80,7 @@ class SolverBase:
     _field_association = {value: key for key, value in _sub_space_association.items()}
 
     def __init__(self, mesh, boundary_markers, form_convective_term="standard",
-                 form_viscous_term="reduced"):
+                 form_viscous_term="reduced", linear_solver="direct"):
         # input check
         assert isinstance(mesh, dlfn.Mesh)
         assert isinstance(boundary_markers, (dlfn.cpp.mesh.MeshFunctionSizet,
@@ -86,6 +90,8 @@ class SolverBase:
                                                 "divergence", "skew_symmetric")
         assert isinstance(form_viscous_term, str)
         assert form_viscous_term.lower() in ("standard", "reduced", "traction")
+        assert isinstance(linear_solver, str)
+        assert linear_solver.lower() in ("direct", "iterative")
 
         # set mesh variables
         self._mesh = mesh
@@ -114,6 +120,12 @@ class SolverBase:
         elif form_viscous_term.lower() == "traction":
             self._form_viscous_term = WeakFormViscousTerm.traction_form
 
+        # set solver of the linear systems
+        if linear_solver.lower() == "direct":
+            self._linear_solver_type = LinearSolverType.direct
+        elif linear_solver.lower() == "iterative":
+            self._linear_solver_type = LinearSolverType.iterative
+
         # set discretization parameters
         # polynomial degree
         self._p_deg = 1
@@ -389,6 +401,19 @@ class SolverBase:
             return self._equation_coefficients["convective_term"] * \
                     self._one_half * (dot(dot(grad(u), u), v) - dot(dot(grad(v), u), u))
 
+    def _create_linear_solver(self):
+        """Returns the solver of the linear systems of the mixed space and the
+        basis of the pressure nullspace, which is None if the pressure is
+        determined by the boundary conditions."""
+        assert hasattr(self, "_Wh")
+        nullspace = None
+        if self._has_pressure_nullspace():
+            nullspace = create_pressure_nullspace(self._Wh, self._field_association["pressure"])
+        linear_solver = create_saddle_point_solver(self._linear_solver_type, self._Wh,
+                                                   self._field_association,
+                                                   singular=nullspace is not None)
+        return linear_solver, nullspace
+
     def _divergence_term(self, u, v):
         assert hasattr(self, "_equation_coefficients")
         if self._equation_coefficients["pressure_term"] is None:  # pragma: no cover
@@ -475,6 +500,29 @@ class SolverBase:
                     dlfn.FunctionAssigner(receiving_space, assigning_space)
         return self._forward_subspace_assigners
 
+    def _has_pressure_nullspace(self):
+        """Returns True if the pressure is only determined up to a constant,
+        i.e., if there are neither pressure nor traction boundary conditions
+        and the velocity is prescribed on all non-periodic boundaries."""
+        if hasattr(self, "_traction_bcs"):
+            return False
+        if hasattr(self, "_pressure_bcs"):
+            if any(bc[0] is not PressureBCType.mean_value for bc in self._pressure_bcs):
+                return False
+        # boundaries with a prescribed normal velocity component
+        constraining_bc_types = (VelocityBCType.no_slip, VelocityBCType.no_normal_flux,
+                                 VelocityBCType.constant, VelocityBCType.function)
+        constrained_ids = set()
+        if hasattr(self, "_velocity_bcs"):
+            constrained_ids = set(bc[1] for bc in self._velocity_bcs if bc[0] in constraining_bc_types)
+        if hasattr(self, "_constrained_domain"):
+            constrained_ids.update(self._constrained_boundary_ids)
+        # a natural boundary condition applies on the remaining boundaries
+        boundary_ids = extract_all_boundary_markers(self._mesh, self._boundary_markers)
+        has_natural_bcs = len(boundary_ids.difference(constrained_ids)) > 0
+        # the boundaries of the partitions of a parallel run differ
+        return dlfn.MPI.max(self._mesh.mpi_comm(), float(has_natural_bcs)) == 0.0
+
     def _picard_linerization_convective_term(self, u, v, w):
         assert hasattr(self, "_equation_coefficients")
         if self._equation_coefficients["convective_term"] is None:  # pragma: no cover
@@ -707,6 +755,8 @@ class SolverBase:
             assert body_force.ufl_shape[0] == self._space_dim
         self._body_force = body_force
         self._body_force.rename("body_force", "")
+        if hasattr(self, "_time_dependent_expressions"):
+            del self._time_dependent_expressions
 
     def set_periodic_boundary_conditions(self, constrained_domain,
                                          constrained_boundary_ids):
@@ -820,6 +870,8 @@ class SolverBase:
 
         # boundary conditions accepted
         self._velocity_bcs = velocity_bcs
+        if hasattr(self, "_time_dependent_expressions"):
+            del self._time_dependent_expressions
         if len(traction_bcs) > 0:
             self._traction_bcs = traction_bcs
             self._form_viscous_term = WeakFormViscousTerm.traction_form
@@ -877,9 +929,10 @@ class StationarySolverBase(SolverBase):
     """
 
     def __init__(self, mesh, boundary_markers, form_convective_term, tol=1e-10, maxiter=50,
-                 tol_picard=1e-2, maxiter_picard=10):
+                 tol_picard=1e-2, maxiter_picard=10, linear_solver="direct"):
 
-        super().__init__(mesh, boundary_markers, form_convective_term)
+        super().__init__(mesh, boundary_markers, form_convective_term,
+                         linear_solver=linear_solver)
 
         # input check
         assert all(isinstance(i, int) and i > 0 for i in (maxiter, maxiter_picard))
@@ -935,64 +988,84 @@ class StationarySolverBase(SolverBase):
         # linearization using Newton's method
         self._J_newton = dlfn.derivative(self._F, self._solution)
         # setup non-linear solver
-        linear_solver = dlfn.PETScLUSolver()
-        comm = dlfn.MPI.comm_world
+        linear_solver, nullspace = self._create_linear_solver()
+        comm = self._mesh.mpi_comm()
         factory = dlfn.PETScFactory.instance()
         self._nonlinear_solver = dlfn.NewtonSolver(comm, linear_solver, factory)
         # setup problem with Picard linearization
         self._picard_problem = CustomNonlinearProblem(self._F,
                                                       self._dirichlet_bcs,
-                                                      self._J_picard)
+                                                      self._J_picard,
+                                                      nullspace)
         # setup problem with Newton linearization
         self._newton_problem = CustomNonlinearProblem(self._F,
                                                       self._dirichlet_bcs,
-                                                      self._J_newton)
+                                                      self._J_newton,
+                                                      nullspace)
 
     def solve(self):
-        """Solves the nonlinear problem."""
+        """Solves the nonlinear problem starting from the current solution,
+        which serves as initial guess.
+
+        Returns
+        -------
+        The total number of Picard and Newton iterations.
+        """
         # setup problem
         if not all(hasattr(self, attr) for attr in ("_nonlinear_solver",
                                                     "_picard_problem",
                                                     "_newton_problem",
                                                     "_solution")):
-            self._setup_problem()
+            with instrumentation.span("setup"):
+                self._setup_problem()
 
         # compute initial residual
         residual_vector = dlfn.Vector(self._solution.vector())
         self._picard_problem.F(residual_vector, self._solution.vector())
         residual = residual_vector.norm("l2")
 
-        # correct initial tolerance if necessary
-        if residual < self._tol_picard:
+        # correct initial tolerance if necessary, the tolerance is not stored
+        # such that a warm start does not tighten subsequent solves
+        tol_picard = self._tol_picard
+        if 0.0 < residual < tol_picard:
             # determine order of magnitude
             order = math.floor(math.log10(residual))
             # specify corrected tolerance
-            self._tol_picard = (residual / 10.0**order - 1.0) * 10.0**order
+            tol_picard = (residual / 10.0**order - 1.0) * 10.0**order
 
         # Picard iteration
         dlfn.info("Starting Picard iteration...")
         self._nonlinear_solver.parameters["maximum_iterations"] = self._maxiter_picard
-        self._nonlinear_solver.parameters["absolute_tolerance"] = self._tol_picard
-        self._nonlinear_solver.solve(self._picard_problem, self._solution.vector())
+        self._nonlinear_solver.parameters["absolute_tolerance"] = tol_picard
+        with instrumentation.span("picard_iteration"):
+            picard_iterations, _ = self._nonlinear_solver.solve(self._picard_problem, self._solution.vector())
 
         # Newton's method
         dlfn.info("Starting Newton iteration...")
         self._nonlinear_solver.parameters["absolute_tolerance"] = self._tol
         self._nonlinear_solver.parameters["maximum_iterations"] = self._maxiter
         self._nonlinear_solver.parameters["error_on_nonconvergence"] = False
-        self._nonlinear_solver.solve(self._newton_problem, self._solution.vector())
+        with instrumentation.span("newton_iteration"):
+            newton_iterations, _ = self._nonlinear_solver.solve(self._newton_problem, self._solution.vector())
 
         # check residual
         self._newton_problem.F(residual_vector, self._solution.vector())
         residual = residual_vector.norm("l2")
-        assert residual <= self._tol, "Newton iteration did not converge."
+        instrumentation.record(picard_iterations=picard_iterations, newton_iterations=newton_iterations,
+                               residual=residual)
+        if not residual <= self._tol:
+            raise RuntimeError("Newton iteration did not converge, residual = {0:6.2e}.".format(residual))
+
+        return picard_iterations + newton_iterations
 
 
 class InstationarySolverBase(SolverBase):
 
-    def __init__(self, mesh, boundary_markers, form_convective_term, time_stepping, tol=1e-10, max_iter=50):
+    def __init__(self, mesh, boundary_markers, form_convective_term, time_stepping, tol=1e-10, max_iter=50,
+                 linear_solver="direct"):
 
-        super().__init__(mesh, boundary_markers, form_convective_term)
+        super().__init__(mesh, boundary_markers, form_convective_term,
+                         linear_solver=linear_solver)
 
         # input check
         assert isinstance(max_iter, int)
@@ -1041,67 +1114,39 @@ class InstationarySolverBase(SolverBase):
         assert isinstance(current_time, float)
         assert next_time > current_time
 
+        if not hasattr(self, "_time_dependent_expressions"):
+            self._setup_time_dependent_expressions()
+        for expression, attribute, at_current_time in self._time_dependent_expressions:
+            setattr(expression, attribute, current_time if at_current_time else next_time)
+
+    def _setup_time_dependent_expressions(self):
+        """Collects the expressions of the boundary conditions and the body
+        force which depend on time as tuples of the expression, the name of its
+        time attribute and a flag whether it is evaluated at the current
+        instead of the next time."""
+        self._time_dependent_expressions = []
+
         # auxiliary function
-        def modify_time(expression, time=next_time):
-            # modify time
+        def add_expression(expression, at_current_time=False):
             if isinstance(expression, dlfn.Expression):
                 if hasattr(expression, "time"):
-                    expression.time = next_time
+                    self._time_dependent_expressions.append((expression, "time", at_current_time))
                 elif hasattr(expression, "t"):
-                    expression.t = next_time
-        # velocity boundary conditions
-        if hasattr(self, "_velocity_bcs"):
-            for bc in self._velocity_bcs:
-                # unpack values
-                if len(bc) == 3:
-                    value = bc[2]
-                elif len(bc) == 4:
-                    value = bc[3]
-                else:  # pragma: no cover
-                    raise RuntimeError()
-                # modify time
-                modify_time(value)
-        # pressure boundary conditions
-        if hasattr(self, "_pressure_bcs"):
-            for bc in self._pressure_bcs:
-                # unpack values
-                if len(bc) == 3:
-                    value = bc[2]
-                else:  # pragma: no cover
-                    raise RuntimeError()
-                # modify time
-                modify_time(value)
-        # traction boundary conditions
-        if hasattr(self, "_traction_bcs"):
-            for bc in self._traction_bcs:
-                # unpack values
-                if len(bc) == 3:
-                    value = bc[2]
-                elif len(bc) == 4:
-                    value = bc[3]
-                else:  # pragma: no cover
-                    raise RuntimeError()
-                # modify time
-                modify_time(value)
+                    self._time_dependent_expressions.append((expression, "t", at_current_time))
+        # boundary conditions, the value is the last entry of the tuple
+        for attr, at_current_time in (("_velocity_bcs", False), ("_pressure_bcs", False),
+                                      ("_traction_bcs", False), ("_current_traction_bcs", True)):
+            if hasattr(self, attr):
+                for bc in getattr(self, attr):
+                    if len(bc) not in (3, 4):  # pragma: no cover
+                        raise RuntimeError()
+                    add_expression(bc[-1], at_current_time)
         # body force
         if hasattr(self, "_body_force"):
-            # modify time
-            modify_time(self._body_force)
-        # traction boundary conditions at current time
-        if hasattr(self, "_current_traction_bcs"):
-            for bc in self._current_traction_bcs:
-                # unpack values
-                if len(bc) == 3:
-                    value = bc[2]
-                elif len(bc) == 4:
-                    value = bc[3]
-                else:  # pragma: no cover
-                    raise RuntimeError()
-                # modify time
-                modify_time(value, current_time)
+            add_expression(self._body_force)
         # body force at current time
         if hasattr(self, "_current_body_force"):
-            modify_time(self._current_body_force, current_time)
+            add_expression(self._current_body_force, True)
 
     def _solve_time_step(self):  # pragma: no cover
         """
@@ -1109,6 +1154,16 @@ class InstationarySolverBase(SolverBase):
         """
         raise NotImplementedError("You are calling a purely virtual method.")
 
+    def _time_stepping_coefficients_outdated(self):
+        """Returns True if the coefficients or the size of the next step of
+        the time stepping scheme differ from the ones of the weak forms."""
+        coefficients_changed = self._time_stepping.coefficients_changed
+        # the coefficients of BDF schemes are queried by the order of the derivative
+        if callable(coefficients_changed):
+            coefficients_changed = coefficients_changed(1)
+        return coefficients_changed or \
+            float(self._next_step_size) != self._time_stepping.get_next_step_size()
+
     def _update_time_stepping_coefficients(self):  # pragma: no cover
         """
         Purely virtual method for updating the coefficients of the time stepping
@@ -1171,36 +1226,72 @@ class InstationarySolverBase(SolverBase):
             self._assign_function(pressure, projected_pressure_condition)
         # TODO: Implement Poisson equation for the initial pressure
 
+    def _correct_mean_pressure(self):
+        """Shifts the pressure such that its mean value matches ``_mean_pressure_value``."""
+        if not hasattr(self, "_pressure_weights"):
+            self._setup_mean_pressure_correction()
+        with instrumentation.span("mean_pressure_correction"):
+            # compute mean value
+            mean_pressure_value = self._pressure_weights.inner(self._pressure_vector) / self._domain_volume
+            # the Lagrange basis functions form a partition of unity, hence
+            # shifting the pressure coefficients shifts the pressure
+            values = self._pressure_vector.get_local()
+            values[self._local_pressure_dofs] -= mean_pressure_value - self._mean_pressure_value
+            self._pressure_vector.set_local(values)
+            self._pressure_vector.apply("insert")
+
+    def _setup_mean_pressure_correction(self):
+        """Setup the objects of the mean pressure correction of the joint
+        solution."""
+        index = self._field_association["pressure"]
+        q = dlfn.TestFunctions(self._Wh)[index]
+        self._setup_pressure_weights(q, self._Wh.sub(index).dofmap().dofs(),
+                                     self._solutions[0].vector())
+
+    def _setup_pressure_weights(self, q, pressure_dofs, pressure_vector):
+        """Assembles the integrals of the pressure basis functions and the
+        volume of the domain once such that the mean pressure is given by an
+        inner product.
+
+        Parameters
+        ----------
+        q: pressure test function
+        pressure_dofs: global indices of the locally owned pressure dofs
+        pressure_vector: vector containing the pressure coefficients
+        """
+        dV = dlfn.Measure("dx", domain=self._mesh)
+        self._pressure_weights = dlfn.assemble(q * dV)
+        self._domain_volume = dlfn.assemble(dlfn.Constant(1.0) * dV)
+        self._pressure_vector = pressure_vector
+        first, _ = pressure_vector.local_range()
+        self._local_pressure_dofs = np.asarray(pressure_dofs, dtype=np.int64) - first
+
     def solve(self):
         """Solves the problem for one time step."""
         # setup problem
         if not all(hasattr(self, attr) for attr in self._required_objects):
-            self._setup_problem()
+            with instrumentation.span("setup"):
+                self._setup_problem()
 
         # update time
-        self._set_time()
+        with instrumentation.span("set_time"):
+            self._set_time()
 
         # update coefficients if necessary
-        if self._time_stepping.coefficients_changed:
+        if self._time_stepping_coefficients_outdated():
             self._update_time_stepping_coefficients()
 
         # perform one time
-        self._solve_time_step()
+        with instrumentation.span("time_step"):
+            self._solve_time_step()
 
         if hasattr(self, "_mean_pressure_value"):
-            _, pressure = self.solution.split()
-            # compute mean value
-            dV = dlfn.Measure("dx", domain=self._mesh)
-            mean_pressure_value = dlfn.assemble(pressure * dV) / dlfn.assemble(dlfn.Constant(1.0) * dV)
-            # compute pressure shift
-            pressure_shift = dlfn.Constant(mean_pressure_value - self._mean_pressure_value)
-            # define modified pressure
-            modified_pressure = pressure - pressure_shift
-            # project modified pressure
-            pressure_space = self._get_subspace("pressure")
-            corrected_pressure = dlfn.project(modified_pressure, pressure_space)
-            self._assign_function(pressure,
-                                  {"pressure": corrected_pressure})
+            self._correct_mean_pressure()
+
+    def update_solution(self):
+        """Update the joint solution from the fields which are solved for.
+        The joint solution is solved for directly, hence nothing is done."""
+        pass
 
     @property
     def solution(self):
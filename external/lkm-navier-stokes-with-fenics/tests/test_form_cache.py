@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from form_cache import get_form_cache_dir
+from form_cache import set_form_cache_dir
+from form_cache import warm_up_solvers
+import os
+from os import path
+import tempfile
+
+
+def test_set_form_cache_dir():
+    previous_cache_dir = get_form_cache_dir()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            cache_dir = path.join(directory, "form_cache")
+            assert set_form_cache_dir(cache_dir, overwrite=True) == cache_dir
+            assert path.isdir(cache_dir)
+            # a directory which is already set is kept
+            assert set_form_cache_dir(path.join(directory, "other")) == cache_dir
+            assert get_form_cache_dir() == cache_dir
+    finally:
+        if previous_cache_dir is None:
+            os.environ.pop("DIJITSO_CACHE_DIR", None)
+        else:
+            os.environ["DIJITSO_CACHE_DIR"] = previous_cache_dir
+
+
+def test_warm_up_solvers():
+    timings = warm_up_solvers(space_dims=(2, ))
+    assert len(timings) == 4
+    assert {name for name, _, _, _ in timings} == {"StationarySolverBase", "ImplicitBDFSolver",
+                                                      "IPCSSolver", "IMEXSolver"}
+    assert all(wall_time > 0.0 for _, _, _, wall_time in timings)
+
+
+if __name__ == "__main__":
+    test_set_form_cache_dir()
+    test_warm_up_solvers()
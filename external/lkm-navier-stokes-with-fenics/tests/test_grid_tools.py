@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from grid_tools import convert_meshes
+from grid_tools import generate_xdmf_mesh
+from grid_tools import is_up_to_date
+import os
+from os import path
+import shutil
+import tempfile
+
+
+def test_convert_meshes():
+    geo_file = path.join(path.dirname(path.abspath(__file__)), "..", "gmsh-collection",
+                         "meshes", "RectangleTwoMaterials.geo")
+    with tempfile.TemporaryDirectory() as directory:
+        for refinement in ("coarse", "fine"):
+            shutil.copytree(path.dirname(geo_file), path.join(directory, refinement),
+                            ignore=lambda d, files: [f for f in files if f != path.basename(geo_file)])
+        # first conversion of all levels
+        converted = convert_meshes(directory, n_workers=2)
+        assert len(converted) == 2
+        for f in converted:
+            assert is_up_to_date(f)
+            assert path.exists(f.replace(".geo", ".h5"))
+        # nothing changed
+        assert len(convert_meshes(directory)) == 0
+        # modified geo file
+        modified_file = path.join(directory, "fine", path.basename(geo_file))
+        with open(modified_file, "a") as file:
+            file.write("\n// modified\n")
+        assert not is_up_to_date(modified_file)
+        assert convert_meshes(directory) == [modified_file]
+
+
+def _generate_without_gmsh(geo_file):
+    """Call generate_xdmf_mesh with a PATH on which gmsh cannot be found."""
+    environment_path = os.environ["PATH"]
+    with tempfile.TemporaryDirectory() as empty_directory:
+        os.environ["PATH"] = empty_directory
+        try:
+            return generate_xdmf_mesh(geo_file)
+        finally:
+            os.environ["PATH"] = environment_path
+
+
+def _raises_runtime_error(geo_file):
+    try:
+        _generate_without_gmsh(geo_file)
+    except RuntimeError:
+        return True
+    return False
+
+
+def test_generate_without_gmsh():
+    source_file = path.join(path.dirname(path.abspath(__file__)), "..", "gmsh-collection",
+                            "meshes", "RectangleTwoMaterials.geo")
+    with tempfile.TemporaryDirectory() as directory:
+        geo_file = path.join(directory, path.basename(source_file))
+        shutil.copy(source_file, geo_file)
+        msh_file = geo_file.replace(".geo", ".msh")
+        hash_file = geo_file + ".sha256"
+        # missing msh file
+        assert _raises_runtime_error(geo_file)
+        # msh file of unknown origin
+        with open(msh_file, "w") as file:
+            file.write("stale")
+        assert _raises_runtime_error(geo_file)
+        assert not path.exists(hash_file)
+        assert not is_up_to_date(geo_file)
+        # msh file generated by gmsh
+        os.remove(msh_file)
+        generate_xdmf_mesh(geo_file)
+        assert is_up_to_date(geo_file)
+        os.remove(hash_file)
+        # fallback conversion of the matching msh file is not marked as up to date
+        _generate_without_gmsh(geo_file)
+        assert not path.exists(hash_file)
+        assert not is_up_to_date(geo_file)
+        # msh file of an old version of the geo file
+        with open(geo_file, "a") as file:
+            file.write("\n// modified\n")
+        assert _raises_runtime_error(geo_file)
+        assert not path.exists(hash_file)
+        assert not is_up_to_date(geo_file)
+
+
+if __name__ == "__main__":
+    test_convert_meshes()
+    test_generate_without_gmsh()
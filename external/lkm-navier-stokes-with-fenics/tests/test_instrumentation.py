@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import csv
+from instrumentation import Instrumentation
+import json
+from os import path
+import tempfile
+
+
+def test_instrumentation():
+    instrumentation = Instrumentation()
+    # nothing is collected while switched off
+    with instrumentation.span("solve"):
+        pass
+    instrumentation.begin_step(0, 0.0)
+    instrumentation.record(newton_iterations=3)
+    instrumentation.end_step()
+    assert len(instrumentation.timings) == 0
+    assert len(instrumentation.step_records) == 0
+
+    instrumentation.enable()
+    for step_number in range(3):
+        instrumentation.begin_step(step_number, 0.1 * step_number)
+        with instrumentation.span("solve"):
+            with instrumentation.span("newton_iteration"):
+                pass
+        instrumentation.record(newton_iterations=step_number + 1, residual=1e-12)
+        instrumentation.end_step()
+    with instrumentation.span("xdmf_output"):
+        pass
+
+    timings = instrumentation.timings
+    assert timings["solve"]["calls"] == 3
+    assert timings["xdmf_output"]["calls"] == 1
+    assert timings["solve"]["total"] >= timings["newton_iteration"]["total"]
+    step_records = instrumentation.step_records
+    assert len(step_records) == 3
+    assert [r["newton_iterations"] for r in step_records] == [1, 2, 3]
+    assert all(r["wall_time"] >= r["solve"] for r in step_records)
+    assert "xdmf_output" not in step_records[-1]
+    print(instrumentation.summary())
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_file = path.join(directory, "steps.csv")
+        instrumentation.to_csv(csv_file)
+        with open(csv_file, "r") as file:
+            rows = list(csv.DictReader(file))
+        assert len(rows) == 3
+        assert int(rows[-1]["newton_iterations"]) == 3
+        json_file = path.join(directory, "instrumentation.json")
+        instrumentation.to_json(json_file)
+        with open(json_file, "r") as file:
+            data = json.load(file)
+        assert data["timings"]["solve"]["calls"] == 3
+        assert len(data["steps"]) == 3
+
+    instrumentation.reset()
+    assert len(instrumentation.timings) == 0
+    assert len(instrumentation.step_records) == 0
+
+
+if __name__ == "__main__":
+    test_instrumentation()
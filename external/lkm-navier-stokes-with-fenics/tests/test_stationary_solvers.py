@@ -33,8 +33,8 @@ class PeriodicDomain(dlfn.SubDomain):
 
 
 class CavityProblem(StationaryProblem):
-    def __init__(self, n_points, main_dir=None):
-        super().__init__(main_dir)
+    def __init__(self, n_points, main_dir=None, linear_solver="direct"):
+        super().__init__(main_dir, linear_solver=linear_solver)
         self._n_points = n_points
         self._problem_name = "Cavity"
 
@@ -261,6 +261,23 @@ def test_cavity():
     cavity_flow.solve_problem()
 
 
+def test_cavity_iterative():
+    cavity_flow = CavityProblem(10, linear_solver="iterative")
+    cavity_flow.solve_problem()
+
+
+def test_cavity_direct_after_iterative():
+    # the options of the iterative solver must not leak into the singular direct solver
+    CavityProblem(10, linear_solver="iterative").solve_problem()
+    CavityProblem(10).solve_problem()
+
+
+def test_cavity_reynolds_sweep():
+    cavity_flow = CavityProblem(10)
+    cavity_flow.solve_reynolds_sweep([50.0, 200.0, 100.0])
+    assert cavity_flow._coefficient_handler.Re == 100.0
+
+
 def test_channel_flow():
     for bc_type in ("inlet", "pressure_gradient", "inlet_pressure", "inlet_component"):
         channel_flow = ChannelFlowProblem(10, bc_type=bc_type)
@@ -286,6 +303,9 @@ def test_gravity_driven_flow():
 if __name__ == "__main__":
     test_blasius_flow()
     test_cavity()
+    test_cavity_iterative()
+    test_cavity_direct_after_iterative()
+    test_cavity_reynolds_sweep()
     test_channel_flow()
     test_channel_flow_convective_term()
     test_couette_flow()
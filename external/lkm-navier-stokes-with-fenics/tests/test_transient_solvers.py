@@ -6,6 +6,7 @@ from ns_problem import InstationaryProblem
 from ns_solver_base import VelocityBCType
 from ns_solver_base import PressureBCType
 from ns_bdf_solver import ImplicitBDFSolver
+from ns_bdf_solver import JacobianUpdate
 from grid_generator import hyper_cube
 from grid_generator import hyper_rectangle
 from grid_generator import open_hyper_cube
@@ -48,9 +49,10 @@ class PeriodicDomain(dlfn.SubDomain):
 
 
 class ChannelFlowProblem(InstationaryProblem):
-    def __init__(self, n_points, main_dir=None):
+    def __init__(self, n_points, main_dir=None, linear_solver="direct"):
         super().__init__(main_dir, start_time=0.0, end_time=1.0,
-                         desired_start_time_step=0.01, n_max_steps=10)
+                         desired_start_time_step=0.01, n_max_steps=10,
+                         linear_solver=linear_solver)
         self._n_points = n_points
         self._problem_name = "ChannelFlow"
         self._output_frequency = 10
@@ -131,9 +133,10 @@ class GravityDrivenFlowProblem(InstationaryProblem):
 class TaylorGreenVortex(InstationaryProblem):
     _gamma = gamma = 2.0 * dlfn.pi
 
-    def __init__(self, main_dir=None):
+    def __init__(self, main_dir=None, linear_solver="direct"):
         super().__init__(main_dir, start_time=0.0, end_time=1.0,
-                         desired_start_time_step=0.1, n_max_steps=10)
+                         desired_start_time_step=0.1, n_max_steps=10,
+                         linear_solver=linear_solver)
         self._problem_name = "TaylorGreenVortex"
         self._n_points = 16
         self._output_frequency = 0
@@ -176,17 +179,38 @@ def test_channel_flow():
     channel_flow.solve_problem()
 
 
+def test_channel_flow_jacobian_reuse():
+    for jacobian_update in (JacobianUpdate.every_step, JacobianUpdate.adaptive):
+        channel_flow = ChannelFlowProblem(5)
+        channel_flow.set_jacobian_update(jacobian_update)
+        channel_flow.solve_problem()
+        statistics = channel_flow._get_solver().newton_statistics
+        assert statistics["factorizations"] > 0
+        assert statistics["factorizations_avoided"] > 0
+
+
+def test_channel_flow_iterative():
+    channel_flow = ChannelFlowProblem(5, linear_solver="iterative")
+    channel_flow.solve_problem()
+
+
 def test_transient_gravity_driven_flow():
     gravity_flow = GravityDrivenFlowProblem(32)
     gravity_flow.solve_problem()
 
 
 def test_taylor_green_vortex():
-    taylor_green = TaylorGreenVortex()
-    taylor_green.solve_problem()
+    for linear_solver in ("direct", "iterative"):
+        taylor_green = TaylorGreenVortex(linear_solver=linear_solver)
+        taylor_green.solve_problem()
+        # mean value of the pressure
+        pressure = taylor_green._get_pressure()
+        assert abs(dlfn.assemble(pressure * dlfn.dx)) < 1e-12
 
 
 if __name__ == "__main__":
     test_channel_flow()
+    test_channel_flow_jacobian_reuse()
+    test_channel_flow_iterative()
     test_transient_gravity_driven_flow()
     test_taylor_green_vortex()
@@ -9,6 +9,15 @@ class PeriodicBoundary(dlfn.SubDomain):
     """
     lh = 1.
 
+    def __init__(self, lh=None, **kwargs):
+        """
+        :param lh: Width of the domain, an instance attribute does not depend on the order in which several meshes are
+            set up. The class attribute is used if it is not given.
+        """
+        super().__init__(**kwargs)
+        if lh is not None:
+            self.lh = lh
+
     # Left boundary is "target domain" G
     def inside(self, x, on_boundary):
         # Change proposed here: https://groups.google.com/g/fenics-support/c/eINQurdojTo?pli=1
@@ -1,15 +1,63 @@
 # !/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import hashlib
+import json
+import multiprocessing
 import os
-import matplotlib.pyplot as plt
-from typing import Callable, Tuple, Optional, List
+from typing import Callable, Tuple, Optional, List, Dict
 import numpy as np
 import dolfin as dlfn
 from dolfin.function.function import Function
 from dolfin.function.functionspace import FunctionSpace
 from dolfin.cpp.mesh import Mesh
 
+from utils.parallel import get_tmp_file, global_max, is_parallel, is_root, replace_file, root_print
+from utils.probe import Probe
+from utils.transfer_operator import TransferOperator
+
+# Default number of worker processes of the solution cache, the finest levels are started first and every worker holds
+# one of them in memory
+DEFAULT_N_WORKERS = 2
+
+
+def get_settings_hash(settings: Optional[Dict] = None):
+    """
+    Hash of all settings which influence a solution, e.g. the solver configuration and the material and boundary tables
+    :param settings: json serializable dict, non serializable values are converted by str
+    :return: hex digest
+    """
+    settings = dict() if settings is None else settings
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_file_hash(filename):
+    """
+    :return: hex digest of the file content or None if the file does not exist
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def _solve_level(task):
+    """
+    Worker function solving a single refinement level and writing the solution into the cache. The file is written
+    under a temporary name and renamed afterwards, hence an interrupted run never leaves a corrupt cache entry. Under
+    mpirun all processes solve the level collectively.
+    :param task: Tuple of the solver function, the geo file and the cache file
+    :return: The geo file
+    """
+    solver_function, geo_file, cache_file = task
+    dlfn.set_log_level(50)
+    solution, _, mesh = solver_function(geo_file)
+    tmp_file = get_tmp_file(cache_file, mesh.mesh.mpi_comm())
+    with dlfn.HDF5File(mesh.mesh.mpi_comm(), tmp_file, "w") as file:
+        file.write(solution, "/solution")
+    replace_file(tmp_file, cache_file, mesh.mesh.mpi_comm())
+    return geo_file
+
 
 class ConvergenceTest:
     def __init__(
@@ -20,15 +68,41 @@ class ConvergenceTest:
         convergence_measures: List[str],
         out_dir: Optional[str] = None,
         points_coordinates: Optional[np.ndarray] = None,
+        setup_function: Optional[Callable[[str], Tuple[FunctionSpace, Mesh]]] = None,
+        cache_dir: Optional[str] = None,
+        settings: Optional[Dict] = None,
+        n_workers: Optional[int] = None,
     ):
+        """
+        Convergence test comparing the solutions of consecutive mesh refinements.
+
+        Without a cache_dir all levels are solved one after another in this process. With a cache_dir every solution
+        is checkpointed to HDF5, missing levels are solved concurrently in worker processes and the convergence measures
+        are computed afterwards from the cache. Reruns skip all levels whose cache file exists. Under mpirun every level
+        is distributed over all processes and the levels are solved one after another, the plots are saved by the root
+        process.
+        :param solver_function: Computes (solution, function_space, mesh) for a geo file
+        :param setup_function: Creates (function_space, mesh) for a geo file without solving, required with cache_dir
+        :param cache_dir: Directory of the solution cache
+        :param settings: Settings which influence the solutions (solver configuration, material and boundary tables),
+            their hash is part of the cache key
+        :param n_workers: Number of worker processes, defaults to DEFAULT_N_WORKERS such that only the two finest levels
+            are in memory at once, raise it if the memory suffices for more of the large levels
+        """
         # Save the input parameters
         self.solver_func = solver_function
+        self.setup_func = setup_function
         self.geo_name = geo_name
         self.mesh_refinements = mesh_refinements
         self.convergence_measures = convergence_measures
         self.out_dir = out_dir
         if points_coordinates is not None:
             self.points_coordinates = points_coordinates
+        if cache_dir is not None and setup_function is None:
+            raise ValueError("A setup_function is required to read the cached solutions")
+        self.cache_dir = cache_dir
+        self.settings_hash = get_settings_hash(settings)
+        self.n_workers = n_workers
 
         # A mapping of existing convergence measures
         self.measures = {
@@ -42,43 +116,114 @@ class ConvergenceTest:
         self.results = None
         self.max_cell_diameters = None
 
+        # The refinement levels of the current and the previous solution
+        self.refinement = None
+        self.previous_refinement = None
+
         # Variables for intermediate results of specific measures
         self.previous_facet_integral = None
         self.previous_points_values = None
 
+    def get_geo_file(self, refinement):
+        return os.path.join("meshes", refinement, self.geo_name)
+
+    def get_cache_file(self, refinement):
+        """
+        The cache file of a refinement level, keyed by the geometry, the refinement, the content of the geo file and
+        the hash of the settings
+        """
+        geo_hash = get_file_hash(self.get_geo_file(refinement)) or ""
+        key = hashlib.sha256((geo_hash + self.settings_hash).encode()).hexdigest()[:16]
+        name = os.path.splitext(self.geo_name)[0]
+        return os.path.join(os.path.abspath(self.cache_dir), name, refinement, "solution_" + key + ".h5")
+
+    def compute_solutions(self):
+        """
+        Solve all refinement levels which are not yet part of the cache in a pool of worker processes. The finest levels
+        are started first as they take the longest. Under mpirun the processes are already busy with a single level,
+        the levels are solved in this process instead.
+        :return:
+        """
+        tasks = list()
+        for refinement in reversed(self.mesh_refinements):
+            cache_file = self.get_cache_file(refinement)
+            if os.path.exists(cache_file):
+                root_print("FOUND CACHED SOLUTION FOR THE REFINEMENT: " + refinement)
+                continue
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            tasks.append((self.solver_func, self.get_geo_file(refinement), cache_file))
+        if not tasks:
+            return
+
+        if is_parallel():
+            for task in tasks:
+                root_print("FINISHED SOLUTION FOR: " + _solve_level(task))
+            return
+
+        n_workers = min(self.n_workers or min(DEFAULT_N_WORKERS, multiprocessing.cpu_count()), len(tasks))
+        print("COMPUTING {0} SOLUTIONS ON {1} WORKERS".format(len(tasks), n_workers))
+        with multiprocessing.Pool(processes=n_workers) as pool:
+            for geo_file in pool.imap_unordered(_solve_level, tasks):
+                print("FINISHED SOLUTION FOR: " + geo_file)
+
+    def load_solution(self, refinement):
+        """
+        Read the cached solution of a refinement level
+        :return: Tuple of the solution, the function space and the mesh
+        """
+        function_space, mesh = self.setup_func(self.get_geo_file(refinement))
+        solution = dlfn.Function(function_space)
+        with dlfn.HDF5File(mesh.mesh.mpi_comm(), self.get_cache_file(refinement), "r") as file:
+            file.read(solution, "/solution")
+        return solution, function_space, mesh
+
+    def get_solution(self, refinement):
+        if self.cache_dir is None:
+            root_print("COMPUTING SOLUTION FOR THE REFINEMENT: " + refinement)
+            return self.solver_func(self.get_geo_file(refinement))
+        root_print("LOADING SOLUTION FOR THE REFINEMENT: " + refinement)
+        return self.load_solution(refinement)
+
     def run_test(self):
-        print("RUNNING A CONVERGENCE TEST FOR THE GEOMETRY: " + self.geo_name)
+        root_print("RUNNING A CONVERGENCE TEST FOR THE GEOMETRY: " + self.geo_name)
+        if self.cache_dir is not None:
+            self.compute_solutions()
         max_cell_diameter = np.zeros(len(self.mesh_refinements) - 1)
         difference = np.zeros(shape=(len(self.mesh_refinements) - 1, len(self.convergence_measures)))
         previous_solutions: Optional = None
         entry = 0
         for refinement in self.mesh_refinements:
-            print("COMPUTING SOLUTION FOR THE REFINEMENT: " + refinement)
-            geo_file = os.path.join("meshes", refinement, self.geo_name)
-            solution, function_space, mesh = self.solver_func(geo_file)
+            self.refinement = refinement
+            solution, function_space, mesh = self.get_solution(refinement)
             for i, measure in enumerate(self.convergence_measures):
                 assert measure in self.measures, "The given convergence measure: " + measure + " is not implemented!"
                 diff = self.measures[measure](solution, function_space, mesh, previous_solutions)
                 if diff is not None:
                     difference[entry, i] = diff
 
-            max_cell_diameter[entry] = mesh.mesh.hmax()
+            max_cell_diameter[entry] = global_max(mesh.mesh.mpi_comm(), mesh.mesh.hmax())
             if previous_solutions is not None:
                 entry += 1
 
             previous_solutions = solution
+            self.previous_refinement = refinement
 
         self.max_cell_diameters = max_cell_diameter
         self.results = difference
 
     def save_plots(self):
+        if not is_root():
+            return
+        # matplotlib is slow to import and only needed for the plots
+        import matplotlib.pyplot as plt
+
         if self.out_dir:
             self.out_dir = os.path.abspath(self.out_dir)
         else:
             self.out_dir = os.getcwd()
         print("SAVING PLOTS")
         ylabels = {
-            "global": "errornorm(solution - LagrangeInterpolator(previous_solution))",
+            "global": "L2_norm(solution - interpolated previous_solution)",
             "local": "L2_norm(solution(points) - previous_solution(points))",
             "facet_integral": "facet_integral(solution) - facet_integral(previous_solution)",
             "domain_integral": "domain_integral(solution) - domain_integral(previous_solution)",
@@ -98,22 +243,47 @@ class ConvergenceTest:
             f.savefig(filename)
             plt.cla()
 
+    def get_transfer_operator_file(self, source_refinement, target_refinement):
+        """
+        The interpolation operator between two levels is stored next to the meshes of the target level, keyed by the
+        content of both geo files
+        """
+        geo_hashes = [get_file_hash(self.get_geo_file(r)) or "" for r in (source_refinement, target_refinement)]
+        key = hashlib.sha256("".join(geo_hashes).encode()).hexdigest()[:16]
+        name = os.path.splitext(self.geo_name)[0]
+        filename = "transfer_{0}_from_{1}_{2}.npz".format(name, source_refinement, key)
+        return os.path.join(os.path.dirname(self.get_geo_file(target_refinement)), filename)
+
     def global_convergence(self, solution, function_space, mesh, previous_solution):
-        print("COMPUTING GLOBAL CONVERGENCE MEASURE")
-        fun = dlfn.Function(function_space)
+        root_print("COMPUTING GLOBAL CONVERGENCE MEASURE")
 
         difference = None
-        if previous_solution is not None:
-            dlfn.LagrangeInterpolator.interpolate(fun, previous_solution)
-            difference = dlfn.errornorm(fun, solution)
+        if previous_solution is not None and is_parallel(mesh.mesh.mpi_comm()):
+            # The transfer operator acts on serial vectors, the interpolator searches the distributed source mesh
+            interpolated = dlfn.Function(function_space)
+            dlfn.LagrangeInterpolator.interpolate(interpolated, previous_solution)
+            difference = np.sqrt(dlfn.assemble((interpolated - solution) ** 2 * dlfn.dx(domain=function_space.mesh())))
+        elif previous_solution is not None:
+            operator = TransferOperator.get(
+                previous_solution.function_space(),
+                function_space,
+                self.get_transfer_operator_file(self.previous_refinement, self.refinement),
+            )
+            # L2 norm of the difference inside of the function space: sqrt(e^T M e)
+            error = solution.vector().copy()
+            error.set_local(operator.apply(previous_solution.vector().get_local()) - solution.vector().get_local())
+            error.apply("insert")
+            u, v = dlfn.TrialFunction(function_space), dlfn.TestFunction(function_space)
+            mass_matrix = dlfn.assemble(u * v * dlfn.dx(domain=function_space.mesh()))
+            difference = np.sqrt(error.inner(mass_matrix * error))
 
         return difference
 
     def local_convergence(self, solution, function_space, mesh, previous_solution):
-        print("COMPUTING LOCAL CONVERGENCE MEASURE")
+        root_print("COMPUTING LOCAL CONVERGENCE MEASURE")
         assert self.points_coordinates is not None
         # evaluate coordinate values here
-        values = np.array([solution(c) for c in self.points_coordinates])
+        values = Probe(function_space, self.points_coordinates)(solution)
 
         difference = None
         if previous_solution is not None:
@@ -124,10 +294,9 @@ class ConvergenceTest:
         return difference
 
     def facet_integral_convergence(self, solution, function_space, mesh, previous_solution):
-        print("COMPUTING FACET INTEGRAL CONVERGENCE MEASURE")
-        integral = 0.0
-        for facet in mesh.facet_marker_map.values():
-            integral += dlfn.assemble(solution * mesh.dA(subdomain_id=facet))
+        root_print("COMPUTING FACET INTEGRAL CONVERGENCE MEASURE")
+        # A single assembly over the union of all marked facets
+        integral = dlfn.assemble(solution * mesh.dA(subdomain_id=tuple(mesh.facet_marker_map.values())))
 
         difference = None
         if previous_solution is not None:
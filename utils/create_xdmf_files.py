@@ -41,8 +41,14 @@ except ModuleNotFoundError:
 
 def main(args):
     geo_file = args[1]
-    print(f"Generating xdmf files from {geo_file}")
     assert os.path.exists(geo_file), f"The file {geo_file} does not exist"
+    if os.path.isdir(geo_file) and SELECTION == 1:
+        # Convert all outdated geo files of a meshes tree, e.g. case_study/meshes
+        print(f"Generating xdmf files for all geo files in {geo_file}")
+        for converted_file in generate_xdmf_mesh.convert_meshes(geo_file):
+            print(f"Generated xdmf files from {converted_file}")
+        return
+    print(f"Generating xdmf files from {geo_file}")
     generate_xdmf_mesh.generate_xdmf_mesh(geo_file)
 
 
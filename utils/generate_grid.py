@@ -1,14 +1,102 @@
+import hashlib
+import json
 import os
 import sys
+from collections import OrderedDict
+
+import dolfin as dlfn
 
 # Add location to path and import "grid_generator"
-sys.path.insert(0, '../external/lkm-navier-stokes-with-fenics/source/')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "external",
+                                "lkm-navier-stokes-with-fenics", "source"))
 
 import grid_generator
 
+from utils.parallel import get_tmp_file, replace_file
+
+# Number of meshes kept in memory by get_mesh
+MESH_CACHE_SIZE = 4
+_MESH_CACHE = OrderedDict()
+
+
+def _get_geo_hash(geo_file):
+    with open(geo_file, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def get_bundle_file(geo_file):
+    """
+    returns: the path of the binary mesh bundle of a geo file, it is located next to the geo file
+    """
+    return os.path.splitext(geo_file)[0] + "_mesh.h5"
+
+
+def write_mesh_bundle(bundle_file, geo_hash, mesh_data):
+    """
+    Write the mesh, the marker functions and the name to id maps into a single HDF5 file. The file is written under a
+    temporary name and renamed afterwards such that concurrent readers never see an incomplete bundle. Under MPI, all
+    processes write their part of the mesh collectively.
+    """
+    mesh, facet_markers, facet_marker_map = mesh_data[:3]
+    tmp_file = get_tmp_file(bundle_file, mesh.mpi_comm())
+    with dlfn.HDF5File(mesh.mpi_comm(), tmp_file, "w") as file:
+        file.write(mesh, "/mesh")
+        file.write(facet_markers, "/facet_markers")
+        attributes = file.attributes("/mesh")
+        attributes["geo_hash"] = geo_hash
+        attributes["facet_marker_map"] = json.dumps(facet_marker_map)
+        if len(mesh_data) == 5:
+            file.write(mesh_data[3], "/cell_markers")
+            attributes["cell_marker_map"] = json.dumps(mesh_data[4])
+    replace_file(tmp_file, bundle_file, mesh.mpi_comm())
+
+
+def read_mesh_bundle(bundle_file, geo_hash):
+    """
+    returns: the content of the bundle in the format of get_mesh or None if the bundle belongs to another version of
+        the geo file. Under MPI, every process reads its partition of the mesh.
+    """
+    mesh = dlfn.Mesh()
+    with dlfn.HDF5File(mesh.mpi_comm(), bundle_file, "r") as file:
+        attributes = file.attributes("/mesh")
+        if attributes["geo_hash"] != geo_hash:
+            return None
+        file.read(mesh, "/mesh", False)
+        space_dim = mesh.geometry().dim()
+        facet_markers = dlfn.MeshFunction("size_t", mesh, space_dim - 1)
+        file.read(facet_markers, "/facet_markers")
+        facet_marker_map = json.loads(attributes["facet_marker_map"])
+        if not file.has_dataset("/cell_markers"):
+            return mesh, facet_markers, facet_marker_map
+        cell_markers = dlfn.MeshFunction("size_t", mesh, space_dim)
+        file.read(cell_markers, "/cell_markers")
+        cell_marker_map = json.loads(attributes["cell_marker_map"])
+    return mesh, facet_markers, facet_marker_map, cell_markers, cell_marker_map
+
 
 def get_mesh(geo_file):
     """
-    returns: (mesh, facet_markers, facet_marker_map)
+    Load the mesh of a geo file. The first load converts the xdmf files into a binary HDF5 bundle next to the geo file,
+    later loads read this bundle as long as the content of the geo file is unchanged. The last MESH_CACHE_SIZE meshes are
+    kept in memory, hence repeated loads return the same (shared) objects.
+    returns: (mesh, facet_markers, facet_marker_map) or
+        (mesh, facet_markers, facet_marker_map, cell_markers, cell_marker_map) if the mesh has cell markers
     """
-    return grid_generator._read_external_mesh(geo_file)
+    geo_hash = _get_geo_hash(geo_file)
+    key = (os.path.abspath(geo_file), geo_hash)
+    if key in _MESH_CACHE:
+        _MESH_CACHE.move_to_end(key)
+        return _MESH_CACHE[key]
+
+    bundle_file = get_bundle_file(geo_file)
+    mesh_data = None
+    if os.path.exists(bundle_file):
+        mesh_data = read_mesh_bundle(bundle_file, geo_hash)
+    if mesh_data is None:
+        mesh_data = grid_generator._read_external_mesh(geo_file)
+        write_mesh_bundle(bundle_file, geo_hash, mesh_data)
+
+    _MESH_CACHE[key] = mesh_data
+    while len(_MESH_CACHE) > MESH_CACHE_SIZE:
+        _MESH_CACHE.popitem(last=False)
+    return mesh_data
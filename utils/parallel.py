@@ -0,0 +1,66 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import dolfin as dlfn
+
+# Helpers for runs under mpirun, all of them reduce to the plain operation in a serial run. Reductions of arrays and
+# broadcasts use the mpi4py communicators of dolfin, which are available in the FEniCS docker image.
+
+
+def is_parallel(comm=dlfn.MPI.comm_world):
+    return dlfn.MPI.size(comm) > 1
+
+
+def is_root(comm=dlfn.MPI.comm_world):
+    return dlfn.MPI.rank(comm) == 0
+
+
+def barrier(comm=dlfn.MPI.comm_world):
+    if is_parallel(comm):
+        dlfn.MPI.barrier(comm)
+
+
+def global_min(comm, value: float):
+    return dlfn.MPI.min(comm, float(value))
+
+
+def global_max(comm, value: float):
+    return dlfn.MPI.max(comm, float(value))
+
+
+def global_sum(comm, values: np.ndarray):
+    """
+    :return: The elementwise sum of the arrays of all processes
+    """
+    if not is_parallel(comm):
+        return values
+    return comm.allreduce(np.asarray(values))
+
+
+def root_print(*args, comm=dlfn.MPI.comm_world):
+    """
+    Print on the root process only
+    """
+    if is_root(comm):
+        print(*args)
+
+
+def get_tmp_file(filename: str, comm=dlfn.MPI.comm_world):
+    """
+    A temporary file name next to filename which is unique per run, but identical on all processes of a run such that
+    it can be written collectively
+    """
+    pid = os.getpid() if not is_parallel(comm) else comm.bcast(os.getpid(), root=0)
+    return filename + ".{0}.tmp".format(pid)
+
+
+def replace_file(tmp_file: str, filename: str, comm=dlfn.MPI.comm_world):
+    """
+    Atomically move a collectively written temporary file to its final name, all processes return once the file exists
+    """
+    barrier(comm)
+    if is_root(comm):
+        os.replace(tmp_file, filename)
+    barrier(comm)
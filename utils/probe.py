@@ -0,0 +1,64 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from dolfin.function.function import Function
+from dolfin.function.functionspace import FunctionSpace
+
+from utils.parallel import global_sum, is_parallel
+from utils.transfer_operator import tabulate_basis_weights
+
+
+def line_points(start, end, n_points: int):
+    """
+    Equidistant points on the straight line from start to end (both included)
+    :return: (n_points, space_dim) array
+    """
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    return start + np.linspace(0.0, 1.0, n_points)[:, np.newaxis] * (end - start)
+
+
+class Probe:
+    def __init__(self, function_space: FunctionSpace, points: np.ndarray):
+        """
+        Batched point evaluation of Functions of a scalar function space. The containing cells and the basis function
+        weights of all points are computed once, afterwards every evaluation is a single vectorized sparse product.
+        Points outside of the mesh are extrapolated from the closest cell.
+        Under mpirun every process evaluates the points inside of its partition and the values are summed up, points on
+        the interface of several partitions are averaged. All processes have to call the probe collectively.
+        :param function_space: The function space of all Functions to be evaluated
+        :param points: (N, space_dim) array of coordinates
+        """
+        self.function_space = function_space
+        self.points = np.asarray(points, dtype=float)
+        self.columns, self.weights, self.found = tabulate_basis_weights(function_space, self.points)
+        self.comm = function_space.mesh().mpi_comm()
+        if is_parallel(self.comm):
+            local_to_global = function_space.dofmap().tabulate_local_to_global_dofs()
+            self.global_columns = np.asarray(local_to_global[self.columns], dtype=np.intc)
+            self.counts = global_sum(self.comm, self.found.astype(float))
+
+    def __len__(self):
+        return len(self.points)
+
+    def evaluate_vector(self, x: np.ndarray):
+        """
+        :param x: Solution vector of a serial run, or a (n_dofs, k) array of k vectors
+        :return: (N,) array of the values, or (N, k) for k vectors
+        """
+        gathered = x[self.columns]
+        if gathered.ndim == 2:
+            return np.einsum("ij,ij->i", self.weights, gathered)
+        return np.einsum("ij,ijk->ik", self.weights, gathered)
+
+    def __call__(self, function: Function):
+        """
+        :return: (N,) array of the values of the function at the points
+        """
+        assert function.function_space().dim() == self.function_space.dim(), "The function belongs to another space"
+        if not is_parallel(self.comm):
+            return self.evaluate_vector(function.vector().get_local())
+        # The cells of a partition also contain dofs owned by other processes, hence the values are gathered
+        gathered = function.vector().gather(self.global_columns.ravel()).reshape(self.global_columns.shape)
+        values = np.where(self.found, np.einsum("ij,ij->i", self.weights, gathered), 0.0)
+        return global_sum(self.comm, values) / self.counts
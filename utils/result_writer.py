@@ -0,0 +1,211 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import importlib.util
+import os
+from typing import Optional
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+import dolfin as dlfn
+from dolfin.function.function import Function
+from dolfin.function.functionspace import FunctionSpace
+
+from utils.parallel import is_root
+
+# XDMF names of the cell types and the element families of dolfin
+_XDMF_TOPOLOGY_TYPES = {"triangle": "Triangle", "tetrahedron": "Tetrahedron"}
+_XDMF_GEOMETRY_TYPES = {2: "XY", 3: "XYZ"}
+_XDMF_ELEMENT_FAMILIES = {"Lagrange": "CG", "Discontinuous Lagrange": "DG"}
+_XDMF_ATTRIBUTE_TYPES = {0: "Scalar", 1: "Vector", 2: "Tensor"}
+
+
+def get_data_file(filename):
+    """
+    The HDF5 file holding the mesh and the fields of an xdmf file
+    """
+    return os.path.splitext(filename)[0] + ".h5"
+
+
+def _get_field_path(name: str):
+    return "/fields/" + name
+
+
+def _has_h5py():
+    return importlib.util.find_spec("h5py") is not None
+
+
+def _compress_fields(data_file: str, float32: bool, compression: Optional[str]):
+    """
+    Rewrite the datasets of the fields of a file written by dolfin with a compression filter and the dof vectors
+    optionally in single precision. The file is copied into a new file, which replaces the original, such that the
+    space of the uncompressed datasets is released.
+    """
+    import h5py
+
+    def copy_attributes(source, target):
+        for key, value in source.attrs.items():
+            target.attrs[key] = value
+
+    tmp_file = data_file + ".{0}.tmp".format(os.getpid())
+    with h5py.File(data_file, "r") as source, h5py.File(tmp_file, "w") as target:
+        for key in source:
+            if key != "fields":
+                source.copy(source[key], target, key)
+        for name, field in source.get("fields", dict()).items():
+            group = target.create_group("fields/" + name)
+            copy_attributes(field, group)
+            for key, dataset in field.items():
+                dtype = np.float32 if float32 and key.startswith("vector") else dataset.dtype
+                copy = group.create_dataset(key, data=dataset[()].astype(dtype), compression=compression)
+                copy_attributes(dataset, copy)
+    os.replace(tmp_file, data_file)
+
+
+class ResultWriter:
+    def __init__(
+        self,
+        filename: str,
+        mesh: dlfn.Mesh,
+        float32: bool = False,
+        compression: Optional[str] = "gzip",
+        write_xdmf: bool = True,
+    ):
+        """
+        Writer of all fields of a run into a single result file pair:
+            - <filename>.h5: the mesh and the dof vectors of all fields written by a dolfin.HDF5File, the mesh is
+              written once and every field is appended as a dataset, read them back with 'read_function'
+            - <filename>.xdmf: the XDMF description of the HDF5 file for visualization, the fields are described as
+              finite element functions on the mesh such that no data is stored twice
+        :param filename: Name of the xdmf file
+        :param mesh: The mesh of all fields
+        :param float32: Store the dof vectors in single precision
+        :param compression: HDF5 compression filter of the fields ("gzip", "lzf" or None)
+        :param write_xdmf: Skip the visualization file, e.g. for parameter sweeps
+        Under mpirun both files are written collectively. The fields are stored with their cell dofs, hence they can be
+        read back on the mesh of the run with any number of processes.
+        dolfin writes the datasets uncompressed and in double precision. If h5py is installed, the datasets of the
+        fields are rewritten with the compression filter and in single precision when the file is closed, otherwise
+        the file is kept as written by dolfin.
+        """
+        assert filename.endswith(".xdmf")
+        directory = os.path.dirname(os.path.abspath(filename))
+        if is_root(mesh.mpi_comm()):
+            os.makedirs(directory, exist_ok=True)
+        dlfn.MPI.barrier(mesh.mpi_comm())
+        self.filename = filename
+        self.mesh = mesh
+        self.write_xdmf = write_xdmf
+        self.compression = compression
+        self.float32 = float32
+        # name, index, time, element and number of cell dofs of the stored fields
+        self.fields = []
+
+        self.data_file = dlfn.HDF5File(mesh.mpi_comm(), get_data_file(filename), "w")
+        self.data_file.write(mesh, "/mesh")
+
+    def write(self, function: Function, time: float = 0.0):
+        """
+        Append a field, fields are identified by their name (see Function.rename)
+        """
+        name = function.name()
+        index = sum(1 for field in self.fields if field["name"] == name)
+        self.data_file.write(function, _get_field_path(name), time)
+        self.fields.append(dict(name=name, index=index, time=time, element=function.ufl_element(),
+                                n_dofs=function.vector().size(),
+                                n_cell_dofs=function.function_space().element().space_dimension()))
+
+    def close(self):
+        if self.data_file is None:
+            return
+        self.data_file.close()
+        self.data_file = None
+        float32 = False
+        if (self.float32 or self.compression is not None) and _has_h5py():
+            float32 = self.float32
+            if is_root(self.mesh.mpi_comm()):
+                _compress_fields(get_data_file(self.filename), self.float32, self.compression)
+        if self.write_xdmf and is_root(self.mesh.mpi_comm()):
+            self._write_xdmf(float32)
+        dlfn.MPI.barrier(self.mesh.mpi_comm())
+
+    def _write_xdmf(self, float32: bool):
+        """
+        Write the XDMF description of the HDF5 file, one grid per time with all fields written at that time
+        :param float32: The dof vectors are stored in single precision
+        """
+        data_file = os.path.basename(get_data_file(self.filename))
+        tdim = self.mesh.topology().dim()
+        n_cells = self.mesh.num_entities_global(tdim)
+        n_vertices = self.mesh.num_entities_global(0)
+        gdim = self.mesh.geometry().dim()
+        cell_name = self.mesh.ufl_cell().cellname()
+
+        def add_data_item(parent, dimensions, number_type, path, precision=8):
+            item = ElementTree.SubElement(parent, "DataItem", Dimensions=" ".join(str(d) for d in dimensions),
+                                          NumberType=number_type, Precision=str(precision), Format="HDF")
+            item.text = data_file + ":" + path
+
+        xdmf = ElementTree.Element("Xdmf", Version="3.0")
+        collection = ElementTree.SubElement(ElementTree.SubElement(xdmf, "Domain"), "Grid", Name="TimeSeries",
+                                            GridType="Collection", CollectionType="Temporal")
+        for time in sorted(set(field["time"] for field in self.fields)):
+            grid = ElementTree.SubElement(collection, "Grid", Name="mesh", GridType="Uniform")
+            topology = ElementTree.SubElement(grid, "Topology", TopologyType=_XDMF_TOPOLOGY_TYPES[cell_name],
+                                              NumberOfElements=str(n_cells))
+            add_data_item(topology, (n_cells, tdim + 1), "UInt", "/mesh/topology")
+            geometry = ElementTree.SubElement(grid, "Geometry", GeometryType=_XDMF_GEOMETRY_TYPES[gdim])
+            add_data_item(geometry, (n_vertices, gdim), "Float", "/mesh/coordinates")
+            ElementTree.SubElement(grid, "Time", Value=repr(float(time)))
+            for field in self.fields:
+                if field["time"] != time:
+                    continue
+                element = field["element"]
+                attribute = ElementTree.SubElement(grid, "Attribute", ItemType="FiniteElementFunction",
+                                                   ElementFamily=_XDMF_ELEMENT_FAMILIES[element.family()],
+                                                   ElementDegree=str(element.degree()), ElementCell=cell_name,
+                                                   Name=field["name"], Center="Other",
+                                                   AttributeType=_XDMF_ATTRIBUTE_TYPES[len(element.value_shape())])
+                path = _get_field_path(field["name"])
+                add_data_item(attribute, (n_cells * field["n_cell_dofs"],), "UInt", path + "/cell_dofs")
+                add_data_item(attribute, (field["n_dofs"],), "Float", path + "/vector_{0}".format(field["index"]),
+                              4 if float32 else 8)
+        ElementTree.ElementTree(xdmf).write(self.filename, xml_declaration=True, encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_times(filename: str, name: str, comm=dlfn.MPI.comm_world):
+    """
+    :return: The times of all stored instances of a field
+    """
+    path = _get_field_path(name)
+    with dlfn.HDF5File(comm, get_data_file(filename), "r") as file:
+        n_instances = int(file.attributes(path)["count"])
+        return np.array([file.attributes(path + "/vector_{0}".format(i))["timestamp"] for i in range(n_instances)])
+
+
+def read_function(filename: str, name: str, function_space: FunctionSpace, index: int = -1):
+    """
+    Read a stored field back into a Function
+    :param filename: Name of the xdmf file given to the ResultWriter
+    :param name: Name of the field
+    :param function_space: Function space of the field on the mesh of the run
+    :param index: Index of the stored instance, the last one by default
+    :return: Function, dof vectors stored in single precision are converted to double precision by HDF5 on reading
+    """
+    path = _get_field_path(name)
+    function = dlfn.Function(function_space)
+    with dlfn.HDF5File(function_space.mesh().mpi_comm(), get_data_file(filename), "r") as file:
+        if not file.has_dataset(path):
+            raise ValueError("The field " + name + " is not stored in " + get_data_file(filename))
+        signature = file.attributes(path)["signature"]
+        if signature != function_space.element().signature():
+            raise ValueError("The field " + name + " belongs to the element " + signature)
+        n_instances = int(file.attributes(path)["count"])
+        file.read(function, path + "/vector_{0}".format(index % n_instances))
+    function.rename(name, name)
+    return function
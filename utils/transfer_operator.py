@@ -0,0 +1,132 @@
+# !/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import dolfin as dlfn
+from dolfin.function.function import Function
+from dolfin.function.functionspace import FunctionSpace
+
+from utils.parallel import is_parallel
+
+
+def tabulate_basis_weights(function_space: FunctionSpace, points: np.ndarray):
+    """
+    Locate the points in the mesh of a scalar function space and evaluate the basis functions of the containing cells.
+    The value of any Function of the space at point i is then sum_k weights[i, k] * vector[columns[i, k]].
+    Points which are not inside of any cell (e.g. due to round-off at curved boundaries) are assigned to the closest
+    cell, i.e. their values are extrapolated.
+    Under mpirun only the local cells are searched: a point belongs to every process whose partition contains it, a
+    point outside of all partitions to the process with the closest cell. The columns are local dof indices.
+    :param function_space: Scalar function space
+    :param points: (N, space_dim) array of coordinates
+    :return: Tuple of the (N, n_cell_dofs) arrays of the columns (dof indices) and the weights and the (N,) mask of
+        the points which belong to this process
+    """
+    assert function_space.ufl_element().value_size() == 1, "Only scalar function spaces are supported"
+    mesh = function_space.mesh()
+    element = function_space.element()
+    dofmap = function_space.dofmap()
+    tree = mesh.bounding_box_tree()
+    points = np.asarray(points, dtype=float).reshape(-1, mesh.geometry().dim())
+
+    n_cell_dofs = element.space_dimension()
+    columns = np.empty((len(points), n_cell_dofs), dtype=np.int64)
+    weights = np.zeros((len(points), n_cell_dofs))
+    cell_indices = np.empty(len(points), dtype=np.int64)
+    distances = np.zeros(len(points))
+    for i, x in enumerate(points):
+        point = dlfn.Point(*x)
+        cell_indices[i] = tree.compute_first_entity_collision(point)
+        if cell_indices[i] >= mesh.num_cells():
+            cell_indices[i], distances[i] = tree.compute_closest_entity(point)
+
+    found = np.ones(len(points), dtype=bool)
+    comm = mesh.mpi_comm()
+    if is_parallel(comm):
+        # The distance of a point inside of a local cell is zero, ties are resolved by the lowest rank
+        all_distances = np.array(comm.allgather(distances))
+        contained = all_distances == 0.0
+        closest = np.argmin(all_distances, axis=0) == comm.rank
+        found = contained[comm.rank] | (~contained.any(axis=0) & closest)
+
+    columns[~found] = 0
+    for i in np.flatnonzero(found):
+        cell = dlfn.Cell(mesh, cell_indices[i])
+        weights[i] = element.evaluate_basis_all(points[i], cell.get_vertex_coordinates(), cell.orientation())
+        columns[i] = dofmap.cell_dofs(cell_indices[i])
+    return columns, weights, found
+
+
+class TransferOperator:
+    def __init__(self, columns: np.ndarray, weights: np.ndarray, source_dim: int):
+        """
+        Sparse interpolation matrix from a source to a target function space on a possibly non-matching mesh. Row i
+        contains the basis function values of the source space at the coordinate of the i-th target dof, stored with a
+        fixed number of entries per row:
+            - columns: (n_target_dofs, n_cell_dofs) array of the source dof indices
+            - weights: (n_target_dofs, n_cell_dofs) array of the matrix entries
+            - source_dim: dimension of the source space
+        The cell search is done once in 'build', applying the operator is a single vectorized sparse product.
+        """
+        self.columns = columns
+        self.weights = weights
+        self.source_dim = source_dim
+
+    @property
+    def shape(self):
+        return self.columns.shape[0], self.source_dim
+
+    @classmethod
+    def build(cls, source_space: FunctionSpace, target_space: FunctionSpace):
+        """
+        Compute the interpolation matrix from source_space onto target_space. The operator acts on serial vectors, under
+        mpirun use dolfin.LagrangeInterpolator instead.
+        """
+        assert not is_parallel(source_space.mesh().mpi_comm()), "The operator is restricted to serial runs"
+        dof_coordinates = target_space.tabulate_dof_coordinates().reshape(-1, target_space.mesh().geometry().dim())
+        columns, weights, _ = tabulate_basis_weights(source_space, dof_coordinates)
+        return cls(columns, weights, source_space.dim())
+
+    @classmethod
+    def get(cls, source_space: FunctionSpace, target_space: FunctionSpace, filename: str):
+        """
+        Load the operator from filename if it exists and matches the spaces, otherwise build and store it
+        """
+        if os.path.exists(filename):
+            operator = cls.load(filename)
+            if operator.shape == (target_space.dim(), source_space.dim()):
+                return operator
+        operator = cls.build(source_space, target_space)
+        operator.save(filename)
+        return operator
+
+    def apply(self, x: np.ndarray):
+        """
+        :param x: Vector of the source space
+        :return: The interpolated vector of the target space
+        """
+        assert x.shape[0] == self.source_dim, "The vector does not belong to the source space"
+        return np.einsum("ij,ij->i", self.weights, x[self.columns])
+
+    def interpolate(self, source: Function, target: Function):
+        """
+        Interpolate the source Function into the target Function
+        """
+        target.vector().set_local(self.apply(source.vector().get_local()))
+        target.vector().apply("insert")
+        return target
+
+    def save(self, filename):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write under a temporary name such that concurrent runs never read an incomplete file
+        tmp_file = filename + ".{0}.tmp.npz".format(os.getpid())
+        np.savez(tmp_file, columns=self.columns, weights=self.weights, source_dim=self.source_dim)
+        os.replace(tmp_file, filename)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        return cls(data["columns"], data["weights"], int(data["source_dim"]))